@@ -1,7 +1,6 @@
 import sys
 import os
 import subprocess
-from shutil import copyfile
 import json
 from threading import Thread
 
@@ -19,7 +18,7 @@ from PyQt5.QtWidgets import QDialog
 from PyQt5.QtWidgets import QPushButton
 from PyQt5.QtWidgets import QLineEdit
 
-from modifyOpenvibeScen import *
+from pipelineSteps import generateScenarios
 import bcipipeline_settings as settings
 
 class Dialog(QDialog):
@@ -192,46 +191,18 @@ class Dialog(QDialog):
             myMsgBox("Please enter a valid path for the openViBE designer script")
             return
 
-        # self.parameterDict["ChannelNames"] = electrodes
-        self.parameterDict["ovDesignerPath"] = self.ovScript
-
         # Acquisition parameters, set in this GUI...
+        acqParamDict = {}
         for i in range(len(self.paramWidgets)):
             param = self.parameterTextList[i]
             if param in self.parameterDict:
-                self.parameterDict[param] = self.paramWidgets[i].text()
-
-        # Write default parameters for selected pipeline
-        extractParamDict = settings.pipelineExtractSettings[self.parameterDict["pipelineType"]].copy()
-        for idx, (key, val) in enumerate(extractParamDict.items()):
-            self.parameterDict[key] = str(val)
-
-        print(self.parameterDict)
-
-        # WRITE JSON PARAMETERS FILE
-        jsonfullpath = os.path.join(os.getcwd(), self.generatedFolder, self.jsonfilename)
-        with open(jsonfullpath, "w") as outfile:
-            json.dump(self.parameterDict, outfile, indent=4)
-
-        # GENERATE (list of files in settings.templateScenFilenames)
-        #   SC1 (ACQ/MONITOR)
-        #   SC2 (FEATURE EXT)
-        #   SC2 (TRAIN)
-        #   SC3 (ONLINE)
-        for filename in settings.templateScenFilenames:
-            srcFile = os.path.join(os.getcwd(), self.templateFolder, filename)
-            destFile = os.path.join(os.getcwd(), self.generatedFolder, filename)
-            print("---Copying file " + srcFile + " to " + destFile)
-            copyfile(srcFile, destFile)
-            if "xml" in destFile:
-                modifyScenarioGeneralSettings(destFile, self.parameterDict)
-
-        # SPECIAL CASES :
-        #   SC1 & SC3 : "GRAZ" BOX SETTINGS
-        modifyAcqScenario(os.path.join(os.getcwd(), self.generatedFolder, settings.templateScenFilenames[0]),
-                          self.parameterDict, False)
-        modifyAcqScenario(os.path.join(os.getcwd(), self.generatedFolder, settings.templateScenFilenames[3]),
-                          self.parameterDict, True)
+                acqParamDict[param] = self.paramWidgets[i].text()
+
+        # Write parameters in params.json (with default extraction parameters
+        # for selected pipeline), and generate the scenarios
+        self.parameterDict = generateScenarios(os.path.join(os.getcwd(), self.templateFolder),
+                                               os.path.join(os.getcwd(), self.generatedFolder),
+                                               self.parameterDict["pipelineType"], self.ovScript, acqParamDict)
 
         if launch:
             self.accept()
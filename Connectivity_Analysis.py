@@ -0,0 +1,180 @@
+import numpy as np
+from scipy import signal,fft
+
+from Spectral_Analysis import Sliding_windows
+
+# Trials processed at once by Cross_spectra and Mvar_connectivity_models: bounds
+# the memory of the (trials, freqs, channels, channels) complex spectra
+Cross_spectra_chunk_trials = 8
+
+# Memory (bytes) of the normal equations solved at once by Mvar_fit_batch
+Mvar_max_batch_bytes = 2**28
+
+
+def Segments_fft(Epoch_compute,n_per_seg,noverlap,nfft,window='hann'):
+    # FFT of every segment of every channel of every trial, taken once:
+    # (trials, channels, samples) -> (trials, channels, segments, nfft//2+1)
+    # Segments are detrended (mean) and windowed, as in Welch's method
+    win = signal.get_window(window,n_per_seg)
+    segments = Sliding_windows(Epoch_compute, n_per_seg, n_per_seg-noverlap)
+    segments = (segments - segments.mean(axis=-1,keepdims=True))*win
+    return fft.rfft(segments,n=nfft,axis=-1)
+
+def Cross_spectra(Epoch_compute,n_per_seg,noverlap,nfft,window='hann'):
+    # Cross-spectral density tensor of all channel pairs, averaged over
+    # segments (Welch): (trials, channels, samples) -> (trials, freqs, channels, channels)
+    # One batched einsum per chunk of trials (see Cross_spectra_chunk_trials)
+    a = Epoch_compute.shape
+    csd = np.empty([a[0],nfft//2+1,a[1],a[1]],dtype=complex)
+    for start in range(0,a[0],Cross_spectra_chunk_trials):
+        stop = min(start+Cross_spectra_chunk_trials,a[0])
+        X = Segments_fft(Epoch_compute[start:stop],n_per_seg,noverlap,nfft,window)
+        csd[start:stop] = np.einsum('tisf,tjsf->tfij',X,X.conj(),optimize=True)/X.shape[2]
+    return csd
+
+def Connectivity_calculation(Epoch_compute,f_max,n_per_seg,noverlap,nfft,metric='MSC',window='hann'):
+    # ----------
+    # Connectivity between all pairs of channels, for all trials and frequencies
+    # at once, from the cross-spectral densities S:
+    #   MSC (magnitude squared coherence): |Sij|^2 / (Sii Sjj)
+    #   IMCOH (imaginary part of coherency): Im(Sij) / sqrt(Sii Sjj)
+    # Epoch_compute: (trials, channels, samples), f_max: sampling frequency
+    # Returns (trials, channels, channels, freqs), and the frequencies
+    # ----------
+    csd = Cross_spectra(Epoch_compute,n_per_seg,noverlap,nfft,window)
+    auto = np.real(np.einsum('tfii->tfi',csd))
+    norm = np.sqrt(auto[...,:,None]*auto[...,None,:])
+    if metric == 'MSC':
+        conn = np.abs(csd)**2/norm**2
+    elif metric == 'IMCOH':
+        conn = np.imag(csd)/norm
+    else:
+        raise ValueError("Unknown connectivity metric: " + str(metric))
+    freqs = np.fft.rfftfreq(nfft,1/f_max)
+    return conn.transpose(0,2,3,1),freqs
+
+def Node_strength(conn):
+    # Connectivity of each channel with all the others (mean over the other
+    # channels): (trials, channels, channels, freqs) -> (trials, channels, freqs),
+    # the shape of power spectra, for the statistics functions
+    nb_channels = conn.shape[1]
+    diagonal = np.einsum('tiif->tif',conn)
+    return (conn.sum(axis=2)-diagonal)/(nb_channels-1)
+
+def Connectivity_pairs(conn,electrodes):
+    # All pairs of different channels (i < j) as "channels":
+    # (trials, channels, channels, freqs) -> (trials, pairs, freqs), and pair names
+    rows,cols = np.triu_indices(conn.shape[1],k=1)
+    names = [str(electrodes[i]+"-"+electrodes[j]) for i,j in zip(rows,cols)]
+    return conn[:,rows,cols,:],names
+
+
+def Autocovariance_batch(data,max_lag):
+    # Biased autocovariance matrices R(k) = E[x(t) x(t-k)^T], k = 0..max_lag,
+    # of every multichannel signal of a batch: (..., channels, samples) -> (..., max_lag+1, channels, channels)
+    n = data.shape[-1]
+    R = [np.einsum('...it,...jt->...ij',data[...,k:],data[...,:n-k],optimize=True)/n for k in range(max_lag+1)]
+    return np.stack(R,axis=-3)
+
+def Mvar_normal_equations(data,filter_order,method):
+    # Normal equations G X = Y of the MVAR models x(t) = sum_k A_k x(t-k) + e(t),
+    # with X the stacked [A_1^T; ...; A_p^T] (p*channels, channels)
+    #   'yule-walker': G block-Toeplitz, blocks R(k-m) (always positive definite)
+    #   'least-squares': G = Z Z^T, Z the lagged signals
+    a = data.shape
+    C = a[-2]
+    p = filter_order
+    if method == 'yule-walker':
+        R = Autocovariance_batch(data,p)
+        # R(-d) = R(d)^T: all lags -(p-1)..p-1, then blocks (m,k) = R(k-m)
+        R_all = np.concatenate([np.swapaxes(R[...,:0:-1,:,:],-1,-2),R],axis=-3)
+        lags = np.arange(p)[None,:]-np.arange(p)[:,None]+p
+        G = R_all[...,lags,:,:]
+        G = np.swapaxes(G,-3,-2).reshape(a[:-2]+(p*C,p*C))
+        Y = np.swapaxes(R[...,1:,:,:],-1,-2).reshape(a[:-2]+(p*C,C))
+        return G,Y,R
+    elif method == 'least-squares':
+        n = a[-1]
+        Z = np.stack([data[...,p-k:n-k] for k in range(1,p+1)],axis=-3).reshape(a[:-2]+(p*C,n-p))
+        G = Z@np.swapaxes(Z,-1,-2)
+        Y = Z@np.swapaxes(data[...,p:],-1,-2)
+        return G,Y,Z
+    raise ValueError("Unknown MVAR method: " + str(method))
+
+def Mvar_fit_batch(data,filter_order,method='yule-walker'):
+    # MVAR models of every multichannel signal of a batch, solving the stacked
+    # normal equations of all signals with one numpy.linalg.solve call
+    # (per chunk of Mvar_max_batch_bytes)
+    # data: (..., channels, samples), each channel is demeaned first
+    # Returns coefficients (..., filter_order, channels, channels), A[k-1][i,j] the
+    # influence of channel j at lag k on channel i, and noise covariances (..., channels, channels)
+    a = data.shape
+    C = a[-2]
+    p = filter_order
+    x = (data - data.mean(axis=-1,keepdims=True)).reshape((-1,)+a[-2:])
+    A = np.empty([x.shape[0],p,C,C])
+    Sigma = np.empty([x.shape[0],C,C])
+    chunk = max(1,Mvar_max_batch_bytes//(8*(p*C)**2))
+    for start in range(0,x.shape[0],chunk):
+        xc = x[start:start+chunk]
+        G,Y,extra = Mvar_normal_equations(xc,p,method)
+        X = np.linalg.solve(G,Y)
+        A[start:start+chunk] = np.swapaxes(X.reshape(-1,p,C,C),-1,-2)
+        if method == 'yule-walker':
+            # Sigma = R(0) - sum_k A_k R(k)^T
+            Sigma[start:start+chunk] = extra[:,0]-np.swapaxes(X,-1,-2)@Y
+        else:
+            residuals = xc[...,p:]-np.swapaxes(X,-1,-2)@extra
+            Sigma[start:start+chunk] = residuals@np.swapaxes(residuals,-1,-2)/residuals.shape[-1]
+    return A.reshape(a[:-2]+(p,C,C)),Sigma.reshape(a[:-2]+(C,C))
+
+def Mvar_windows_models(Epoch_compute,n_per_seg,n_shift,filter_order,method='yule-walker'):
+    # MVAR models of every sliding window of every epoch (see Mvar_fit_batch)
+    # Epoch_compute: (trials, channels, samples)
+    # Returns coefficients (trials, windows, filter_order, channels, channels),
+    # and noise covariances (trials, windows, channels, channels)
+    Windows = np.moveaxis(Sliding_windows(Epoch_compute, n_per_seg, n_shift),1,2)
+    return Mvar_fit_batch(Windows,filter_order,method)
+
+def Mvar_transfer(A,nfft):
+    # Frequency response A(f) = I - sum_k A_k exp(-2i pi f k / fs) of MVAR models,
+    # at the nfft//2+1 frequencies of an rfft: (..., p, C, C) -> (..., freqs, C, C)
+    C = A.shape[-1]
+    coeffs = np.concatenate([np.broadcast_to(np.eye(C),A.shape[:-3]+(1,C,C)),-A],axis=-3)
+    return fft.rfft(coeffs,n=nfft,axis=-3)
+
+def Mvar_metric(A,nfft,metric='PDC'):
+    # ----------
+    # Directed connectivity between all pairs of channels, from MVAR models:
+    #   PDC (partial directed coherence): |A_ij(f)| / sqrt(sum_m |A_mj(f)|^2)
+    #   DTF (directed transfer function): |H_ij(f)| / sqrt(sum_m |H_im(f)|^2), H = A(f)^-1
+    # [i,j] is the flow from channel j to channel i
+    # A: (..., p, C, C). Returns (..., C, C, freqs)
+    # ----------
+    Af = Mvar_transfer(A,nfft)
+    if metric == 'PDC':
+        conn = np.abs(Af)/np.sqrt(np.sum(np.abs(Af)**2,axis=-2,keepdims=True))
+    elif metric == 'DTF':
+        H = np.linalg.inv(Af)
+        conn = np.abs(H)/np.sqrt(np.sum(np.abs(H)**2,axis=-1,keepdims=True))
+    else:
+        raise ValueError("Unknown connectivity metric: " + str(metric))
+    return np.moveaxis(conn,-3,-1)
+
+def Mvar_connectivity_models(A,f_max,nfft,metric='PDC'):
+    # Connectivity of each trial, averaged over its windows, from the MVAR
+    # models of Mvar_windows_models (trials, windows, p, C, C)
+    # Returns (trials, channels, channels, freqs), and the frequencies
+    a = A.shape
+    conn = np.empty([a[0],a[-1],a[-1],nfft//2+1])
+    for start in range(0,a[0],Cross_spectra_chunk_trials):
+        conn[start:start+Cross_spectra_chunk_trials] = \
+            Mvar_metric(A[start:start+Cross_spectra_chunk_trials],nfft,metric).mean(axis=1)
+    return conn,np.fft.rfftfreq(nfft,1/f_max)
+
+def Mvar_connectivity(Epoch_compute,f_max,n_per_seg,noverlap,nfft,filter_order,metric='PDC',method='yule-walker'):
+    # PDC or DTF between all pairs of channels, for all trials (MVAR models of
+    # sliding windows of n_per_seg samples, overlapping by noverlap samples)
+    # Returns (trials, channels, channels, freqs), and the frequencies
+    A,Sigma = Mvar_windows_models(Epoch_compute,n_per_seg,n_per_seg-noverlap,filter_order,method)
+    return Mvar_connectivity_models(A,f_max,nfft,metric)
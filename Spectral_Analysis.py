@@ -1,145 +1,563 @@
+import os
+import functools
 import numpy as np
-from scipy import signal,stats,fft
-from spectrum import arburg,arma2psd,pburg
-import statsmodels.regression.linear_model as transform
+from scipy import signal,fft
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# Above that many samples (all windows together), Burg_AR_batch fits the
+# windows of one trial at a time, to bound the memory of its working arrays
+Burg_max_batch_size = 2**22
+
+
+def Sliding_windows(Epoch_compute,n_per_seg,n_shift,nb_windows=None):
+    # Segmentation of the last axis of Epoch_compute in windows of n_per_seg
+    # samples, starting every n_shift samples: (..., windows, n_per_seg)
+    # This is a strided view of Epoch_compute (no copy, overlapping windows
+    # share memory): it must not be written into
+    windows = np.lib.stride_tricks.sliding_window_view(Epoch_compute,n_per_seg,axis=-1)[...,::n_shift,:]
+    if nb_windows is not None:
+        windows = windows[...,:nb_windows,:]
+    return windows
+
+
+def Burg_AR_batch(data,filter_order,all_orders=False):
+    # Burg AR estimation of every signal of a batch at once: same results as
+    # statsmodels' burg() called on each signal (same recursion, vectorized
+    # over all leading dimensions)
+    # data: (..., samples), each signal is demeaned first
+    # Returns AR coefficients (..., filter_order), and residual variances (...)
+    # all_orders: return the residual variances of all orders from 0 to
+    # filter_order (..., filter_order+1), given by the same recursion
+    x = np.asarray(data,dtype=float)
+    if x.ndim > 2 and x.size > Burg_max_batch_size:
+        # Views of overlapping windows (see Sliding_windows) would be
+        # copied all at once otherwise
+        AR = np.empty(x.shape[:-1]+(int(filter_order),))
+        sigma2 = np.empty(x.shape[:-1]+((int(filter_order)+1,) if all_orders else ()))
+        for i in range(x.shape[0]):
+            AR[i], sigma2[i] = Burg_AR_batch(x[i],filter_order,all_orders)
+        return AR,sigma2
+    batch_shape = x.shape[:-1]
+    N = x.shape[-1]
+    p = int(filter_order)
+    if p < 1 or p > N-1:
+        raise ValueError("filter_order must be between 1 and the number of samples - 1")
+    x = x.reshape(-1,N)
+    x = x - x.mean(axis=-1,keepdims=True)
+
+    # Partial autocorrelations (reflection coefficients)
+    d = np.zeros([x.shape[0],p+1])
+    pacf = np.zeros([x.shape[0],p+1])
+    d[:,0] = 2*np.einsum('ij,ij->i',x,x)
+    u = x[:,::-1].copy()
+    v = x[:,::-1].copy()
+    d[:,1] = np.einsum('ij,ij->i',u[:,:-1],u[:,:-1]) + np.einsum('ij,ij->i',v[:,1:],v[:,1:])
+    pacf[:,1] = 2/d[:,1]*np.einsum('ij,ij->i',v[:,1:],u[:,:-1])
+    for i in range(1,p):
+        k = pacf[:,i,None]
+        last_u = u[:,:-1].copy()
+        v[:,1:] -= k*last_u
+        u[:,1:] = last_u - k*(v[:,1:] + k*last_u)
+        d[:,i+1] = (1-pacf[:,i]**2)*d[:,i] - v[:,i]**2 - u[:,-1]**2
+        pacf[:,i+1] = 2/d[:,i+1]*np.einsum('ij,ij->i',v[:,i+1:],u[:,i:-1])
+    sigma2 = (1-pacf**2)*d/(2.0*(N-np.arange(p+1)))
+
+    # AR coefficients from the partial autocorrelations (Levinson-Durbin)
+    AR = pacf[:,1:].copy()
+    for i in range(1,p):
+        prev = AR[:,:i].copy()
+        AR[:,:i] = prev - AR[:,i,None]*prev[:,::-1]
+
+    if all_orders:
+        return AR.reshape(batch_shape+(p,)),sigma2.reshape(batch_shape+(p+1,))
+    return AR.reshape(batch_shape+(p,)),sigma2[:,p].reshape(batch_shape)
+
+
+def AR_psd_batch(AR,N_FFT,rho=1.,out=None):
+    # One-sided PSD (bins 0 to N_FFT/2) of a batch of AR models, the same as
+    # arma2psd(-AR, rho=rho, NFFT=N_FFT) for each model, with a single rfft
+    # AR: (..., order), rho: scalar or (...)
+    # out: optional preallocated (..., N_FFT//2+1) output
+    AR = np.asarray(AR)
+    batch_shape = AR.shape[:-1]
+    if out is None:
+        out = np.empty(batch_shape+(N_FFT//2+1,))
+    den = np.empty(batch_shape+(AR.shape[-1]+1,))
+    den[...,0] = 1.
+    np.negative(AR,out=den[...,1:])
+    # (scipy's rfft: numpy's "out" argument needs numpy >= 2.0)
+    spectrum = fft.rfft(den,n=N_FFT,axis=-1)
+    np.abs(spectrum,out=out)
+    np.square(out,out=out)
+    np.divide(np.expand_dims(rho,-1),out,out=out)
+    return out
+
+
+def AR_psd_at_frequencies(AR,freqs,f_max,rho=1.):
+    # PSD of a batch of AR models at a few frequencies only (Hz), by evaluating
+    # the AR polynomial directly at those points: same values as AR_psd_batch
+    # at the bins of these frequencies, without computing whole spectra.
+    # f_max is the sampling frequency
+    # AR: (..., order), rho: scalar or (...). Returns (..., len(freqs))
+    AR = np.asarray(AR)
+    freqs = np.asarray(freqs,dtype=float)
+    phases = np.exp(-2j*np.pi*np.outer(freqs/f_max,np.arange(1,AR.shape[-1]+1)))
+    den = 1.-AR@phases.T
+    return np.expand_dims(rho,-1)/(den.real**2+den.imag**2)
+
+
+def Centerdc_bins(N_FFT):
+    # One-sided bin of each value of a PSD returned by arma2psd(sides='centerdc')
+    twosided = np.concatenate((np.roll(np.arange(N_FFT//2,N_FFT),1),np.arange(N_FFT//2)))
+    twosided[0] = N_FFT-1
+    return np.minimum(twosided,N_FFT-twosided)
+
+
+def Smooth_spectrum(psd,step,out_length):
+    # Smoothing and decimation of spectra along their last axis (any batch
+    # shape): one value every "step" bins (eg. every 1 Hz with a 0.2 Hz
+    # resolution), averaging the 5 bins around it. The first and last values
+    # average the 3 bins at each edge, and a centre closer than 2 bins to an
+    # edge (eg. bins 1 and n-2 when step == 1) averages the bins available
+    # around it.
+    # For step == 5 this is the loop the PSD functions used before; for other
+    # steps that loop wrote its values to the wrong output bins.
+    # psd: (..., bins), returns (..., out_length)
+    n = psd.shape[-1]
+    PSD_final = np.zeros(psd.shape[:-1]+(out_length,))
+    PSD_final[...,0] = psd[...,0:3].mean(axis=-1)
+    PSD_final[...,out_length-1] = psd[...,n-3:n].mean(axis=-1)
+    centers = np.arange(step,n-1,step)
+    centers = centers[centers//step < out_length]
+    inside = (centers >= 2) & (centers <= n-3)
+    for c in centers[~inside]:
+        PSD_final[...,c//step] = psd[...,max(0,c-2):min(n,c+3)].mean(axis=-1)
+    centers = centers[inside]
+    PSD_final[...,centers//step] = Sliding_windows(psd,5,1)[...,centers-2,:].mean(axis=-1)
+    return PSD_final
+
+
+def Parallel_epochs(function,Epoch_compute,n_jobs,args):
+    # ----------
+    # Run function(Epoch_compute, *args) on n_jobs worker processes, each
+    # one on a part of the channels (or of the trials, if there are fewer
+    # channels than jobs) of a (trials, channels, samples) epoch tensor.
+    # The epochs and the outputs go through shared memory (no pickling):
+    # workers write their part directly into the preallocated outputs.
+    # Outputs with a (trials, channels, ...) shape are gathered, others
+    # (frequencies, times...) are the same for all parts, and taken as is.
+    # ----------
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+    a = Epoch_compute.shape
+    split_axis = 1 if a[1] >= n_jobs else 0
+    n_jobs = min(n_jobs,a[split_axis])
+
+    # Shapes of the outputs, from the result on a single trial and channel
+    probe = function(Epoch_compute[:1,:1],*args)
+    single = not isinstance(probe,tuple)
+    if single:
+        probe = (probe,)
+    gathered = [np.ndim(out) >= 2 and np.shape(out)[:2] == (1,1) for out in probe]
+
+    shared = []
+    try:
+        shm = shared_memory.SharedMemory(create=True,size=max(Epoch_compute.nbytes,1))
+        shared.append(shm)
+        np.ndarray(a,dtype=float,buffer=shm.buf)[:] = Epoch_compute
+        in_spec = (shm.name,a)
+
+        out_specs = []
+        outputs = []
+        for idx,out in enumerate(probe):
+            if not gathered[idx]:
+                out_specs.append(None)
+                outputs.append(out)
+                continue
+            out_shape = a[:2]+np.shape(out)[2:]
+            shm = shared_memory.SharedMemory(create=True,size=max(int(np.prod(out_shape))*8,1))
+            shared.append(shm)
+            out_specs.append((shm.name,out_shape))
+            outputs.append(np.ndarray(out_shape,dtype=float,buffer=shm.buf))
+
+        parts = np.array_split(np.arange(a[split_axis]),n_jobs)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(Epochs_worker,function,in_spec,out_specs,split_axis,part[0],part[-1]+1,args)
+                       for part in parts]
+            for future in futures:
+                future.result()
+
+        outputs = [np.array(out) for out in outputs]
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+    if single:
+        return outputs[0]
+    return tuple(outputs)
+
+
+def Epochs_worker(function,in_spec,out_specs,split_axis,start,stop,args):
+    # Part of Parallel_epochs run in a worker process: compute the outputs
+    # of epochs [start:stop] along split_axis, in the shared output arrays
+    shms = []
+    try:
+        shm = shared_memory.SharedMemory(name=in_spec[0])
+        shms.append(shm)
+        part = (slice(None),)*split_axis+(slice(start,stop),)
+        Epoch_part = np.ndarray(in_spec[1],dtype=float,buffer=shm.buf)[part]
+
+        results = function(Epoch_part,*args)
+        if not isinstance(results,tuple):
+            results = (results,)
+        for out_spec,result in zip(out_specs,results):
+            if out_spec is None:
+                continue
+            shm = shared_memory.SharedMemory(name=out_spec[0])
+            shms.append(shm)
+            np.ndarray(out_spec[1],dtype=float,buffer=shm.buf)[part] = result
+        del Epoch_part,results
+    finally:
+        for shm in shms:
+            shm.close()
+    return
 
 
 def Power_burg_calculation_optimization(Epoch_compute,noverlap,N_FFT,f_max, n_per_seg,smoothing,freqs_left,filter_order):
-    #burg = pburg(Epoch_compute,15,NFFT = nfft_test)
-    data = Epoch_compute[:,:]
-    xs, ys = [], []
-    a = data.shape
+    # Same as Power_burg_calculation, for epochs of a single channel (trials, samples)
+    # freqs_left: unused, kept for the callers passing filter_order by position
+    a = Epoch_compute.shape
     M = a[1]
     #print(M)
     L = n_per_seg
     #print(L)
-    noverlap = noverlap
     LminusOverlap = L-noverlap
     #print(LminusOverlap)
     k = round((M-noverlap)/(L-noverlap))
     #print(k)
-    xStart = np.array(range(0,k*LminusOverlap,LminusOverlap))
-    #print(xStart)
-    xEnd = []
-    for i in xStart:
-        xEnd.append(i+L-1)
-    xEnd = np.array(xEnd)
-    #print(xEnd)
     fres =f_max/N_FFT
-    power = []
-    Block_spectrum= []
     
     tab = np.array(range(k-1))
     trialspectrum = np.zeros([a[0],N_FFT])
-    PSD_final = np.zeros([a[0],round(f_max/2)])
     Time_freq = np.zeros([a[0],len(tab),round(f_max/(2*fres))])
     time = np.linspace(0,round(M/f_max),k-1)
-    for i in range(a[0]):
-        Block_spectrum = []
-        for numBlock in tab:
-            aux_condition1data = Epoch_compute[i,xStart[numBlock]:xEnd[numBlock]]
-
-            aux_condition1data = signal.detrend(aux_condition1data,type='constant')
-
-            AR, sigma2 = transform.burg(aux_condition1data, filter_order)
-            PSD = arma2psd(-AR, NFFT = N_FFT,sides='centerdc')
-            # plt.plot(PSD)
-            # plt.show()
-            Block_spectrum.append(PSD)
-            Time_freq[i,numBlock]=PSD[round(f_max/(2*fres)):round(f_max/fres)]
-            block = np.mean(Block_spectrum,axis=0)
-            trialspectrum[i] = np.array(block)
+    # All blocks of all trials: (trials, blocks, window), detrended and
+    # fitted at once
+    Blocks = Sliding_windows(Epoch_compute, L, LminusOverlap, len(tab))
+    AR_all, sigma2_all = Burg_AR_batch(Blocks, filter_order)
+    # PSD of all blocks, then averaged over blocks
+    Block_spectrum = AR_psd_batch(AR_all, N_FFT)
+    bins = Centerdc_bins(N_FFT)
+    np.take(Block_spectrum, bins[round(f_max/(2*fres)):round(f_max/fres)], axis=-1, out=Time_freq)
+    np.take(np.mean(Block_spectrum,axis=1), bins, axis=-1, out=trialspectrum)
 
     if smoothing == True:
-        for k in range(a[0]):
-             for l in range(a[1]):
-                 PSD_final[k,l,0] = (trialspectrum[k,l,0] + trialspectrum[k,l,1] +trialspectrum[k,l,2])/3
-                 PSD_final[k,l,round(f_max/2)-1] = (trialspectrum[k,l,freqs_left.shape[0]-3] + trialspectrum[k,l,freqs_left.shape[0]-2] +trialspectrum[k,l,freqs_left.shape[0]-1])/3
-                 for i in range(5,freqs_left.shape[0]-2,round(1/fres)):
-                     PSD_final[k,l,round(i/5)] = (trialspectrum[k,l,i-2] +trialspectrum[k,l,i-1] +trialspectrum[k,l,i] + trialspectrum[k,l,i+1] +trialspectrum[k,l,i+2])/(5)
-        return PSD_final
+        return Smooth_spectrum(trialspectrum[...,round(f_max/(2*fres)):round(f_max/fres)],round(1/fres),round(f_max/2))
 
     return trialspectrum[:,round(f_max/(2*fres)):round(f_max/fres)],Time_freq,time
 
 
-def Power_burg_calculation(Epoch_compute,noverlap,N_FFT,f_max, n_per_seg,smoothing,freqs_left,filter_order):
-    #burg = pburg(Epoch_compute,15,NFFT = nfft_test)
-    data = Epoch_compute[:,:,:]
-    xs, ys = [], []
-    a = data.shape
+def Power_burg_calculation(Epoch_compute,noverlap,N_FFT,f_max, n_per_seg,smoothing,freqs_left,filter_order,n_jobs=1):
+    # freqs_left: unused, kept for the callers passing filter_order by position
+    # n_jobs: number of worker processes (-1: number of cores), see Parallel_epochs
+    if n_jobs != 1:
+        return Parallel_epochs(Power_burg_calculation,Epoch_compute,n_jobs,
+                               (noverlap,N_FFT,f_max,n_per_seg,smoothing,freqs_left,filter_order))
+    a = Epoch_compute.shape
     M = a[2]
     #print(M)
     L = n_per_seg
     #print(L)
-    noverlap = noverlap
     LminusOverlap = L-noverlap
     #print(LminusOverlap)
     k = round((M-noverlap)/(LminusOverlap))
     #print(k)
-    xStart = np.array(range(0,k*LminusOverlap,LminusOverlap))
-    #print(xStart)
-    xEnd = []
-    for i in xStart:
-        xEnd.append(i+L-1)
-    xEnd = np.array(xEnd)
-    #print(xEnd)
     
     fres =f_max/N_FFT
-    power = []
-    Block_spectrum= []
     
     tab = np.array(range(k-1))
     trialspectrum = np.zeros([a[0],a[1],N_FFT])
-    PSD_final = np.zeros([a[0],a[1],round(f_max/2)])
     Time_freq = np.zeros([a[0],a[1],len(tab),round(f_max/(2*fres))])
     time = np.linspace(0,round(M/f_max),k-1)
-    for i in range(a[0]):
-        for j in range(a[1]):
-            Block_spectrum = []
-            for numBlock in tab:
-                aux_condition1data = Epoch_compute[i,j,xStart[numBlock]:xEnd[numBlock]]
+    # All blocks of all trials and channels: (trials, channels, blocks, window),
+    # detrended and fitted at once
+    Blocks = Sliding_windows(Epoch_compute, L, LminusOverlap, len(tab))
+    AR_all, sigma2_all = Burg_AR_batch(Blocks, filter_order)
+    # PSD of all blocks, then averaged over blocks
+    Block_spectrum = AR_psd_batch(AR_all, N_FFT)
+    bins = Centerdc_bins(N_FFT)
+    np.take(Block_spectrum, bins[round(f_max/(2*fres)):round(f_max/fres)], axis=-1, out=Time_freq)
+    np.take(np.mean(Block_spectrum,axis=2), bins, axis=-1, out=trialspectrum)
+
+    if smoothing == True:
+        return Smooth_spectrum(trialspectrum[...,round(f_max/(2*fres)):round(f_max/fres)],round(1/fres),round(f_max/2))
 
-                aux_condition1data = signal.detrend(aux_condition1data,type='constant')
+    return trialspectrum[:,:,round(f_max/(2*fres)):round(f_max/fres)],Time_freq,time
 
-                AR, sigma2 = transform.burg(aux_condition1data, filter_order)
-                PSD = arma2psd(-AR, NFFT = N_FFT,sides='centerdc')
-                # plt.plot(PSD)
-                # plt.show()
-                Block_spectrum.append(PSD)
+@functools.lru_cache(maxsize=32)
+def Filter_bank_sos(fs,bands,filter_order):
+    # Butterworth band-pass filters (second-order sections) of a bank of
+    # frequency bands ((low, high), ...) in Hz. Cached: the filters are only
+    # designed once per sampling frequency and bands. Returned arrays are
+    # shared by all callers, and must not be modified (they are not flagged
+    # read-only: sosfilt needs writable coefficients).
+    return tuple(signal.butter(filter_order,[low,high],btype='bandpass',fs=fs,output='sos')
+                 for low,high in bands)
 
-                Time_freq[i,j,numBlock]=PSD[round(f_max/(2*fres)):round(f_max/fres)]
-            block = np.mean(Block_spectrum,axis=0)
-            trialspectrum[i,j] = np.array(block)
+def Power_filter_bank(Epoch_compute,f_max,bands,n_per_seg,noverlap,filter_order=4,n_jobs=1):
+    # Log band power of a bank of frequency bands, a fast alternative to the
+    # AR spectra of Power_burg_calculation when only a few bands are needed.
+    # Each band is filtered (zero-phase, sosfiltfilt) for all trials and channels
+    # at once along the time axis; its power is the mean squared filtered signal
+    # over the whole epoch, and over each sliding window of n_per_seg samples
+    # overlapping by noverlap samples.
+    # Epoch_compute: (trials, channels, samples), f_max: sampling frequency
+    # bands: ((low, high), ...) in Hz
+    # Returns log powers (trials, channels, bands), time-band log powers
+    # (trials, channels, windows, bands), and the start time of each window
+    # n_jobs: number of worker processes (-1: number of cores), see Parallel_epochs
+    if n_jobs != 1:
+        return Parallel_epochs(Power_filter_bank,Epoch_compute,n_jobs,
+                               (f_max,bands,n_per_seg,noverlap,filter_order))
+    bands = tuple((float(low),float(high)) for low,high in bands)
+    a = Epoch_compute.shape
+    n_shift = n_per_seg-noverlap
+    nb_windows = int((a[2]-n_per_seg)/n_shift)+1 if a[2] >= n_per_seg else 0
 
-    if smoothing == True:
-        for k in range(a[0]):
-             for l in range(a[1]):
-                 PSD_final[k,l,0] = (trialspectrum[k,l,0] + trialspectrum[k,l,1] +trialspectrum[k,l,2])/3
-                 PSD_final[k,l,round(f_max/2)-1] = (trialspectrum[k,l,freqs_left.shape[0]-3] + trialspectrum[k,l,freqs_left.shape[0]-2] +trialspectrum[k,l,freqs_left.shape[0]-1])/3
-                 for i in range(5,freqs_left.shape[0]-2,round(1/fres)):
-                     PSD_final[k,l,round(i/5)] = (trialspectrum[k,l,i-2] +trialspectrum[k,l,i-1] +trialspectrum[k,l,i] + trialspectrum[k,l,i+1] +trialspectrum[k,l,i+2])/(5)
-        return PSD_final
+    band_power = np.zeros([a[0],a[1],len(bands)])
+    Time_band = np.zeros([a[0],a[1],nb_windows,len(bands)])
+    for b,sos in enumerate(Filter_bank_sos(float(f_max),bands,filter_order)):
+        filtered = signal.sosfiltfilt(sos,Epoch_compute,axis=-1)
+        filtered **= 2
+        band_power[...,b] = filtered.mean(axis=-1)
+        Time_band[...,b] = Sliding_windows(filtered,n_per_seg,n_shift,nb_windows).mean(axis=-1)
+    time = np.arange(nb_windows)*n_shift/f_max
+    return np.log(band_power),np.log(Time_band),time
 
-    return trialspectrum[:,:,round(f_max/(2*fres)):round(f_max/fres)],Time_freq,time
+def Welch_psd(Epoch_compute,fs,window,nper_seg,noverlap,nfft,average):
+    # One-sided Welch PSD ('density' scaling, constant detrend) of the last
+    # axis, like signal.welch, but segmenting with Sliding_windows and
+    # accumulating one segment at a time, so that the segments are never
+    # copied all at once. Other averages than 'mean' use signal.welch.
+    M = Epoch_compute.shape[-1]
+    if noverlap is None:
+        noverlap = nper_seg//2
+    if nfft is None:
+        nfft = nper_seg
+    if average != 'mean' or nper_seg is None or nper_seg > M:
+        return signal.welch(Epoch_compute, fs=fs, window=window, nperseg=nper_seg, noverlap=noverlap, nfft=nfft, detrend='constant', return_onesided=True, scaling='density', axis=- 1, average=average)
+
+    if isinstance(window,(str,tuple)):
+        win = signal.get_window(window,nper_seg)
+    else:
+        win = np.asarray(window)
+    segments = Sliding_windows(Epoch_compute, nper_seg, nper_seg-noverlap)
+    nb_segments = segments.shape[-2]
+
+    psd = np.zeros(Epoch_compute.shape[:-1]+(nfft//2+1,))
+    for numSeg in range(nb_segments):
+        seg = segments[...,numSeg,:]
+        seg = (seg - seg.mean(axis=-1,keepdims=True))*win
+        psd += np.abs(fft.rfft(seg,n=nfft,axis=-1))**2
+    psd /= fs*(win*win).sum()*nb_segments
+    if nfft % 2:
+        psd[...,1:] *= 2
+    else:
+        psd[...,1:-1] *= 2
+
+    return np.fft.rfftfreq(nfft,1/fs),psd
 
-def Power_calculation_welch_method(Epoch_compute,f_min,f_max,t_min,t_max,nfft,noverlap,nper_seg,pick,proje,averag,windowing, smoothing):
+def Power_calculation_welch_method(Epoch_compute,f_min,f_max,t_min,t_max,nfft,noverlap,nper_seg,pick,proje,averag,windowing, smoothing,n_jobs=1):
+    # n_jobs: number of worker processes (-1: number of cores), see Parallel_epochs
+    if n_jobs != 1:
+        return Parallel_epochs(Power_calculation_welch_method,Epoch_compute,n_jobs,
+                               (f_min,f_max,t_min,t_max,nfft,noverlap,nper_seg,pick,proje,averag,windowing,smoothing))
     #filtered = mne.filter.filter_data(Epoch_compute, 140, 7, 35)
 
     fres =f_max/nfft
     #psd_left,freqs_left = mne.time_frequency.psd_welch(Epoch_compute, fmin=f_min, fmax=f_max, tmin=t_min, tmax=t_max, n_fft=nfft, n_overlap=noverlap, n_per_seg=nper_seg, picks=pick, proj=proje, n_jobs=1, reject_by_annotation=True, average=averag, window=windowing, verbose=None)
-    freqs_left,psd_left = signal.welch(Epoch_compute, fs=f_max, window=windowing, nperseg=nper_seg, noverlap=noverlap, nfft=nfft, detrend='constant', return_onesided=True, scaling='density', axis=- 1, average=averag)
+    freqs_left,psd_left = Welch_psd(Epoch_compute, f_max, windowing, nper_seg, noverlap, nfft, averag)
     b = psd_left.shape
     #print(freqs_left.shape[0])
-    PSD_final = np.zeros([b[0],b[1],round(f_max/2)])
     if smoothing == True:
-        for k in range(b[0]):
-             for l in range(b[1]):
-                 PSD_final[k,l,0] = (psd_left[k,l,0] + psd_left[k,l,1] +psd_left[k,l,2])/3
-                 PSD_final[k,l,round(f_max/2)-1] = (psd_left[k,l,freqs_left.shape[0]-3] + psd_left[k,l,freqs_left.shape[0]-2] +psd_left[k,l,freqs_left.shape[0]-1])/3
-                 for i in range(5,freqs_left.shape[0]-2,round(1/fres)):
-                     PSD_final[k,l,round(i/5)] = (psd_left[k,l,i-2] +psd_left[k,l,i-1] +psd_left[k,l,i] + psd_left[k,l,i+1] +psd_left[k,l,i+2])/(5)
+        PSD_final = Smooth_spectrum(psd_left[...,:freqs_left.shape[0]],round(1/fres),round(f_max/2))
         return PSD_final,freqs_left
 
                 #avgdata2(i, :, countcond2) = mean(trialspectrum(ind-evaluationsPerBin/2:ind+evaluationsPerBin/2-1,:));
     #print(PSD_final.shape)
     return psd_left,freqs_left
+
+@functools.lru_cache(maxsize=32)
+def Dpss_tapers(n_per_seg,NW,K):
+    # DPSS tapers (K, n_per_seg), normalized to unit energy, and their
+    # concentration ratios (K). Cached: the eigenproblem is only solved once
+    # per epoch length. Returned arrays are read-only (shared by all callers).
+    tapers,ratios = signal.windows.dpss(n_per_seg,NW,Kmax=K,norm=2,return_ratios=True)
+    tapers.setflags(write=False)
+    ratios.setflags(write=False)
+    return tapers,ratios
+
+def Power_calculation_multitaper(Epoch_compute,f_max,nfft,NW,K,smoothing,n_jobs=1):
+    # Multitaper PSD ('density' scaling, one-sided) of whole epochs:
+    # (trials, channels, samples) -> (trials, channels, nfft//2+1), like
+    # Power_calculation_welch_method. f_max is the sampling frequency.
+    # All tapers of all trials and channels are transformed with a single FFT,
+    # and averaged with their concentration ratios as weights.
+    # NW: time-bandwidth product, K: number of tapers (None: 2*NW-1)
+    # n_jobs: number of worker processes (-1: number of cores), see Parallel_epochs
+    if n_jobs != 1:
+        return Parallel_epochs(Power_calculation_multitaper,Epoch_compute,n_jobs,(f_max,nfft,NW,K,smoothing))
+    M = Epoch_compute.shape[-1]
+    if nfft is None:
+        nfft = M
+    if K is None:
+        K = max(int(2*NW)-1,1)
+    fres = f_max/nfft
+    tapers,ratios = Dpss_tapers(M,float(NW),int(K))
+
+    data = Epoch_compute - Epoch_compute.mean(axis=-1,keepdims=True)
+    spectra = fft.rfft(data[...,None,:]*tapers,n=nfft,axis=-1)
+    psd = np.einsum('...kf,k->...f',np.abs(spectra)**2,ratios/ratios.sum())
+    psd /= f_max
+    if nfft % 2:
+        psd[...,1:] *= 2
+    else:
+        psd[...,1:-1] *= 2
+    freqs = np.fft.rfftfreq(nfft,1/f_max)
+
+    if smoothing == True:
+        return Smooth_spectrum(psd,round(1/fres),round(f_max/2)),freqs
+
+    return psd,freqs
+
+def Burg_windows_models(Epoch_compute,n_per_seg,n_shift,filter_order):
+    # AR Burg models of every sliding window of every epoch (see Power_burg_windows)
+    # Epoch_compute: (trials, channels, samples)
+    # Returns AR coefficients (trials, channels, windows, filter_order),
+    # and noise variances (trials, channels, windows)
+    a = Epoch_compute.shape
+    M = a[2]
+    L = n_per_seg
+    nbWindows = int((M-L)/n_shift)+1 if M >= L else 0
+    if nbWindows == 0:
+        return np.zeros([a[0],a[1],0,filter_order]),np.zeros([a[0],a[1],0])
+    Windows = Sliding_windows(Epoch_compute, L, n_shift)
+    return Burg_AR_batch(Windows, filter_order)
+
+def Burg_selected_features(Epoch_compute,feature_channels,feature_freqs,f_max,n_per_seg,n_shift,filter_order):
+    # Features "channel / frequencies" of every sliding window of every epoch:
+    # AR Burg PSD averaged over the frequencies of each feature, as the
+    # "Frequency Band Selector" + "Spectrum Average" boxes of sc2-train do.
+    # Only the channels of the features are fitted, and their PSD is only
+    # evaluated at the frequencies of the features (see AR_psd_at_frequencies)
+    # Epoch_compute: (trials, channels, samples)
+    # feature_channels: channel index of each feature
+    # feature_freqs: list of frequencies (Hz) of each feature
+    # Returns (trials, windows, features)
+    channels = sorted(set(feature_channels))
+    AR_all, sigma2_all = Burg_windows_models(Epoch_compute[:,channels], n_per_seg, n_shift, filter_order)
+    all_freqs = np.unique(np.concatenate([np.asarray(freqs,dtype=float) for freqs in feature_freqs]))
+    psd = AR_psd_at_frequencies(AR_all, all_freqs, f_max, sigma2_all)
+
+    features = np.empty([psd.shape[0],psd.shape[2],len(feature_channels)])
+    for idx in range(len(feature_channels)):
+        freq_idx = np.searchsorted(all_freqs,np.asarray(feature_freqs[idx],dtype=float))
+        features[:,:,idx] = psd[:,channels.index(feature_channels[idx])][...,freq_idx].mean(axis=-1)
+    return features
+
+def Levinson_batch(r,filter_order):
+    # Levinson-Durbin recursion on a batch of autocovariances r (..., order+1)
+    # Returns AR coefficients (..., filter_order) (same convention as
+    # Burg_AR_batch) and the residual variances (...)
+    AR = np.zeros(r.shape[:-1]+(filter_order,))
+    err = r[...,0].copy()
+    for k in range(filter_order):
+        acc = r[...,k+1] - np.einsum('...j,...j->...',AR[...,:k],r[...,k:0:-1])
+        refl = acc/err
+        prev = AR[...,:k].copy()
+        AR[...,k] = refl
+        AR[...,:k] = prev - refl[...,None]*prev[...,::-1]
+        err = err*(1-refl**2)
+    return AR,err
+
+def Yule_walker_windows_models(Epoch_compute,n_per_seg,n_shift,filter_order):
+    # ----------
+    # Yule-Walker AR models (biased autocovariance, each window demeaned) of
+    # every sliding window of every epoch: an alternative to
+    # Burg_windows_models, faster with overlapping windows.
+    # The lag products sum_t x[t]*x[t+k] (and the sums of x needed to demean
+    # each window) are kept as running sums along the epoch: the sums of a
+    # window are obtained from those of the previous one by adding the samples
+    # entering it and removing those leaving it, instead of being computed
+    # again over the whole window.
+    # Epoch_compute: (trials, channels, samples)
+    # Returns AR coefficients (trials, channels, windows, filter_order),
+    # and noise variances (trials, channels, windows)
+    # ----------
+    a = Epoch_compute.shape
+    M = a[2]
+    L = n_per_seg
+    nbWindows = int((M-L)/n_shift)+1 if M >= L else 0
+    if nbWindows == 0:
+        return np.zeros([a[0],a[1],0,filter_order]),np.zeros([a[0],a[1],0])
+
+    # Demeaning the whole epoch first doesn't change the windows' covariances,
+    # but keeps the running sums small (EEG offsets)
+    x = np.asarray(Epoch_compute,dtype=float)
+    x = x - x.mean(axis=-1,keepdims=True)
+    starts = np.arange(nbWindows)*n_shift
+    ends = starts+L
+
+    running_x = np.zeros(a[:2]+(M+1,))
+    np.cumsum(x,axis=-1,out=running_x[...,1:])
+    sum_x = running_x[...,ends]-running_x[...,starts]
+    mean_x = sum_x/L
+
+    r = np.empty(a[:2]+(nbWindows,filter_order+1))
+    running_prod = np.zeros(a[:2]+(M+1,))
+    for k in range(filter_order+1):
+        np.cumsum(x[...,:M-k]*x[...,k:],axis=-1,out=running_prod[...,1:M-k+1])
+        sum_prod = running_prod[...,ends-k]-running_prod[...,starts]
+        sum_head = running_x[...,ends-k]-running_x[...,starts]
+        sum_tail = running_x[...,ends]-running_x[...,starts+k]
+        r[...,k] = (sum_prod - mean_x*(sum_head+sum_tail) + (L-k)*mean_x**2)/L
+
+    return Levinson_batch(r,filter_order)
+
+def Burg_order_selection(Epoch_compute,noverlap,n_per_seg,max_order,criterion='AIC'):
+    # ----------
+    # AR order selection from a single Burg fit of order max_order: the
+    # recursion gives the prediction error power of every order from 0 to
+    # max_order, from which the information criteria are computed
+    # (N: samples per window, k: order, E: prediction error power):
+    #   AIC = N ln(E) + 2k, BIC = N ln(E) + k ln(N), FPE = E (N+k+1)/(N-k-1)
+    # Windows are those of Power_burg_calculation (n_per_seg samples,
+    # noverlap samples of overlap, same number of windows), criteria are
+    # averaged over all windows of all trials.
+    # Epoch_compute: (trials, channels, samples)
+    # Returns the order per channel (channels) and for all channels, and the
+    # curves of the 3 criteria per channel {name: (channels, max_order+1)}
+    # ----------
+    N = n_per_seg
+    # Same windows as Power_burg_calculation (k-1 windows)
+    nb_windows = round((Epoch_compute.shape[-1]-noverlap)/(N-noverlap))-1
+    Blocks = Sliding_windows(Epoch_compute, N, N-noverlap, nb_windows)
+    AR_all, errors = Burg_AR_batch(Blocks, max_order, all_orders=True)
+    k = np.arange(max_order+1)
+    log_errors = np.log(errors)
+    curves = {'AIC': np.mean(N*log_errors + 2*k,axis=(0,2)),
+              'BIC': np.mean(N*log_errors + k*np.log(N),axis=(0,2)),
+              'FPE': np.mean(errors*(N+k+1)/(N-k-1),axis=(0,2))}
+    channel_orders = np.argmin(curves[criterion][:,1:],axis=-1)+1
+    global_order = int(np.argmin(curves[criterion][:,1:].mean(axis=0))+1)
+    return channel_orders,global_order,curves
+
+def Power_burg_windows(Epoch_compute,n_per_seg,n_shift,N_FFT,filter_order):
+    # AR Burg PSD of every sliding window of every epoch, as done in OpenViBE by
+    # "Time based epoching" + "AutoRegressive Coefficients" (detrend, order, PSD size)
+    # Epoch_compute: (trials, channels, samples)
+    # Returns (trials, channels, windows, N_FFT/2+1), from 0 to f_max/2 included
+    AR_all, sigma2_all = Burg_windows_models(Epoch_compute, n_per_seg, n_shift, filter_order)
+    return AR_psd_batch(AR_all, N_FFT, rho=sigma2_all)
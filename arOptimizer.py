@@ -0,0 +1,204 @@
+import os
+import json
+import functools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from Spectral_Analysis import Burg_windows_models, AR_psd_batch
+from Statistical_analysis import Compute_Signed_Rsquare
+from featureExtractUtils import timeToSamples, freqResToPsdSize
+from nativeExtraction import loadTrialsCsv
+from mergeRunsCsv import stimulationCodes
+from extractionPool import runJobPool
+from jobQueue import fileSignature
+
+import bcipipeline_settings as settings
+
+# ------------------------------------------------------
+# Search of the AR model order and time windows maximizing the
+# discriminability of the two classes: particle swarm over
+# (AutoRegressiveOrderTime, TimeWindowLength, TimeWindowShift),
+# scored by the peak of the signed R² map (Compute_Signed_Rsquare)
+# between the trials of both classes, from the -TRIALS.csv files.
+# Particles of an iteration are evaluated in parallel processes, and
+# every evaluation is kept on disk: an evaluation done in a previous
+# search (or by another particle) is never done again.
+# ------------------------------------------------------
+
+# Evaluations, written in generated/signals/analysis
+memoFilename = "ar-optimization.json"
+
+# Particle swarm coefficients (inertia, attraction to the particle's best
+# position, attraction to the swarm's best position)
+inertia = 0.7
+cognitiveCoeff = 1.5
+socialCoeff = 1.5
+
+
+def loadMemo(analysisFolder):
+    memoPath = os.path.join(analysisFolder, memoFilename)
+    if not os.path.exists(memoPath):
+        return {}
+    with open(memoPath) as jsonfile:
+        memo = json.load(jsonfile)
+    return memo
+
+
+def saveMemo(analysisFolder, memo):
+    memoPath = os.path.join(analysisFolder, memoFilename)
+    tempPath = str(memoPath + ".tmp")
+    with open(tempPath, "w") as outfile:
+        json.dump(memo, outfile, indent=4)
+    os.replace(tempPath, memoPath)
+    return
+
+
+def memoKey(trialsSignatures, config, fmin, fmax, freqRes):
+    # Evaluations depend on the trials files (size, modification time),
+    # the configuration in samples, and the frequencies of the R² map
+    return json.dumps([trialsSignatures, config, fmin, fmax, freqRes])
+
+
+@functools.lru_cache(maxsize=4)
+def loadClassTrials(trialsFiles):
+    # ----------
+    # Trials of both classes, from all -TRIALS.csv files (kept in memory
+    # by each worker process of the search, for the next evaluations and
+    # iterations, see optimizeArParameters).
+    # Both classes get the same number of trials, as Compute_Signed_Rsquare expects.
+    # ----------
+    class1Epochs = []
+    class2Epochs = []
+    sampFreq = None
+    for trialsCsv in trialsFiles:
+        epochs, classes, sampFreq, electrodeList = loadTrialsCsv(trialsCsv)
+        classes = np.array(classes)
+        class1Epochs.append(epochs[classes == stimulationCodes["OVTK_GDF_Left"]])
+        class2Epochs.append(epochs[classes == stimulationCodes["OVTK_GDF_Right"]])
+    class1Epochs = np.concatenate(class1Epochs)
+    class2Epochs = np.concatenate(class2Epochs)
+    nbTrials = min(len(class1Epochs), len(class2Epochs))
+    return class1Epochs[:nbTrials], class2Epochs[:nbTrials], sampFreq
+
+
+def checkClassTrials(nbTrials):
+    # Both classes need trials for the R² map: without them, every
+    # configuration would get the same meaningless score
+    if nbTrials < 2:
+        raise ValueError(str("Only " + str(nbTrials) + " trial(s) per class (stimulations "
+                             + stimulationCodes["OVTK_GDF_Left"] + " and " + stimulationCodes["OVTK_GDF_Right"]
+                             + ") in the trials files, at least 2 are needed"))
+    return
+
+
+def evaluateArConfig(trialsFiles, config, fmin, fmax, freqRes):
+    # ----------
+    # Peak absolute signed R² between both classes, over all channels and
+    # frequencies in [fmin, fmax], for a configuration (AR order, window length,
+    # window shift) in samples. Each trial's power is the average of the AR
+    # spectra of its time windows, as in the spectra loaded after extraction.
+    # Configurations that don't fit in the trials score 0.
+    # ----------
+    arOrder, winLength, winShift = config
+    class1Epochs, class2Epochs, sampFreq = loadClassTrials(tuple(trialsFiles))
+    checkClassTrials(len(class1Epochs))
+    if winLength > class1Epochs.shape[2] or arOrder >= winLength - 1:
+        return 0.0
+    psdSize = freqResToPsdSize(freqRes, sampFreq)
+    bins = np.arange(int(np.ceil(fmin / freqRes)), int(fmax / freqRes) + 1)
+
+    powers = []
+    for epochs in (class1Epochs, class2Epochs):
+        AR, sigma2 = Burg_windows_models(epochs, winLength, winShift, arOrder)
+        powers.append(AR_psd_batch(AR, psdSize, rho=sigma2)[..., bins].mean(axis=2))
+
+    Rsigned = Compute_Signed_Rsquare(powers[1], powers[0])
+    return float(np.nanmax(np.abs(Rsigned)))
+
+
+def configSamples(position, sampFreq):
+    # Position of a particle (times in seconds) as a configuration in samples
+    return [max(1, timeToSamples(value, sampFreq)) for value in position]
+
+
+def optimizeArParameters(trialsFiles, analysisFolder, bounds=None, nbParticles=None, nbIterations=None,
+                         fmin=None, fmax=None, freqRes=None, nbJobs=None, progressText=None, seed=0):
+    # ----------
+    # Particle swarm search of the (AutoRegressiveOrderTime, TimeWindowLength,
+    # TimeWindowShift) maximizing evaluateArConfig, within bounds
+    # {name: (min, max)} (seconds; min == max keeps a parameter fixed).
+    # Returns the best parameters (dict), their score, and the number of
+    # configurations evaluated / taken from the memo.
+    # Raises ValueError if a class has fewer than 2 trials
+    # ----------
+    bounds = bounds or settings.arOptimizerBounds
+    nbParticles = nbParticles or settings.arOptimizerParticles
+    nbIterations = nbIterations or settings.arOptimizerIterations
+    fmin = settings.arOptimizerFreqRange[0] if fmin is None else fmin
+    fmax = settings.arOptimizerFreqRange[1] if fmax is None else fmax
+    freqRes = freqRes or 1.0
+    progressText = progressText or print
+
+    names = ["AutoRegressiveOrderTime", "TimeWindowLength", "TimeWindowShift"]
+    low = np.array([float(bounds[name][0]) for name in names])
+    high = np.array([float(bounds[name][1]) for name in names])
+
+    trialsFiles = sorted(trialsFiles)
+    class1Epochs, class2Epochs, sampFreq = loadClassTrials(tuple(trialsFiles))
+    checkClassTrials(len(class1Epochs))
+    signatures = [fileSignature(path) for path in trialsFiles]
+    memo = loadMemo(analysisFolder)
+    nbEvaluated = 0
+    nbMemo = 0
+
+    rng = np.random.default_rng(seed)
+    positions = low + rng.random([nbParticles, len(names)]) * (high - low)
+    velocities = (rng.random([nbParticles, len(names)]) - 0.5) * (high - low) / 2
+    bestPositions = positions.copy()
+    bestScores = np.full(nbParticles, -np.inf)
+    swarmBest = positions[0].copy()
+    swarmBestScore = -np.inf
+
+    # One pool of worker processes for the whole search: each worker keeps the
+    # trials it loaded (loadClassTrials) for the next iterations
+    with ProcessPoolExecutor(max_workers=nbJobs or os.cpu_count()) as pool:
+        for iteration in range(nbIterations):
+            # Evaluate the configurations of this iteration not already in the memo
+            configs = [configSamples(position, sampFreq) for position in positions]
+            jobs = []
+            for config in configs:
+                key = memoKey(signatures, config, fmin, fmax, freqRes)
+                if key in memo or key in [job[0] for job in jobs]:
+                    nbMemo += 1
+                    continue
+                jobs.append((key, evaluateArConfig, (trialsFiles, config, fmin, fmax, freqRes)))
+
+            def jobDone(key, score):
+                memo[key] = score
+                saveMemo(analysisFolder, memo)
+
+            runJobPool(jobs, nbJobs, jobDone, useProcesses=True, pool=pool)
+            nbEvaluated += len(jobs)
+
+            for idx, config in enumerate(configs):
+                score = memo[memoKey(signatures, config, fmin, fmax, freqRes)]
+                if score > bestScores[idx]:
+                    bestScores[idx] = score
+                    bestPositions[idx] = positions[idx]
+                if score > swarmBestScore:
+                    swarmBestScore = score
+                    swarmBest = positions[idx].copy()
+
+            progressText(str("Iteration " + str(iteration + 1) + "/" + str(nbIterations)
+                             + ": best peak R² " + str(round(swarmBestScore, 4))))
+
+            # Move the particles
+            r1 = rng.random(positions.shape)
+            r2 = rng.random(positions.shape)
+            velocities = inertia * velocities + cognitiveCoeff * r1 * (bestPositions - positions) \
+                + socialCoeff * r2 * (swarmBest - positions)
+            positions = np.clip(positions + velocities, low, high)
+
+    bestConfig = configSamples(swarmBest, sampFreq)
+    bestParams = {names[idx]: float(bestConfig[idx]) / sampFreq for idx in range(len(names))}
+    return bestParams, swarmBestScore, nbEvaluated, nbMemo
@@ -0,0 +1,435 @@
+import sys
+import os
+import json
+import argparse
+import numpy as np
+
+from extractionPool import runJobPool
+from pipelineSteps import generateScenarios, extractSessions, watchSessions, computeSpectralStats, trainClassifier
+from pipelineSteps import checkSelectedFeats, computeConnectivityStats, computeBandPowerStats, resumeBatches
+from pipelineSteps import computeMultitaperStats
+from nativeExtraction import loadTrialsCsv, trialFeatures
+from arOptimizer import optimizeArParameters
+
+import bcipipeline_settings as settings
+
+# ------------------------------------------------------
+# Command line runner for the pipeline, without GUI (no PyQt5 needed)
+# Each subject (--subjects) is a work folder, containing (or that will contain)
+# a "generated" folder like the one of this repository:
+#   generated/params.json, generated/*.xml, generated/signals/*.ov ...
+# Multiple subjects are processed in parallel (--jobs)
+#
+# Examples:
+#   python bcipipeline_cli.py generate --pipeline PowSpectrumGraz --designer /opt/openvibe/openvibe-designer.sh --subjects subj01 subj02
+#   python bcipipeline_cli.py extract --subjects subj01 subj02
+#   python bcipipeline_cli.py extract --watch --subjects subj01
+#   python bcipipeline_cli.py stats --subjects subj01 subj02
+#   python bcipipeline_cli.py train --features "C3;12" "C4;12:13" --combinations --subjects subj01 subj02
+#   python bcipipeline_cli.py features --features "C3;12" "C4;12:13" --subjects subj01
+#   python bcipipeline_cli.py optimize --apply --subjects subj01
+#   python bcipipeline_cli.py resume --subjects subj01 subj02
+# ------------------------------------------------------
+
+scriptFolder = os.path.dirname(os.path.realpath(__file__))
+
+# Statistics written by the "stats" step, in generated/signals/analysis
+statsFilename = "spectral-stats.npz"
+connectivityStatsFilename = "connectivity-stats.npz"
+bandPowerStatsFilename = "bandpower-stats.npz"
+multitaperStatsFilename = "multitaper-stats.npz"
+
+# Feature vectors written by the "features" step, in generated/signals/training
+featuresSuffix = "-FEATURES.npz"
+
+
+def loadParameters(subjectFolder):
+    jsonfullpath = os.path.join(subjectFolder, "generated", "params.json")
+    if not os.path.exists(jsonfullpath):
+        return None
+    with open(jsonfullpath) as jsonfile:
+        parameterDict = json.load(jsonfile)
+    return parameterDict
+
+
+def parseParamList(paramList):
+    # "Key=Value" strings from the command line, as a dictionary
+    paramDict = {}
+    for param in paramList or []:
+        key, value = param.split("=", 1)
+        paramDict[key] = value
+    return paramDict
+
+
+def signalSessions(signalFolder):
+    # Basenames of all signal files of a subject
+    return sorted([file.removesuffix(".ov") for file in os.listdir(signalFolder) if file.endswith(".ov")])
+
+
+def runGenerate(subjectFolder, options):
+    generatedFolder = os.path.join(subjectFolder, "generated")
+    templateFolder = os.path.join(scriptFolder, settings.optionsTemplatesDir[options["pipeline"]])
+    generateScenarios(templateFolder, generatedFolder, options["pipeline"], options["designer"],
+                      parseParamList(options.get("set")))
+    return True, str("Scenarios generated in " + generatedFolder)
+
+
+def runExtract(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    # Update extraction parameters, like the GUI does
+    extractParams = parseParamList(options.get("set"))
+    if extractParams:
+        parameterDict.update(extractParams)
+        with open(os.path.join(subjectFolder, "generated", "params.json"), "w") as outfile:
+            json.dump(parameterDict, outfile, indent=4)
+
+    ovScript = options.get("designer") or parameterDict["ovDesignerPath"]
+    signalFolder = os.path.join(subjectFolder, "generated", "signals")
+    scenFile = os.path.join(subjectFolder, "generated", settings.templateScenFilenames[1])
+    engine = options.get("engine") or settings.extractionEngine
+    nbJobs = options.get("extraction_jobs") or settings.extractionNbJobs
+
+    if options.get("watch"):
+        # Runs until interrupted (Ctrl+C)
+        print("---Watching " + signalFolder + " for new recordings")
+        watchSessions(ovScript, scenFile, signalFolder, parameterDict, nbJobs, engine, settings.watchStableTime,
+                      maxAttempts=settings.watchMaxAttempts)
+        return True, ""
+
+    sessions = options.get("sessions") or signalSessions(signalFolder)
+    signalFiles = [str(session.removesuffix(".ov") + ".ov") for session in sessions]
+    if not signalFiles:
+        return False, str("No signal file in " + signalFolder)
+
+    success, errMsg = extractSessions(ovScript, scenFile, signalFiles, signalFolder, parameterDict,
+                                      nbJobs, engine)
+    if not success:
+        return False, errMsg
+    return True, str(str(len(signalFiles)) + " session(s) extracted")
+
+
+def runStats(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    signalFolder = os.path.join(subjectFolder, "generated", "signals")
+    if options.get("bands") is not None:
+        return runBandPowerStats(subjectFolder, signalFolder, parameterDict, options)
+    if options.get("multitaper"):
+        return runMultitaperStats(subjectFolder, signalFolder, parameterDict, options)
+    if parameterDict["pipelineType"] == settings.optionKeys[2]:
+        return runConnectivityStats(subjectFolder, signalFolder, parameterDict, options)
+    sessions = options.get("sessions")
+    if not sessions:
+        # All sessions with extracted spectra
+        sessions = [session for session in signalSessions(signalFolder)
+                    if os.path.exists(os.path.join(signalFolder, "analysis",
+                                                   str(session + "-" + parameterDict["Class1"] + ".csv")))]
+    if not sessions:
+        return False, "No extracted spectra, please use the extract step first"
+
+    results, errMsg = computeSpectralStats(signalFolder, [session.removesuffix(".ov") for session in sessions],
+                                           parameterDict, progressText=print)
+    if results is None:
+        return False, errMsg
+
+    statsFile = os.path.join(signalFolder, "analysis", statsFilename)
+    np.savez(statsFile, sessions=np.array(sessions), electrodes=np.array(results["electrodes_orig"]),
+             freqs=results["freqs_array"], fres=results["fres"], samplingFreq=results["samplingFreq"],
+             Rsigned=results["Rsigned"], Wsquare=results["Wsquare"], Wpvalues=results["Wpvalues"],
+             average_baseline_cond1=results["average_baseline_cond1"],
+             average_baseline_cond2=results["average_baseline_cond2"])
+    return True, str("R² and Wilcoxon maps written in " + statsFile)
+
+
+def runConnectivityStats(subjectFolder, signalFolder, parameterDict, options):
+    sessions = options.get("sessions")
+    if not sessions:
+        # All sessions with extracted trials
+        sessions = [session for session in signalSessions(signalFolder)
+                    if os.path.exists(os.path.join(signalFolder, "training", str(session + "-TRIALS.csv")))]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+
+    trialsFiles = [str(session.removesuffix(".ov") + "-TRIALS.csv") for session in sessions]
+    results, errMsg = computeConnectivityStats(signalFolder, trialsFiles, parameterDict, progressText=print)
+    if results is None:
+        return False, errMsg
+
+    statsFile = os.path.join(signalFolder, "analysis", connectivityStatsFilename)
+    np.savez(statsFile, sessions=np.array(sessions), electrodes=np.array(results["electrodes"]),
+             metric=results["metric"], freqs=results["freqs_array"], samplingFreq=results["samplingFreq"],
+             conn_cond1=results["conn_cond1"], conn_cond2=results["conn_cond2"],
+             Rsigned=results["Rsigned"], Wsquare=results["Wsquare"], Wpvalues=results["Wpvalues"])
+    return True, str("Connectivity, R² and Wilcoxon maps written in " + statsFile)
+
+
+def runBandPowerStats(subjectFolder, signalFolder, parameterDict, options):
+    sessions = options.get("sessions")
+    if not sessions:
+        # All sessions with extracted trials
+        sessions = [session for session in signalSessions(signalFolder)
+                    if os.path.exists(os.path.join(signalFolder, "training", str(session + "-TRIALS.csv")))]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+
+    # Bands as "low:high" texts (default: filterBankBands)
+    bands = settings.filterBankBands
+    if options["bands"]:
+        try:
+            bands = [tuple(float(freq) for freq in band.split(":")) for band in options["bands"]]
+        except ValueError:
+            return False, str("Invalid frequency bands " + str(options["bands"]) + ", please use low:high")
+        if not all(len(band) == 2 for band in bands):
+            return False, str("Invalid frequency bands " + str(options["bands"]) + ", please use low:high")
+
+    trialsFiles = [str(session.removesuffix(".ov") + "-TRIALS.csv") for session in sessions]
+    results, errMsg = computeBandPowerStats(signalFolder, trialsFiles, parameterDict, bands, progressText=print)
+    if results is None:
+        return False, errMsg
+
+    statsFile = os.path.join(signalFolder, "analysis", bandPowerStatsFilename)
+    np.savez(statsFile, sessions=np.array(sessions), electrodes=np.array(results["electrodes"]),
+             bands=results["bands"], samplingFreq=results["samplingFreq"],
+             power_cond1=results["power_cond1"], power_cond2=results["power_cond2"],
+             Rsigned=results["Rsigned"], Wsquare=results["Wsquare"], Wpvalues=results["Wpvalues"])
+    return True, str("Band powers, R² and Wilcoxon maps written in " + statsFile)
+
+
+def runMultitaperStats(subjectFolder, signalFolder, parameterDict, options):
+    sessions = options.get("sessions")
+    if not sessions:
+        # All sessions with extracted trials
+        sessions = [session for session in signalSessions(signalFolder)
+                    if os.path.exists(os.path.join(signalFolder, "training", str(session + "-TRIALS.csv")))]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+
+    trialsFiles = [str(session.removesuffix(".ov") + "-TRIALS.csv") for session in sessions]
+    results, errMsg = computeMultitaperStats(signalFolder, trialsFiles, parameterDict, settings.multitaperNW,
+                                             progressText=print)
+    if results is None:
+        return False, errMsg
+
+    statsFile = os.path.join(signalFolder, "analysis", multitaperStatsFilename)
+    np.savez(statsFile, sessions=np.array(sessions), electrodes=np.array(results["electrodes"]),
+             freqs=results["freqs_array"], samplingFreq=results["samplingFreq"],
+             power_cond1=results["power_cond1"], power_cond2=results["power_cond2"],
+             Rsigned=results["Rsigned"], Wsquare=results["Wsquare"], Wpvalues=results["Wpvalues"])
+    return True, str("Multitaper spectra, R² and Wilcoxon maps written in " + statsFile)
+
+
+def runTrain(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    ovScript = options.get("designer") or parameterDict["ovDesignerPath"]
+    signalFolder = os.path.join(subjectFolder, "generated", "signals")
+    sessions = options.get("sessions")
+    if not sessions:
+        # All sessions with extracted trials
+        sessions = [session for session in signalSessions(signalFolder)
+                    if os.path.exists(os.path.join(signalFolder, "training", str(session + "-TRIALS.csv")))]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+    if options["combinations"] and len(sessions) > 5:
+        return False, "Please select 5 runs maximum to train with all combinations"
+
+    trainingFiles = [str(session.removesuffix(".ov") + "-TRIALS.csv") for session in sessions]
+    templateFolder = os.path.join(scriptFolder, settings.optionsTemplatesDir[parameterDict["pipelineType"]])
+    return trainClassifier(options["combinations"], trainingFiles, signalFolder, templateFolder, subjectFolder,
+                           ovScript, options["kfold"], options["features"], parameterDict, progressText=print)
+
+
+def runFeatures(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    trainingFolder = os.path.join(subjectFolder, "generated", "signals", "training")
+    sessions = options.get("sessions")
+    if not sessions:
+        sessions = [file.removesuffix("-TRIALS.csv") for file in sorted(os.listdir(trainingFolder))
+                    if file.endswith("-TRIALS.csv")]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+
+    written = []
+    for session in sessions:
+        trialsCsv = os.path.join(trainingFolder, str(session.removesuffix(".ov") + "-TRIALS.csv"))
+        epochs, classes, sampFreq, electrodeList = loadTrialsCsv(trialsCsv)
+        selectedFeats, errMsg = checkSelectedFeats(options["features"], sampFreq, electrodeList)
+        if not selectedFeats:
+            return False, errMsg
+        features, classes = trialFeatures(trialsCsv, selectedFeats, parameterDict)
+        featuresFile = trialsCsv.replace("-TRIALS.csv", featuresSuffix)
+        np.savez(featuresFile, features=features, classes=np.array(classes),
+                 names=np.array([";".join(feat) for feat in selectedFeats]))
+        written.append(featuresFile)
+    return True, str("Feature vectors written in:\n" + "\n".join(written))
+
+
+def runOptimize(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    trainingFolder = os.path.join(subjectFolder, "generated", "signals", "training")
+    sessions = options.get("sessions")
+    if not sessions:
+        sessions = [file.removesuffix("-TRIALS.csv") for file in sorted(os.listdir(trainingFolder))
+                    if file.endswith("-TRIALS.csv")]
+    if not sessions:
+        return False, "No extracted trials, please use the extract step first"
+    trialsFiles = [os.path.join(trainingFolder, str(session.removesuffix(".ov") + "-TRIALS.csv"))
+                   for session in sessions]
+
+    bestParams, score, nbEvaluated, nbMemo = optimizeArParameters(
+        trialsFiles, os.path.join(subjectFolder, "generated", "signals", "analysis"),
+        nbParticles=options.get("particles"), nbIterations=options.get("iterations"),
+        freqRes=float(parameterDict["FreqRes"]), nbJobs=options.get("extraction_jobs"))
+
+    text = str("Best AR parameters (peak signed R² " + str(round(score, 4)) + ", "
+               + str(nbEvaluated) + " configurations evaluated, " + str(nbMemo) + " from previous evaluations):\n")
+    for key, value in bestParams.items():
+        text += str("  " + key + " = " + str(round(value, 4)) + "\n")
+
+    if options.get("apply"):
+        for key, value in bestParams.items():
+            parameterDict[key] = str(round(value, 4))
+        with open(os.path.join(subjectFolder, "generated", "params.json"), "w") as outfile:
+            json.dump(parameterDict, outfile, indent=4)
+        text += "Written in params.json: extract again to use them"
+    return True, text
+
+
+def runResume(subjectFolder, options):
+    parameterDict = loadParameters(subjectFolder)
+    if not parameterDict:
+        return False, "No params.json found, please use the generate step first"
+
+    ovScript = options.get("designer") or parameterDict["ovDesignerPath"]
+    nbJobs = options.get("extraction_jobs") or settings.extractionNbJobs
+    return resumeBatches(ovScript, subjectFolder, scriptFolder, nbJobs, progressText=print)
+
+
+steps = {"generate": runGenerate,
+         "extract": runExtract,
+         "stats": runStats,
+         "train": runTrain,
+         "features": runFeatures,
+         "optimize": runOptimize,
+         "resume": runResume}
+
+
+def runSubjectStep(step, subjectFolder, options):
+    # Job for one subject, run in a worker process
+    print("=== " + step + ": " + subjectFolder)
+    try:
+        return steps[step](subjectFolder, options)
+    except Exception as e:
+        return False, str(type(e).__name__ + ": " + str(e))
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(description="OpenViBE automated pipeline, without GUI")
+    subparsers = parser.add_subparsers(dest="step", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    # (an option, not a positional argument: options with multiple values,
+    # eg. --set or --features, would take the subjects as their own values)
+    common.add_argument("--subjects", nargs="+", default=[scriptFolder], metavar="SUBJECT",
+                        help="work folders (containing a \"generated\" folder), default: this repository")
+    common.add_argument("--jobs", type=int, default=None,
+                        help="number of subjects processed at the same time (default: number of cores)")
+    common.add_argument("--designer", default=None,
+                        help="path of openvibe-designer.cmd/.sh (default: the one in params.json)")
+
+    gen = subparsers.add_parser("generate", parents=[common], help="generate scenarios and params.json")
+    gen.add_argument("--pipeline", required=True, choices=[key for key in settings.optionKeys if key])
+    gen.add_argument("--set", nargs="*", metavar="KEY=VALUE", help="acquisition parameters")
+
+    ext = subparsers.add_parser("extract", parents=[common], help="extract features from signal files")
+    ext.add_argument("--sessions", nargs="*", help="signal files to extract (default: all)")
+    ext.add_argument("--set", nargs="*", metavar="KEY=VALUE", help="extraction parameters")
+    ext.add_argument("--engine", choices=["openvibe", "native"], default=None)
+    ext.add_argument("--extraction-jobs", type=int, default=None,
+                     help="sessions extracted at the same time, per subject")
+    ext.add_argument("--watch", action="store_true",
+                     help="keep running, and extract new signal files as soon as their recording is over")
+
+    stats = subparsers.add_parser("stats", parents=[common], help="load spectra and compute R²/Wilcoxon maps")
+    stats.add_argument("--sessions", nargs="*", help="sessions to analyze (default: all extracted)")
+    stats.add_argument("--bands", nargs="*", metavar="LOW:HIGH", default=None,
+                       help="band powers (filter bank) from the extracted trials, instead of the spectra "
+                            "(no value: bands of bcipipeline_settings)")
+    stats.add_argument("--multitaper", action="store_true",
+                       help="multitaper spectra of the extracted trials, instead of the extracted AR spectra "
+                            "(multitaperNW in bcipipeline_settings)")
+
+    train = subparsers.add_parser("train", parents=[common], help="train the classifier")
+    train.add_argument("--features", nargs="+", required=True, metavar="CHAN;FREQ",
+                       help="selected features, eg. \"C3;12\" \"C4;12:14\"")
+    train.add_argument("--sessions", nargs="*", help="sessions to train on (default: all extracted)")
+    train.add_argument("--kfold", type=int, default=5, help="number of k-fold partitions")
+    train.add_argument("--combinations", action="store_true",
+                       help="train on all combinations of sessions, and keep the best one")
+
+    feats = subparsers.add_parser("features", parents=[common],
+                                  help="compute training feature vectors of the selected features, in Python")
+    feats.add_argument("--features", nargs="+", required=True, metavar="CHAN;FREQ",
+                       help="selected features, eg. \"C3;12\" \"C4;12:14\"")
+    feats.add_argument("--sessions", nargs="*", help="sessions (default: all extracted)")
+
+    opt = subparsers.add_parser("optimize", parents=[common],
+                                help="search the AR order and time windows maximizing the R² between classes")
+    opt.add_argument("--sessions", nargs="*", help="sessions (default: all extracted)")
+    opt.add_argument("--particles", type=int, default=None, help="number of particles of the swarm")
+    opt.add_argument("--iterations", type=int, default=None, help="number of iterations of the swarm")
+    opt.add_argument("--extraction-jobs", type=int, default=None,
+                     help="configurations evaluated at the same time, per subject")
+    opt.add_argument("--apply", action="store_true", help="write the best parameters in params.json")
+
+    res = subparsers.add_parser("resume", parents=[common],
+                                help="run again the extractions and trainings interrupted (crash...) or failed")
+    res.add_argument("--extraction-jobs", type=int, default=None,
+                     help="sessions extracted at the same time, per subject")
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parseArguments(argv)
+    if args.step == "generate" and not args.designer:
+        print("--designer is required to generate scenarios")
+        return 1
+
+    options = vars(args).copy()
+    subjects = [os.path.abspath(subject) for subject in options.pop("subjects")]
+
+    # Toolbox scenarios (metadata...) are found from the working directory
+    os.chdir(scriptFolder)
+    options.pop("jobs")
+    options.pop("step")
+
+    results = {}
+    jobs = [(subject, runSubjectStep, (args.step, subject, options)) for subject in subjects]
+    runJobPool(jobs, args.jobs, lambda subject, result: results.update({subject: result}), useProcesses=True)
+
+    exitCode = 0
+    for subject in subjects:
+        success, text = results[subject]
+        print("=== " + subject + ": " + ("OK" if success else "FAILED"))
+        print(text)
+        if not success:
+            exitCode = 1
+    return exitCode
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
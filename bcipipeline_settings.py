@@ -111,7 +111,7 @@ paramIdText = {"TrialNb": "Nb Trials per class",
                "AutoRegressiveOrderTime": "Auto-regressive estim. length (s)",
                "PsdSize": "FFT Size",
                "FreqRes": "Frequency resolution (ratio)",
-               "ConnectivityMetric": "Connectivity Metric (MSC or IMCOH)",
+               "ConnectivityMetric": "Connectivity Metric (MSC, IMCOH, PDC or DTF)",
                "ConnectivityLength": "Length of a connectivity measure (s)",
                "ConnectivityOverlap": "Overlap between connectivity measures (%)",
                "ConnectivityMethod": "Method used for connectivity (Burg or Welch)",
@@ -122,3 +122,96 @@ paramIdText = {"TrialNb": "Nb Trials per class",
                "WelchWinOverlap": "Welch sliding window overlap (%)",
                "ConnectFftSize": "Connectivity: FFT Size"
                }
+
+global extractionNbJobs
+# Max number of OpenViBE designer instances running at the same time
+# during feature extraction (None: use the number of cores)
+extractionNbJobs = None
+
+global extractionEngine
+# "openvibe": extract features by running sc2-extract.xml with the designer
+# "native": decode the .ov files and extract features in Python (see nativeExtraction.py)
+extractionEngine = "openvibe"
+
+global designerTimeout
+# Max duration of a designer run in the background (s). The designer
+# is killed after that (None: no limit)
+designerTimeout = 3600
+
+global designerIdleTimeout
+# A designer run printing nothing for that long (s) is considered
+# stuck and is killed (None: no limit)
+designerIdleTimeout = None
+
+global watchNewRecordings
+# Extract new signal files automatically, as soon as their recording is over
+# (initial state of the "watch" checkbox of the extraction interface)
+watchNewRecordings = False
+
+global watchStableTime
+# A signal file is considered completely recorded when it is closed,
+# and its size hasn't changed for that long (s)
+watchStableTime = 5
+
+global watchMaxAttempts
+# A new signal file whose extraction fails is extracted again at the
+# next checks, up to that number of times (until it is recorded again)
+watchMaxAttempts = 3
+
+global schedulerMemoryMargin
+# Parallel jobs (extraction, training) are only started if the available
+# memory stays above that margin (bytes) once they're running
+schedulerMemoryMargin = 1024 * 1024 * 1024
+
+global schedulerRampUpTime
+# Time (s) a new job is given to allocate its memory: during that time,
+# its estimated footprint is considered as already used
+schedulerRampUpTime = 10
+
+global trainingNbJobs
+# Max number of combinations of runs trained at the same time, when
+# training with all combinations (None: use the number of cores)
+trainingNbJobs = None
+
+global nativeArMethod
+# AR estimation of the "native" extraction engine:
+# "burg": same as the AutoRegressive Coefficients box of OpenViBE
+# "yule-walker": faster with overlapping time windows (running lag sums),
+#   slightly different spectra
+nativeArMethod = "burg"
+
+global mvarMethod
+# MVAR estimation of the PDC / DTF connectivity metrics:
+# "yule-walker" (always stable, also with short windows and many channels)
+# or "least-squares"
+mvarMethod = "yule-walker"
+
+global filterBankBands
+# Frequency bands (Hz) of the band power features (see Power_filter_bank)
+filterBankBands = [(8, 12), (13, 30)]
+
+global filterBankOrder
+# Order of the Butterworth band-pass filters of the band power features
+filterBankOrder = 4
+
+global multitaperNW
+# Time-bandwidth product of the multitaper spectra (see Power_calculation_multitaper):
+# frequency smoothing of +/- NW / (trial length) Hz, 2*NW-1 tapers
+multitaperNW = 4
+
+global arOptimizerBounds
+# Search space of the AR parameters optimizer (see arOptimizer.py),
+# in seconds: (min, max) for each parameter (min == max: fixed)
+arOptimizerBounds = {"AutoRegressiveOrderTime": (0.01, 0.08),
+                     "TimeWindowLength": (0.15, 1.0),
+                     "TimeWindowShift": (0.05, 0.25)}
+
+global arOptimizerParticles
+arOptimizerParticles = 8
+
+global arOptimizerIterations
+arOptimizerIterations = 10
+
+global arOptimizerFreqRange
+# Frequencies (Hz) of the R² map maximized by the optimizer
+arOptimizerFreqRange = (4, 40)
@@ -0,0 +1,169 @@
+import os
+import signal
+import asyncio
+import platform
+import subprocess
+
+import bcipipeline_settings as settings
+
+# Printed by the designer when it is done playing a scenario
+endMarker = "Application terminated"
+
+# Time given to the designer to exit by itself after printing endMarker,
+# or after being asked to terminate, before it gets killed (s)
+exitGracePeriod = 5.0
+
+# Period of the watchdog checks (s)
+watchdogPeriod = 0.5
+
+
+def designerCommand(ovScript):
+    # openvibe-designer.cmd / .sh path, with the right separators
+    command = ovScript
+    if platform.system() == 'Windows':
+        command = command.replace("/", "\\")
+    return command
+
+
+def killProcessTree(proc):
+    # ----------
+    # Kill a designer process and its children: designer.cmd / .sh
+    # only launches the actual designer executable.
+    # ----------
+    if proc.returncode is not None:
+        return
+    try:
+        if platform.system() == 'Windows':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        pass
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+    return
+
+
+async def superviseProcess(commandList, timeout, idleTimeout, onOutput, stopRequested):
+    # ----------
+    # Run a process, stream its stdout and stderr line by line without
+    # blocking, and watch it: it is killed if it runs longer than timeout,
+    # prints nothing for idleTimeout seconds, or if stopRequested() is True.
+    # Returns (status, return code, output lines)
+    # ----------
+    if platform.system() == 'Windows':
+        groupArgs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        groupArgs = {"start_new_session": True}
+
+    try:
+        proc = await asyncio.create_subprocess_exec(*commandList, stdin=subprocess.DEVNULL,
+                                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                    **groupArgs)
+    except OSError as e:
+        print("---Error launching " + str(commandList[0]) + ": " + str(e))
+        return "failed", None, []
+
+    loop = asyncio.get_running_loop()
+    startTime = loop.time()
+    lastOutput = [startTime]
+    outputLines = []
+    endMarkerSeen = asyncio.Event()
+
+    async def readStream(stream, prefix):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            text = line.decode(errors="replace").rstrip("\r\n")
+            lastOutput[0] = loop.time()
+            outputLines.append(text)
+            print(str(prefix + text))
+            if onOutput:
+                onOutput(text)
+            if endMarker in text:
+                endMarkerSeen.set()
+
+    readers = [asyncio.create_task(readStream(proc.stdout, "")),
+               asyncio.create_task(readStream(proc.stderr, "[stderr] "))]
+    exitTask = asyncio.create_task(proc.wait())
+    markerTask = asyncio.create_task(endMarkerSeen.wait())
+
+    status = "finished"
+    while not exitTask.done():
+        await asyncio.wait([exitTask, markerTask], timeout=watchdogPeriod,
+                           return_when=asyncio.FIRST_COMPLETED)
+        if exitTask.done():
+            break
+
+        now = loop.time()
+        if markerTask.done():
+            # Done playing: leave it some time to exit by itself
+            try:
+                await asyncio.wait_for(asyncio.shield(exitTask), exitGracePeriod)
+            except asyncio.TimeoutError:
+                print("---Designer still running after \"" + endMarker + "\", killing it")
+                killProcessTree(proc)
+            break
+        if stopRequested and stopRequested():
+            print("---Stop requested, killing designer")
+            status = "stopped"
+        elif timeout and now - startTime > timeout:
+            print("---Designer running for more than " + str(timeout) + "s, killing it")
+            status = "timeout"
+        elif idleTimeout and now - lastOutput[0] > idleTimeout:
+            print("---No output from designer for " + str(idleTimeout) + "s, killing it")
+            status = "stalled"
+        else:
+            continue
+        killProcessTree(proc)
+        break
+
+    try:
+        await asyncio.wait_for(asyncio.shield(exitTask), exitGracePeriod)
+    except asyncio.TimeoutError:
+        pass
+    # Pipes can be held open by leftover children: don't wait forever on them
+    done, pending = await asyncio.wait(readers, timeout=exitGracePeriod)
+    for task in pending:
+        task.cancel()
+    markerTask.cancel()
+
+    if status == "finished" and proc.returncode and not endMarkerSeen.is_set():
+        status = "failed"
+    return status, proc.returncode, outputLines
+
+
+def runSupervised(commandList, timeout=None, idleTimeout=None, onOutput=None, stopRequested=None):
+    # ----------
+    # Blocking wrapper around superviseProcess, usable from any thread
+    # (QThread, worker of a job pool...): each call has its own event loop.
+    # onOutput(line) is called for each line of output, from the calling thread.
+    # Returns (status, output lines), with status one of:
+    # "finished", "failed", "timeout", "stalled", "stopped"
+    # ----------
+    status, returnCode, outputLines = asyncio.run(
+        superviseProcess(commandList, timeout, idleTimeout, onOutput, stopRequested))
+    return status, outputLines
+
+
+def runDesigner(ovScript, scenFile, onOutput=None, stopRequested=None, timeout=-1, idleTimeout=-1):
+    # ----------
+    # Play a scenario with the designer in the background
+    # (openvibe-designer.cmd --no-gui --play-fast <scen.xml>) and wait for it to finish.
+    # Default time limits come from bcipipeline_settings (designerTimeout, designerIdleTimeout)
+    # Returns (status, output lines), see runSupervised
+    # ----------
+    if timeout == -1:
+        timeout = settings.designerTimeout
+    if idleTimeout == -1:
+        idleTimeout = settings.designerIdleTimeout
+
+    commandList = [designerCommand(ovScript), "--no-gui", "--play-fast", scenFile]
+    status, outputLines = runSupervised(commandList, timeout, idleTimeout, onOutput, stopRequested)
+    if status != "finished":
+        print("---Designer run of " + scenFile + " ended with status: " + status)
+    return status, outputLines
@@ -1,38 +1,71 @@
 import os
 import pandas as pd
-import subprocess
 from shutil import copyfile
 
 from modifyOpenvibeScen import *
+from ovStreamReader import readOvMetadata
+from designerSupervisor import runDesigner
 
 def generateMetadata(ovFile, openvibeDesigner):
     # Make a copy of Openvibe scenario, for safe modification...
     scenName = "toolbox-generate-metadata.xml"
     toolboxPath = "toolbox-scenarios"
     srcFile = os.path.join(os.getcwd(), toolboxPath, scenName)
-    destFile = os.path.join(os.getcwd(), toolboxPath, scenName.replace(".xml", "-TEMP.xml"))
+    # (unique name: other extractions may generate metadata at the same time)
+    destFile = os.path.join(os.getcwd(), toolboxPath,
+                            scenName.replace(".xml", str("-TEMP-" + generateRandomHexId(4) + ".xml")))
     print("---Copying file " + srcFile + " to " + destFile)
     copyfile(srcFile, destFile)
 
-    inputParam = ovFile.replace("\\", "/")
-    outputParam = inputParam.replace(".ov", "-META.csv")
-    paramDict = {"EEGData": inputParam, "EEGMetaData": outputParam}
-
-    # Modify scenario I/O
-    modifyScenarioGeneralSettings(destFile, paramDict)
-
-    # launch Openvibe toolbox scenario
-    p = subprocess.Popen([openvibeDesigner, "--no-gui", "--play-fast", destFile],
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-    while True:
-        output = p.stdout.readline()
-        if p.poll() is not None:
-            break
-        if output:
-            print(str(output))
-            if "Application terminated" in str(output):
-                break
+    try:
+        inputParam = ovFile.replace("\\", "/")
+        outputParam = inputParam.replace(".ov", "-META.csv")
+        paramDict = {"EEGData": inputParam, "EEGMetaData": outputParam}
 
+        # Modify scenario I/O
+        modifyScenarioGeneralSettings(destFile, paramDict)
+
+        # launch Openvibe toolbox scenario
+        runDesigner(openvibeDesigner, destFile)
+    finally:
+        os.remove(destFile)
+
+    return
+
+def generateMetadataBatch(ovFiles, openvibeDesigner):
+    # Same as generateMetadata, for multiple signal files in a single
+    # designer run: the metadata scenario is replicated once per file.
+    if not ovFiles:
+        return
+    if len(ovFiles) == 1:
+        generateMetadata(ovFiles[0], openvibeDesigner)
+        return
+
+    scenName = "toolbox-generate-metadata.xml"
+    toolboxPath = "toolbox-scenarios"
+    srcFile = os.path.join(os.getcwd(), toolboxPath, scenName)
+    # (unique name: other extractions may generate metadata at the same time)
+    destFile = os.path.join(os.getcwd(), toolboxPath,
+                            scenName.replace(".xml", str("-BATCH-TEMP-" + generateRandomHexId(4) + ".xml")))
+    print("---Copying file " + srcFile + " to " + destFile)
+    copyfile(srcFile, destFile)
+
+    try:
+        settingsList = []
+        for ovFile in ovFiles:
+            inputParam = ovFile.replace("\\", "/")
+            outputParam = inputParam.replace(".ov", "-META.csv")
+            settingsList.append({"EEGData": inputParam, "EEGMetaData": outputParam})
+
+        # One reader -> CSV writer chain per file. Each chain keeps its player
+        # controller: the player stops at the first "experiment start" of all
+        # files, by then every CSV writer has received its signal header.
+        replicateScenario(destFile, settingsList, 200)
+
+        # launch Openvibe toolbox scenario
+        runDesigner(openvibeDesigner, destFile)
+    finally:
+        os.remove(destFile)
     return
 
 def extractMetadata(metaCsv):
@@ -45,12 +78,46 @@ def extractMetadata(metaCsv):
 
     return sampFreq, electrodeList
 
+def getMetadataBatch(ovFiles, openvibeDesigner):
+    # Sampling freq and electrode list of multiple signal files, as a
+    # dict {ovFile: (sampFreq, electrodeList)}, (None, None) on failure.
+    # First try to read them directly from the .ov stream headers, then fall
+    # back on the -META.csv files. Missing -META.csv files are all generated
+    # in one designer run.
+    metadata = {}
+    missing = []
+    for ovFile in ovFiles:
+        sampFreq, electrodeList = readOvMetadata(ovFile)
+        if sampFreq:
+            metadata[ovFile] = (sampFreq, electrodeList)
+        elif not os.path.exists(ovFile.replace(".ov", "-META.csv")):
+            missing.append(ovFile)
+
+    generateMetadataBatch(missing, openvibeDesigner)
+
+    for ovFile in ovFiles:
+        if ovFile in metadata:
+            continue
+        metaCsv = ovFile.replace(".ov", "-META.csv")
+        if not os.path.exists(metaCsv):
+            metadata[ovFile] = (None, None)
+        else:
+            metadata[ovFile] = extractMetadata(metaCsv)
+
+    return metadata
+
+def getMetadata(ovFile, openvibeDesigner):
+    # Sampling freq and electrode list of a signal file (see getMetadataBatch)
+    return getMetadataBatch([ovFile], openvibeDesigner)[ovFile]
+
 
 if __name__ == '__main__':
 
     openvibeDesigner = "C:\\openvibeTestArthur\\dist\\x64\\Release\\openvibe-designer.cmd"
 
     testSig = "C:\\Users\\arthur.desbois\\Documents\\dev\\openvibeScripting\\openvibe-automation\\generated\\signals\\motor-imagery.ov"
+    sampFreq, electrodeList = readOvMetadata(testSig)
+    print("Sampling Freq (from .ov header): " + str(sampFreq))
     generateMetadata(testSig, openvibeDesigner)
 
     testCsv = "C:\\Users\\arthur.desbois\\Documents\\dev\\openvibeScripting\\openvibe-automation\\generated\\signals\\motor-imagery-META.csv"
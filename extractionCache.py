@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+
+import bcipipeline_settings as settings
+
+# Manifest of extracted CSV files, written in the signals folder
+# (next to "analysis" and "training")
+manifestFilename = "extraction-manifest.json"
+
+# Parameters that change the content of the extracted files, on top
+# of the extraction parameters of the pipeline (see bcipipeline_settings)
+extraParamKeys = ["Class1", "Class2", "ChannelNames", "AutoRegressiveOrder", "PsdSize"]
+
+
+def loadManifest(signalFolder):
+    manifestPath = os.path.join(signalFolder, manifestFilename)
+    if not os.path.exists(manifestPath):
+        return {"signals": {}, "outputs": {}}
+    with open(manifestPath) as jsonfile:
+        manifest = json.load(jsonfile)
+    return manifest
+
+
+def saveManifest(signalFolder, manifest):
+    manifestPath = os.path.join(signalFolder, manifestFilename)
+    tempPath = str(manifestPath + ".tmp")
+    with open(tempPath, "w") as outfile:
+        json.dump(manifest, outfile, indent=4)
+    os.replace(tempPath, manifestPath)
+    return
+
+
+def signalHash(signalFolder, signalFile, manifest):
+    # ----------
+    # SHA-256 of a signal file. The hash is only computed again if the size
+    # or modification time of the file changed since it was last recorded
+    # ----------
+    signalPath = os.path.join(signalFolder, signalFile)
+    stat = os.stat(signalPath)
+    known = manifest["signals"].get(signalFile)
+    if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+        return known["sha256"]
+
+    sha = hashlib.sha256()
+    with open(signalPath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+
+    manifest["signals"][signalFile] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha.hexdigest()}
+    return sha.hexdigest()
+
+
+def effectiveParameters(parameterDict, engine="openvibe"):
+    # ----------
+    # Subset of the parameters that has an impact on the extracted files,
+    # and the extraction engine ("openvibe" or "native") that wrote them
+    # (with its AR estimation method, for the native engine)
+    # ----------
+    keys = list(settings.pipelineExtractSettings[parameterDict["pipelineType"]].keys()) + extraParamKeys
+    effective = {}
+    for key in keys:
+        if key in parameterDict:
+            effective[key] = str(parameterDict[key])
+    effective["engine"] = engine
+    if engine == "native":
+        effective["nativeArMethod"] = settings.nativeArMethod
+    return effective
+
+
+def outputPath(outputId, outputName):
+    # Path relative to the signals folder, also used as key in the manifest
+    # Trials go in "training", spectra and baselines in "analysis"
+    if outputId == "OutputTrials":
+        return str("training/" + outputName)
+    return str("analysis/" + outputName)
+
+
+def isUpToDate(manifest, signalFolder, digest, parameterDict, outputs, engine="openvibe"):
+    # ----------
+    # True if all the outputs of an extraction exist, and were produced
+    # from the same signal (hash) with the same parameters and engine
+    # ----------
+    params = effectiveParameters(parameterDict, engine)
+    for outputId, outputName in outputs.items():
+        path = outputPath(outputId, outputName)
+        if not os.path.exists(os.path.join(signalFolder, path)):
+            return False
+        entry = manifest["outputs"].get(path)
+        if not entry or entry["signal"] != digest or entry["parameters"] != params:
+            return False
+    return True
+
+
+def invalidateOutputs(manifest, signalFolder, outputs):
+    # ----------
+    # Remove the outputs of an extraction about to be run again, so that
+    # a failed run can't leave stale files looking up to date
+    # ----------
+    for outputId, outputName in outputs.items():
+        path = outputPath(outputId, outputName)
+        manifest["outputs"].pop(path, None)
+        if os.path.exists(os.path.join(signalFolder, path)):
+            os.remove(os.path.join(signalFolder, path))
+    return
+
+
+def recordExtraction(manifest, signalFolder, digest, parameterDict, outputs, engine="openvibe"):
+    # ----------
+    # Register the outputs of a finished extraction (with engine) in the manifest.
+    # Outputs that were not written (eg. designer failure) are not recorded.
+    # ----------
+    params = effectiveParameters(parameterDict, engine)
+    for outputId, outputName in outputs.items():
+        path = outputPath(outputId, outputName)
+        if os.path.exists(os.path.join(signalFolder, path)):
+            manifest["outputs"][path] = {"signal": digest, "parameters": params}
+    return
@@ -0,0 +1,151 @@
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from shutil import copyfile
+
+from modifyOpenvibeScen import *
+from featureExtractUtils import timeToSamples, freqResToPsdSize
+from designerSupervisor import runDesigner
+from resourceMonitor import hasCapacity, capacityCheckPeriod
+
+import bcipipeline_settings as settings
+
+
+def extractionOutputs(signalFile, parameterDict):
+    # ----------
+    # Names of the CSV files written by sc2-extract for a given signal file
+    # (spectra and baselines in "analysis", trials in "training")
+    # ----------
+    filename = signalFile.removesuffix(".ov")
+    outputs = {"OutputSpect1": str(filename + "-" + parameterDict["Class1"] + ".csv"),
+               "OutputSpect2": str(filename + "-" + parameterDict["Class2"] + ".csv"),
+               "OutputBaseline1": str(filename + "-" + parameterDict["Class1"] + "-BASELINE.csv"),
+               "OutputBaseline2": str(filename + "-" + parameterDict["Class2"] + "-BASELINE.csv"),
+               "OutputTrials": str(filename + "-TRIALS.csv")}
+    return outputs
+
+
+def extractionParameters(parameterDict, sampFreq, electrodeList):
+    # ----------
+    # Parameters actually used by the extraction scenario for a given
+    # signal file: ARburg order and FFT size depend on its sampling freq
+    # ----------
+    jobParamDict = parameterDict.copy()
+    jobParamDict["ChannelNames"] = ";".join(electrodeList)
+    jobParamDict["AutoRegressiveOrder"] = str(
+        timeToSamples(float(jobParamDict["AutoRegressiveOrderTime"]), sampFreq))
+    jobParamDict["PsdSize"] = str(freqResToPsdSize(float(jobParamDict["FreqRes"]), sampFreq))
+    return jobParamDict
+
+
+def prepareExtractionScenario(scenFile, signalFile, parameterDict, sampFreq, electrodeList):
+    # ----------
+    # Make a copy of the extraction scenario dedicated to one signal file,
+    # so that multiple designer instances can run at the same time.
+    # The copy stays in the same folder as the original scenario, as
+    # the output paths are relative to ${Player_ScenarioDirectory}
+    # Returns the path of the copy, and the parameters actually used
+    # ----------
+    jobParamDict = extractionParameters(parameterDict, sampFreq, electrodeList)
+
+    jobScenFile = scenFile.replace(".xml", str("-" + signalFile.removesuffix(".ov") + ".xml"))
+    copyfile(scenFile, jobScenFile)
+
+    # /!\ after updating ARburg order and FFT size using sampfreq
+    modifyScenarioGeneralSettings(jobScenFile, jobParamDict)
+
+    outputs = extractionOutputs(signalFile, jobParamDict)
+    modifyExtractionIO(jobScenFile, signalFile,
+                       outputs["OutputSpect1"], outputs["OutputSpect2"],
+                       outputs["OutputBaseline1"], outputs["OutputBaseline2"],
+                       outputs["OutputTrials"])
+
+    return jobScenFile, jobParamDict
+
+
+def runDesignerScenario(ovScript, scenFile):
+    # ----------
+    # Run a scenario with the designer in the background
+    # (openvibe-designer.cmd --no-gui --play-fast <scen.xml>)
+    # and wait for it to finish. Returns the run status (see designerSupervisor)
+    # ----------
+    status, outputLines = runDesigner(ovScript, scenFile)
+    return status
+
+
+def runExtractionJob(ovScript, jobScenFile):
+    status = runDesignerScenario(ovScript, jobScenFile)
+    os.remove(jobScenFile)
+    return status
+
+
+def runJobPool(jobs, nbJobs=None, jobDone=None, useProcesses=False, footprints=None, pool=None):
+    # ----------
+    # Run a list of jobs [(key, function, args), ...], at most nbJobs
+    # at the same time (default: number of cores), in threads or in processes.
+    # jobDone(key, result) is called from the calling thread every
+    # time a job is over, eg to update a progress bar.
+    # If footprints {key: estimated memory (bytes)} are given, a job is only
+    # started when the machine has enough available memory and idle CPU
+    # (see resourceMonitor), and more jobs are started as others finish.
+    # pool: an executor to run the jobs in, kept open by the caller
+    # (eg. to keep the worker processes, and their caches, across calls);
+    # by default a new one is created (and closed) for these jobs.
+    # ----------
+    if not nbJobs:
+        nbJobs = os.cpu_count()
+
+    executor = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+    with (nullcontext(pool) if pool else executor(max_workers=nbJobs)) as pool:
+        futures = {}
+        if footprints is None:
+            for key, function, args in jobs:
+                futures[pool.submit(function, *args)] = key
+
+            for future in as_completed(futures):
+                result = future.result()
+                if jobDone:
+                    jobDone(futures[future], result)
+            return
+
+        pending = list(jobs)
+        started = {}
+        while pending or futures:
+            # Memory promised to jobs started recently, that may not be allocated yet
+            now = time.time()
+            recentFootprints = sum([footprints.get(futures[future], 0) for future in futures
+                                    if now - started[future] < settings.schedulerRampUpTime])
+            while pending and len(futures) < nbJobs \
+                    and hasCapacity(footprints.get(pending[0][0], 0), len(futures), recentFootprints):
+                key, function, args = pending.pop(0)
+                future = pool.submit(function, *args)
+                futures[future] = key
+                started[future] = time.time()
+                recentFootprints += footprints.get(key, 0)
+
+            done, notDone = wait(futures, timeout=capacityCheckPeriod, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures.pop(future)
+                started.pop(future)
+                result = future.result()
+                if jobDone:
+                    jobDone(key, result)
+
+    return
+
+
+def runExtractionPool(ovScript, jobs, nbJobs=None, jobDone=None):
+    # ----------
+    # Run a list of extraction jobs [(signalFile, jobScenFile), ...]
+    # with at most nbJobs designer instances at the same time
+    # (default: number of cores).
+    # jobDone(signalFile) is called from the calling thread every
+    # time a job is over.
+    # ----------
+    poolJobs = []
+    for signalFile, jobScenFile in jobs:
+        poolJobs.append((signalFile, runExtractionJob, (ovScript, jobScenFile)))
+
+    runJobPool(poolJobs, nbJobs, lambda signalFile, result: jobDone(signalFile) if jobDone else None)
+    return
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+# Job queue database, written in the "generated" folder
+queueFilename = "jobs.sqlite"
+
+# Job status
+statusPending = "pending"
+statusRunning = "running"
+statusDone = "done"
+statusFailed = "failed"
+
+
+def openJobQueue(generatedFolder):
+    # ----------
+    # Open (and create if needed) the job queue of the pipeline.
+    # Jobs are grouped in batches (eg. one extraction of a list of sessions,
+    # one training with all combinations of runs), identified by a hash of
+    # their inputs and parameters: running the same batch again after a crash
+    # resumes it, re-using the results of the jobs already done.
+    # The connection must be used from the thread that opened it.
+    # ----------
+    conn = sqlite3.connect(os.path.join(generatedFolder, queueFilename), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                 "batch TEXT NOT NULL, key TEXT NOT NULL, kind TEXT NOT NULL, "
+                 "inputs TEXT, parameters TEXT, status TEXT NOT NULL, result TEXT, "
+                 "updated REAL, PRIMARY KEY (batch, key))")
+    # Arguments needed to run a batch again (see unfinishedBatches)
+    conn.execute("CREATE TABLE IF NOT EXISTS batches ("
+                 "batch TEXT PRIMARY KEY, kind TEXT NOT NULL, arguments TEXT, created REAL)")
+    conn.commit()
+    return conn
+
+
+def fileSignature(path):
+    # Size and modification time of an input file, to tell batches apart
+    # when an input file changes
+    stat = os.stat(path)
+    return [os.path.basename(path), stat.st_size, stat.st_mtime]
+
+
+def batchId(kind, inputs, parameters):
+    content = json.dumps([kind, inputs, parameters], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def enqueueJobs(conn, batch, kind, jobs, parameters, arguments=None):
+    # ----------
+    # Add jobs [(key, inputs), ...] to a batch, if they're not already in it.
+    # Jobs left "running" by an interrupted run are set back to "pending".
+    # arguments: what is needed to run the batch again, when resuming it
+    # ----------
+    now = time.time()
+    with conn:
+        if arguments is not None:
+            conn.execute("INSERT OR IGNORE INTO batches VALUES (?, ?, ?, ?)",
+                         (batch, kind, json.dumps(arguments, default=str), now))
+        for key, inputs in jobs:
+            conn.execute("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (batch, str(key), kind, json.dumps(inputs, default=str),
+                          json.dumps(parameters, default=str), statusPending, None, now))
+        conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE batch = ? AND status = ?",
+                     (statusPending, now, batch, statusRunning))
+    return
+
+
+def setJobStatus(conn, batch, key, status, result=None):
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?, result = ?, updated = ? WHERE batch = ? AND key = ?",
+                     (status, json.dumps(result, default=str), time.time(), batch, str(key)))
+    return
+
+
+def doneJobs(conn, batch):
+    # Results of the jobs of a batch already done, as a dict {key: result}
+    results = {}
+    for key, result in conn.execute("SELECT key, result FROM jobs WHERE batch = ? AND status = ?",
+                                    (batch, statusDone)):
+        results[key] = json.loads(result) if result else None
+    return results
+
+
+def unfinishedBatches(conn, kind):
+    # ----------
+    # Batches of a kind with jobs not done (interrupted by a crash, or failed),
+    # oldest first, as a list [(batch, arguments given to enqueueJobs)]
+    # ----------
+    batches = []
+    for batch, arguments in conn.execute("SELECT batches.batch, batches.arguments FROM batches "
+                                         "WHERE kind = ? AND EXISTS (SELECT 1 FROM jobs WHERE "
+                                         "jobs.batch = batches.batch AND jobs.status != ?) "
+                                         "ORDER BY created", (kind, statusDone)):
+        batches.append((batch, json.loads(arguments)))
+    return batches
+
+
+def removeBatch(conn, batch):
+    with conn:
+        conn.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+        conn.execute("DELETE FROM batches WHERE batch = ?", (batch,))
+    return
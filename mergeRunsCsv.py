@@ -19,7 +19,8 @@ def mergeRunsCsv(testSigList, class1, class2, class1Stim, class2Stim, tmin, tmax
     channels = []
     fsamp = None
     for sig in testSigList:
-        data = pd.read_csv(sig)
+        # Event fields are read as text: "769", or "769:32775" for multiple stimulations
+        data = pd.read_csv(sig, dtype={"Event Id": str}, keep_default_na=False)
         datanp = data.to_numpy()
         rawData.append(datanp)
         col = data.columns
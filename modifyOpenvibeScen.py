@@ -2,7 +2,6 @@ import copy
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import os
-import binascii
 
 
 def modifyScenarioGeneralSettings(scenXml, parameterDict):
@@ -329,9 +328,7 @@ def linkBoxes(root, listofBoxesToChain, nbOfOutputs, featAggInputIdx):
 
             link = ET.SubElement(links, "Link")
             identifier = ET.SubElement(link, "Identifier")
-            newId1 = str(generateRandomHexId(4)).replace("b", "").replace("\'", '')
-            newId2 = str(generateRandomHexId(4)).replace("b", "").replace("\'", '')
-            identifier.text = str("(0x" + str(newId1) + ", 0x" + str(newId2) + ")")
+            identifier.text = generateRandomIdentifier()
 
             source = ET.SubElement(link, "Source")
             sourceBoxId = ET.SubElement(source, "BoxIdentifier")
@@ -350,7 +347,12 @@ def linkBoxes(root, listofBoxesToChain, nbOfOutputs, featAggInputIdx):
                 targetBoxIn.text = str(featAggInputIdx)
 
 def generateRandomHexId(length):
-    return binascii.b2a_hex(os.urandom(length))
+    # Random hexadecimal string of "length" bytes (2*length digits)
+    return os.urandom(length).hex()
+
+def generateRandomIdentifier():
+    # New random OpenViBE identifier, eg. "(0x1a2b3c4d, 0x5e6f7a8b)"
+    return str("(0x" + generateRandomHexId(4) + ", 0x" + generateRandomHexId(4) + ")")
 
 
 # Find a box by its name. Use ONLY to find a specific box in the whole tree.
@@ -384,7 +386,7 @@ def copyBox(root, box, locOffset):
         if node.tag == "Identifier":
             oldText = node.text
             oldIds = oldText.split(",")
-            newId = str(generateRandomHexId(4)).replace("b", "").replace("\'", '')
+            newId = generateRandomHexId(4)
             node.text = str(oldIds[0] + ", 0x" + str(newId) + ")")
             print("OLD ID : " + oldText + " // NEW ID : " + node.text)
 
@@ -401,6 +403,60 @@ def copyBox(root, box, locOffset):
     boxes.append(newbox)
     return newbox
 
+def replicateScenario(scenXml, settingsList, locOffset):
+    # ----------
+    # Replace all boxes and links of a scenario by len(settingsList) copies,
+    # with new identifiers, so that one designer run processes multiple files.
+    # In each copy, $var{Name} in box settings is replaced by settingsList[i]["Name"]
+    # Copies are shifted by locOffset (vertically) in the designer.
+    # ----------
+    print("---Replicating " + scenXml + " " + str(len(settingsList)) + " times")
+    verLocId = "(0x1fa7a38f, 0x54edbe0b)"
+
+    tree = ET.parse(scenXml)
+    root = tree.getroot()
+    boxes = root.find('Boxes')
+    links = root.find('Links')
+    origBoxes = list(boxes)
+    origLinks = list(links)
+    for box in origBoxes:
+        boxes.remove(box)
+    for link in origLinks:
+        links.remove(link)
+
+    for idx, copySettings in enumerate(settingsList):
+        newBoxIds = {}
+        for box in origBoxes:
+            newBox = copy.deepcopy(box)
+            newId = generateRandomIdentifier()
+            newBoxIds[box.find('Identifier').text] = newId
+            newBox.find('Identifier').text = newId
+
+            for setting in newBox.findall('Settings/Setting'):
+                value = setting.find('Value')
+                if value is None or not value.text:
+                    continue
+                for key, val in copySettings.items():
+                    value.text = value.text.replace(str("$var{" + key + "}"), str(val))
+
+            for attrib in newBox.findall('Attributes/Attribute'):
+                if attrib.find('Identifier').text == verLocId:
+                    loc = attrib.find('Value')
+                    loc.text = str(int(loc.text) + idx * locOffset)
+
+            boxes.append(newBox)
+
+        for link in origLinks:
+            newLink = copy.deepcopy(link)
+            newLink.find('Identifier').text = generateRandomIdentifier()
+            for end in ["Source", "Target"]:
+                boxId = newLink.find(end).find('BoxIdentifier')
+                boxId.text = newBoxIds[boxId.text]
+            links.append(newLink)
+
+    tree.write(scenXml)
+    return
+
 def copyBoxList(root, boxIdList, locOffset, chanFreqPair):
 
     boxes = root.find('Boxes')
@@ -0,0 +1,333 @@
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+
+import pandas as pd
+
+from Spectral_Analysis import Burg_windows_models, Yule_walker_windows_models, AR_psd_batch, Burg_selected_features
+from Connectivity_Analysis import Mvar_windows_models
+from featureExtractUtils import timeToSamples
+from extractionPool import extractionOutputs, extractionParameters
+from extractionCache import outputPath
+from mergeRunsCsv import stimulationCodes
+from ovStreamReader import decodeOvFile, decodedFilenames, loadDecodedSignal
+
+import bcipipeline_settings as settings
+
+# Same as the "Precision" setting of the CSV File Writer boxes in sc2-extract.xml
+csvPrecision = 10
+
+# AR estimation methods (see nativeArMethod in bcipipeline_settings)
+arMethods = {"burg": Burg_windows_models,
+             "yule-walker": Yule_walker_windows_models}
+
+
+def commonAverageReference(signal):
+    # ----------
+    # "Common Average Reference" box: subtract the mean of all channels, sample per sample
+    # signal: (channels, samples)
+    # ----------
+    return signal - signal.mean(axis=0, keepdims=True)
+
+
+def stimulationEpochs(signal, sampFreq, stimulations, stimCodes, epochDuration, epochOffset):
+    # ----------
+    # "Stimulation based epoching" box: one epoch of epochDuration seconds,
+    # starting epochOffset seconds after each stimulation in stimCodes
+    # stimulations: list of (date in seconds, stimulation code)
+    # Returns epochs (epochs, channels, samples), their first sample index,
+    # and the stimulation (date, code) each epoch was cut from
+    # ----------
+    nbSamples = timeToSamples(epochDuration, sampFreq)
+    epochs = []
+    startSamples = []
+    epochStims = []
+    for date, code in stimulations:
+        if str(int(code)) not in stimCodes:
+            continue
+        start = int(round((float(date) + epochOffset) * sampFreq))
+        if start < 0 or start + nbSamples > signal.shape[1]:
+            continue
+        epochs.append(signal[:, start:start + nbSamples])
+        startSamples.append(start)
+        epochStims.append((date, code))
+
+    if not epochs:
+        return np.zeros([0, signal.shape[0], nbSamples]), np.zeros(0, dtype=int), []
+    return np.stack(epochs), np.array(startSamples), epochStims
+
+
+def arCacheFilename(cacheFolder, signalFile, modelParams):
+    # AR models of a session, for a given set of parameters they depend on
+    # (not the PSD size: a new frequency resolution re-uses the same models)
+    digest = hashlib.sha256(json.dumps(modelParams, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(cacheFolder, str(signalFile.removesuffix(".ov") + "-AR-" + digest + ".npz"))
+
+
+def clearArCache(cacheFolder, signalFile):
+    # Remove the cached AR models of a session (eg. when its signal changed)
+    for filename in glob.glob(os.path.join(glob.escape(cacheFolder),
+                                           glob.escape(signalFile.removesuffix(".ov")) + "-AR-*.npz")):
+        os.remove(filename)
+    return
+
+
+def cachedModels(cacheFile, expectedShape, fitModels):
+    # ----------
+    # Models (coefficients "AR", noise variances "sigma2") returned by fitModels(),
+    # read from cacheFile when it exists (and its coefficients start with
+    # expectedShape), and written to it otherwise (no cache if cacheFile is None)
+    # ----------
+    if cacheFile and os.path.exists(cacheFile):
+        with np.load(cacheFile) as cached:
+            if cached["AR"].shape[:len(expectedShape)] == tuple(expectedShape):
+                return cached["AR"], cached["sigma2"]
+
+    AR, sigma2 = fitModels()
+    if cacheFile:
+        tempFile = str(cacheFile + ".tmp.npz")
+        np.savez(tempFile, AR=AR, sigma2=sigma2)
+        os.replace(tempFile, cacheFile)
+    return AR, sigma2
+
+
+def windowsArModels(epochs, winLength, winShift, arOrder, cacheFile=None, arMethod="burg"):
+    # ----------
+    # AR models (coefficients, noise variances) of all time windows
+    # of all epochs, estimated with arMethod (see arMethods).
+    # If cacheFile is given, models are read from it when
+    # it exists, and written to it otherwise
+    # ----------
+    return cachedModels(cacheFile, epochs.shape[:2],
+                        lambda: arMethods[arMethod](epochs, winLength, winShift, arOrder))
+
+
+def windowsMvarModels(epochs, winLength, winShift, mvarOrder, cacheFile=None, mvarMethod="yule-walker"):
+    # ----------
+    # MVAR models (coefficients, noise covariances) of all time windows
+    # of all epochs (see Mvar_windows_models), cached like windowsArModels
+    # ----------
+    return cachedModels(cacheFile, epochs.shape[:1],
+                        lambda: Mvar_windows_models(epochs, winLength, winShift, mvarOrder, mvarMethod))
+
+
+def writeSpectrumCsv(filename, spectra, startSamples, sampFreq, winLength, winShift, psdSize, electrodeList):
+    # ----------
+    # Write the spectra of all time windows of all epochs, like
+    # the CSV File Writer box does for a spectrum stream
+    # Header: "Time:32x251:500,End Time,Fp1:0,Fp1:1,...,Event Id,Event Date,Event Duration"
+    # spectra: (epochs, channels, windows, bins)
+    # ----------
+    nbEpochs, nbChannels, nbWindows, nbBins = spectra.shape
+    fres = float(sampFreq) / float(psdSize)
+
+    fieldnames = [str("Time:" + str(nbChannels) + "x" + str(nbBins) + ":" + str(int(sampFreq))), "End Time"]
+    for elec in electrodeList:
+        for b in range(nbBins):
+            fieldnames.append(str(elec + ":" + format(b * fres, "g")))
+    fieldnames.append("Event Id")
+    fieldnames.append("Event Date")
+    fieldnames.append("Event Duration")
+
+    # One row per time window: start, end, then channels x bins (channel-major)
+    rows = np.zeros([nbEpochs * nbWindows, 2 + nbChannels * nbBins])
+    for i in range(nbEpochs):
+        for w in range(nbWindows):
+            start = (startSamples[i] + w * winShift) / sampFreq
+            rows[i * nbWindows + w, 0] = start
+            rows[i * nbWindows + w, 1] = start + winLength / sampFreq
+            rows[i * nbWindows + w, 2:] = spectra[i, :, w, :].reshape(-1)
+
+    rowFmt = str(",".join(["%." + str(csvPrecision) + "g"] * rows.shape[1]) + ",,,")
+    np.savetxt(filename, rows, fmt=rowFmt, header=",".join(fieldnames), comments="")
+    return
+
+
+def writeSignalCsv(filename, epochs, startSamples, sampFreq, electrodeList, stimulations, epochStims=None):
+    # ----------
+    # Write signal epochs and stimulations, like the CSV File Writer box
+    # does for a signal stream (used for the -TRIALS.csv file)
+    # Header: "Time:500Hz,Epoch,Fp1,...,Event Id,Event Date,Event Duration"
+    # Each stimulation dated within an epoch is written on the first sample
+    # at or after its date, and stimulations between epochs are dropped.
+    # The stimulation each epoch was cut from (epochStims, see
+    # stimulationEpochs) is written on its nearest sample, or on the first
+    # one if it is dated before the epoch (positive StimulationDelay): each
+    # trial keeps its class there, where mergeRunsCsv reads it.
+    # ----------
+    nbEpochs, nbChannels, nbSamples = epochs.shape
+    floatFmt = str("%." + str(csvPrecision) + "g")
+    channelsFmt = str(",".join([floatFmt] * nbChannels))
+
+    # Stimulations to write, per (epoch, sample)
+    events = {}
+    sortedStims = sorted(stimulations, key=lambda stim: float(stim[0]))
+    dates = np.array([float(date) for date, code in sortedStims])
+    for i in range(nbEpochs):
+        trigger = None
+        if epochStims is not None:
+            trigger = (float(epochStims[i][0]), str(int(epochStims[i][1])))
+            sample = min(nbSamples - 1, max(0, int(round(trigger[0] * sampFreq - startSamples[i]))))
+            events.setdefault((i, sample), []).append((trigger[1], floatFmt % trigger[0]))
+        samples = np.ceil(dates * sampFreq - startSamples[i])
+        for idx in np.flatnonzero((samples >= 0) & (samples < nbSamples)):
+            date, code = sortedStims[idx]
+            if (float(date), str(int(code))) == trigger:
+                continue
+            events.setdefault((i, int(samples[idx])), []).append((str(int(code)), floatFmt % float(date)))
+
+    with open(filename, 'w', newline='') as csvfile:
+        fieldnames = [str('Time:' + str(int(sampFreq)) + 'Hz'), 'Epoch']
+        fieldnames += list(electrodeList)
+        fieldnames += ["Event Id", "Event Date", "Event Duration"]
+        csvfile.write(",".join(fieldnames) + "\n")
+
+        for i in range(nbEpochs):
+            for n in range(nbSamples):
+                line = str(floatFmt % ((startSamples[i] + n) / sampFreq) + "," + str(i) + ","
+                           + channelsFmt % tuple(epochs[i, :, n]))
+                if (i, n) in events:
+                    ids = [event[0] for event in events[(i, n)]]
+                    dates = [event[1] for event in events[(i, n)]]
+                    line += str("," + ":".join(ids) + "," + ":".join(dates) + "," + ":".join(["0"] * len(ids)))
+                else:
+                    line += ",,,"
+                csvfile.write(line + "\n")
+
+    return
+
+
+def nativeExtraction(signal, sampFreq, electrodeList, stimulations, signalFile, signalFolder, parameterDict,
+                     arCacheFolder=None):
+    # ----------
+    # In-process equivalent of sc2-extract.xml, for an already decoded signal:
+    #   CAR -> Stimulation based epoching -> Time based epoching -> AR Burg PSD -> CSV
+    # signal: (channels, samples), first sample at time 0
+    # stimulations: list of (date in seconds, stimulation code)
+    # Writes the same files as the scenario (see extractionOutputs), in the
+    # "analysis" and "training" subfolders of signalFolder.
+    # AR models are cached in arCacheFolder if given: extracting again with
+    # another frequency resolution (PSD size) doesn't fit them again.
+    # Returns the dictionary of outputs, and the parameters actually used
+    # ----------
+    jobParamDict = extractionParameters(parameterDict, sampFreq, electrodeList)
+    outputs = extractionOutputs(signalFile, jobParamDict)
+
+    epochDuration = float(jobParamDict["StimulationEpoch"])
+    epochDelay = float(jobParamDict["StimulationDelay"])
+    winLength = timeToSamples(float(jobParamDict["TimeWindowLength"]), sampFreq)
+    winShift = timeToSamples(float(jobParamDict["TimeWindowShift"]), sampFreq)
+    arOrder = int(jobParamDict["AutoRegressiveOrder"])
+    psdSize = int(jobParamDict["PsdSize"])
+
+    class1Code = [stimulationCodes["OVTK_GDF_Left"]]
+    class2Code = [stimulationCodes["OVTK_GDF_Right"]]
+
+    signalCar = commonAverageReference(np.asarray(signal, dtype=float))
+
+    # Trials (both classes), for classifier training
+    epochs, startSamples, epochStims = stimulationEpochs(signalCar, sampFreq, stimulations, class1Code + class2Code,
+                                                         epochDuration, epochDelay)
+    writeSignalCsv(os.path.join(signalFolder, outputPath("OutputTrials", outputs["OutputTrials"])),
+                   epochs, startSamples, sampFreq, electrodeList, stimulations, epochStims)
+
+    # Spectra for both classes, during the trials and before them (baseline)
+    spectraOutputs = [("OutputSpect1", class1Code, epochDelay),
+                      ("OutputSpect2", class2Code, epochDelay),
+                      ("OutputBaseline1", class1Code, -epochDuration),
+                      ("OutputBaseline2", class2Code, -epochDuration)]
+    for outputId, stimCodes, offset in spectraOutputs:
+        epochs, startSamples, epochStims = stimulationEpochs(signalCar, sampFreq, stimulations, stimCodes,
+                                                             epochDuration, offset)
+        cacheFile = None
+        if arCacheFolder:
+            cacheFile = arCacheFilename(arCacheFolder, signalFile,
+                                        [electrodeList, sampFreq, stimCodes, offset, epochDuration,
+                                         winLength, winShift, arOrder, settings.nativeArMethod])
+        AR, sigma2 = windowsArModels(epochs, winLength, winShift, arOrder, cacheFile, settings.nativeArMethod)
+        spectra = AR_psd_batch(AR, psdSize, rho=sigma2)
+        writeSpectrumCsv(os.path.join(signalFolder, outputPath(outputId, outputs[outputId])),
+                         spectra, startSamples, sampFreq, winLength, winShift, psdSize, electrodeList)
+
+    return outputs, jobParamDict
+
+
+def loadTrialsCsv(trialsCsv, class1Stim="OVTK_GDF_Left", class2Stim="OVTK_GDF_Right"):
+    # ----------
+    # Read a -TRIALS.csv file (see writeSignalCsv)
+    # Returns epochs (epochs, channels, samples), the class of each epoch
+    # (its first class1Stim or class2Stim code, "" if it has none), the
+    # sampling frequency and the channels
+    # ----------
+    data = pd.read_csv(trialsCsv, dtype={"Event Id": str}, keep_default_na=False)
+    sampFreq = int(data.columns[0].split(":")[1].removesuffix("Hz"))
+    electrodeList = list(data.columns[2:-3])
+    epochIdx = data["Epoch"].to_numpy()
+    nbEpochs = int(epochIdx.max()) + 1 if len(epochIdx) else 0
+    signal = data[electrodeList].to_numpy(dtype=float)
+    epochs = signal.reshape(nbEpochs, -1, len(electrodeList)).transpose(0, 2, 1)
+
+    classCodes = [stimulationCodes[class1Stim], stimulationCodes[class2Stim]]
+    classes = []
+    eventIds = data["Event Id"].to_numpy()
+    for i in range(nbEpochs):
+        codes = [code for eventList in eventIds[epochIdx == i] for code in eventList.split(":")
+                 if code in classCodes]
+        classes.append(codes[0] if codes else "")
+    return epochs, classes, sampFreq, electrodeList
+
+
+def featureFrequencies(freqText, freqRes):
+    # Frequencies of a feature: "12" (single frequency), or "12:14" (all
+    # frequencies from 12 to 14 Hz included), like the Frequency Band Selector box
+    bounds = [float(freq) for freq in freqText.split(":")]
+    return list(np.arange(bounds[0], bounds[-1] + freqRes / 2, freqRes))
+
+
+def trialFeatures(trialsCsv, selectedFeats, parameterDict):
+    # ----------
+    # Training feature vectors of a -TRIALS.csv file, for the selected features
+    # [[channel, freqs], ...]: one vector per time window of each trial,
+    # like those built by sc2-train. Only the selected channels are fitted,
+    # and AR spectra are only evaluated at the selected frequencies.
+    # Returns features (trials, windows, features) and the class of each trial
+    # ----------
+    epochs, classes, sampFreq, electrodeList = loadTrialsCsv(trialsCsv)
+    winLength = timeToSamples(float(parameterDict["TimeWindowLength"]), sampFreq)
+    winShift = timeToSamples(float(parameterDict["TimeWindowShift"]), sampFreq)
+    arOrder = timeToSamples(float(parameterDict["AutoRegressiveOrderTime"]), sampFreq)
+    freqRes = float(parameterDict["FreqRes"])
+
+    featChannels = [electrodeList.index(chan) for chan, freqs in selectedFeats]
+    featFreqs = [featureFrequencies(freqs, freqRes) for chan, freqs in selectedFeats]
+    features = Burg_selected_features(epochs, featChannels, featFreqs, sampFreq, winLength, winShift, arOrder)
+    return features, classes
+
+
+def runNativeExtractionJob(signalFolder, signalFile, parameterDict):
+    # ----------
+    # Extraction job for one .ov file: decode it in signalFolder/decoded
+    # (unless it was already decoded since its last modification),
+    # then extract features from the memory-mapped signal.
+    # Returns the dictionary of outputs, or None if the file couldn't be
+    # decoded or extracted (the error is printed, the other jobs go on)
+    # ----------
+    try:
+        ovFile = os.path.join(signalFolder, signalFile)
+        decodedFolder = os.path.join(signalFolder, "decoded")
+        signalNpy, stimsNpy, infoJson = decodedFilenames(ovFile, decodedFolder)
+        if not os.path.exists(infoJson) or os.path.getmtime(infoJson) < os.path.getmtime(ovFile):
+            if not decodeOvFile(ovFile, decodedFolder):
+                return None
+            clearArCache(decodedFolder, signalFile)
+
+        signal, stims, sampFreq, electrodeList = loadDecodedSignal(ovFile, decodedFolder)
+        stimulations = list(zip(stims["date"], stims["code"]))
+        outputs, jobParamDict = nativeExtraction(signal, sampFreq, electrodeList, stimulations,
+                                                 signalFile, signalFolder, parameterDict, decodedFolder)
+    except Exception as e:
+        print(str("---Error while extracting " + signalFile + ": " + type(e).__name__ + ": " + str(e)))
+        return None
+    return outputs
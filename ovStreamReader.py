@@ -0,0 +1,437 @@
+import os
+import json
+import struct
+import numpy as np
+
+# ----------
+# Reader for OpenViBE .ov files (written by the "Generic stream writer" box)
+# An .ov file is a sequence of EBML nodes:
+#   - one OpenViBEStream_Header, listing the type of each stream
+#   - OpenViBEStream_Buffer nodes, each one holding a chunk of one stream. The
+#     content of a chunk is itself an EBML stream, as produced by the OpenViBE
+#     toolkit encoders (Header, Buffer or End node)
+# Node identifiers below are the ones from OpenViBE's ovp_defines.h (file-io plugin)
+# and ovtk_defines.h (toolkit). Identifiers and sizes are coded as EBML variable
+# length integers, extended to 64 bits identifiers as in OpenViBE's EBML library.
+# ----------
+
+# Generic stream file
+OVP_NodeId_OpenViBEStream_Header = 0xF59505AB3684C8D8
+OVP_NodeId_OpenViBEStream_Header_Compression = 0x40358769166380D1
+OVP_NodeId_OpenViBEStream_Header_StreamType = 0x732EE3097BD3E7C8
+OVP_NodeId_OpenViBEStream_Buffer = 0x2E60AD1887A29BDF
+OVP_NodeId_OpenViBEStream_Buffer_StreamIndex = 0x30A56D8AB9C12238
+OVP_NodeId_OpenViBEStream_Buffer_StartTime = 0x093E6A0AC5A9467B
+OVP_NodeId_OpenViBEStream_Buffer_EndTime = 0x8B5CCCD9C5024F29
+OVP_NodeId_OpenViBEStream_Buffer_Content = 0x8D4B0BE87051265C
+
+# Stream contents (toolkit encoders)
+OVTK_NodeId_Header = 0x002B395F108ADFAE
+OVTK_NodeId_Buffer = 0x00CF210102375310
+OVTK_NodeId_End = 0x00D9DDC30B12873A
+OVTK_NodeId_Header_StreamedMatrix = 0x0072F5607ED2CBED
+OVTK_NodeId_Header_StreamedMatrix_DimensionCount = 0x003FEBD42725D428
+OVTK_NodeId_Header_StreamedMatrix_Dimension = 0x0000E3C03A7D5141
+OVTK_NodeId_Header_StreamedMatrix_Dimension_Size = 0x001302F736D8438A
+OVTK_NodeId_Header_StreamedMatrix_Dimension_Label = 0x00153E40190227E0
+OVTK_NodeId_Buffer_StreamedMatrix = 0x0012066308FBC165
+OVTK_NodeId_Buffer_StreamedMatrix_RawBuffer = 0x00B18C10427D098C
+OVTK_NodeId_Header_Signal = 0x007855DE3748D375
+OVTK_NodeId_Header_Signal_Sampling = 0x00141C430C37006B
+OVTK_NodeId_Buffer_Stimulation = 0x006DEABE7FC05A20
+OVTK_NodeId_Buffer_Stimulation_NumberOfStimulations = 0x00BB790B2B8574D8
+OVTK_NodeId_Buffer_Stimulation_Stimulation = 0x0016EAC629FBCAA1
+OVTK_NodeId_Buffer_Stimulation_Stimulation_Identifier = 0x006FA5DB4BAC31E9
+OVTK_NodeId_Buffer_Stimulation_Stimulation_Date = 0x00B866D814DA5374
+OVTK_NodeId_Buffer_Stimulation_Stimulation_Duration = 0x14EB8F3F1B7B23C3
+
+# Stream type identifiers
+OV_TypeId_Signal = 0x5BA36127195FEAE1
+OV_TypeId_Stimulations = 0x6F752DD0082A321E
+
+
+def readVarInt(data, offset):
+    # ----------
+    # Decode an EBML coded integer (identifier or size) starting at data[offset]
+    # The number of leading zero bits gives the coded length (in bytes),
+    # the bits after the marker bit give the value.
+    # Returns (value, new offset), or (None, offset) if data is too short
+    # ----------
+    length = 0
+    idx = offset
+    while idx < len(data) and data[idx] == 0:
+        length += 8
+        idx += 1
+    if idx >= len(data):
+        return None, offset
+    byte = data[idx]
+    bit = 7
+    while not (byte >> bit) & 1:
+        bit -= 1
+    length += 8 - bit
+    if offset + length > len(data):
+        return None, offset
+
+    value = byte & ((1 << bit) - 1)
+    for b in data[idx + 1:offset + length]:
+        value = (value << 8) | b
+    return value, offset + length
+
+
+def iterNodes(data, offset=0, end=None):
+    # ----------
+    # Iterate over EBML nodes in data[offset:end]
+    # Yields (identifier, content start, content end)
+    # Stops on the first incomplete node
+    # ----------
+    if end is None:
+        end = len(data)
+    while offset < end:
+        nodeId, newOffset = readVarInt(data, offset)
+        if nodeId is None:
+            return
+        size, newOffset = readVarInt(data, newOffset)
+        if size is None or newOffset + size > end:
+            return
+        yield nodeId, newOffset, newOffset + size
+        offset = newOffset + size
+
+
+def findNode(data, nodeId, offset=0, end=None):
+    for childId, start, stop in iterNodes(data, offset, end):
+        if childId == nodeId:
+            return start, stop
+    return None
+
+
+def decodeUInt(data):
+    value = 0
+    for b in data:
+        value = (value << 8) | b
+    return value
+
+
+def decodeFloat(data):
+    if len(data) == 4:
+        return struct.unpack(">f", data)[0]
+    return struct.unpack(">d", data)[0]
+
+
+def decodeString(data):
+    return bytes(data).decode("utf-8", errors="replace").rstrip("\x00")
+
+
+def decodeTime(data):
+    # OpenViBE times are 32:32 fixed point numbers of seconds
+    return decodeUInt(data) / float(1 << 32)
+
+
+def parseStreamHeader(data, start, end):
+    # ----------
+    # OpenViBEStream_Header node: compression flag, then one stream type per stream
+    # ----------
+    compression = False
+    streamTypes = []
+    for nodeId, nodeStart, nodeStop in iterNodes(data, start, end):
+        if nodeId == OVP_NodeId_OpenViBEStream_Header_Compression:
+            compression = decodeUInt(data[nodeStart:nodeStop]) != 0
+        elif nodeId == OVP_NodeId_OpenViBEStream_Header_StreamType:
+            streamTypes.append(decodeUInt(data[nodeStart:nodeStop]))
+    return compression, streamTypes
+
+
+def parseStreamBuffer(data, start, end):
+    # ----------
+    # OpenViBEStream_Buffer node: stream index, start/end times and encoded content
+    # ----------
+    streamIndex = None
+    startTime = None
+    endTime = None
+    content = None
+    for nodeId, nodeStart, nodeStop in iterNodes(data, start, end):
+        if nodeId == OVP_NodeId_OpenViBEStream_Buffer_StreamIndex:
+            streamIndex = decodeUInt(data[nodeStart:nodeStop])
+        elif nodeId == OVP_NodeId_OpenViBEStream_Buffer_StartTime:
+            startTime = decodeTime(data[nodeStart:nodeStop])
+        elif nodeId == OVP_NodeId_OpenViBEStream_Buffer_EndTime:
+            endTime = decodeTime(data[nodeStart:nodeStop])
+        elif nodeId == OVP_NodeId_OpenViBEStream_Buffer_Content:
+            content = data[nodeStart:nodeStop]
+    return streamIndex, startTime, endTime, content
+
+
+def parseSignalHeader(content):
+    # ----------
+    # Content of a signal stream Header: streamed matrix dimensions and labels
+    # (dimension 0 = channels, dimension 1 = samples per chunk) and sampling rate
+    # Returns (sampFreq, channel names, samples per chunk), or None if not a header
+    # ----------
+    header = findNode(content, OVTK_NodeId_Header)
+    if not header:
+        return None
+
+    sampFreq = None
+    dimensions = []
+    for nodeId, start, stop in iterNodes(content, header[0], header[1]):
+        if nodeId == OVTK_NodeId_Header_StreamedMatrix:
+            for dimId, dimStart, dimStop in iterNodes(content, start, stop):
+                if dimId != OVTK_NodeId_Header_StreamedMatrix_Dimension:
+                    continue
+                size = 0
+                labels = []
+                for childId, childStart, childStop in iterNodes(content, dimStart, dimStop):
+                    if childId == OVTK_NodeId_Header_StreamedMatrix_Dimension_Size:
+                        size = decodeUInt(content[childStart:childStop])
+                    elif childId == OVTK_NodeId_Header_StreamedMatrix_Dimension_Label:
+                        labels.append(decodeString(content[childStart:childStop]))
+                dimensions.append((size, labels))
+        elif nodeId == OVTK_NodeId_Header_Signal:
+            sampling = findNode(content, OVTK_NodeId_Header_Signal_Sampling, start, stop)
+            if sampling:
+                sampFreq = decodeUInt(content[sampling[0]:sampling[1]])
+
+    if sampFreq is None or len(dimensions) < 2:
+        return None
+
+    return sampFreq, dimensions[0][1], dimensions[1][0]
+
+
+def readOvMetadata(ovFile, chunkSize=16384, maxSize=4*1024*1024):
+    # ----------
+    # Get sampling frequency and electrode list of an .ov file, from the header
+    # of its signal stream. Only reads the beginning of the file (chunkSize bytes,
+    # then more if needed, up to maxSize).
+    # Returns (None, None) if no signal header could be found
+    # (compressed file, unknown format...)
+    # ----------
+    data = b""
+    with open(ovFile, "rb") as f:
+        while len(data) < maxSize:
+            newData = f.read(chunkSize)
+            if not newData:
+                break
+            data += newData
+            chunkSize *= 2
+
+            signalIndex = None
+            for nodeId, start, stop in iterNodes(data):
+                if nodeId == OVP_NodeId_OpenViBEStream_Header:
+                    compression, streamTypes = parseStreamHeader(data, start, stop)
+                    if compression or OV_TypeId_Signal not in streamTypes:
+                        return None, None
+                    signalIndex = streamTypes.index(OV_TypeId_Signal)
+                elif nodeId == OVP_NodeId_OpenViBEStream_Buffer and signalIndex is not None:
+                    streamIndex, startTime, endTime, content = parseStreamBuffer(data, start, stop)
+                    if streamIndex == signalIndex and content is not None:
+                        header = parseSignalHeader(content)
+                        if header:
+                            sampFreq, electrodeList, samplesPerChunk = header
+                            return int(sampFreq), electrodeList
+
+    return None, None
+
+
+# ----------
+# Streaming decoder: full signal and stimulation streams
+# ----------
+def readFileVarInt(f):
+    # Same as readVarInt, reading from a file object
+    first = f.read(1)
+    if not first:
+        return None
+    data = bytearray(first)
+    while data[-1] == 0:
+        nextByte = f.read(1)
+        if not nextByte:
+            return None
+        data += nextByte
+    value, length = readVarInt(data, 0)
+    while value is None:
+        nextByte = f.read(1)
+        if not nextByte:
+            return None
+        data += nextByte
+        value, length = readVarInt(data, 0)
+    return value
+
+
+def iterFileNodes(f):
+    # ----------
+    # Iterate over the top level nodes of an .ov file, without loading it
+    # Yields (identifier, content size), with the file positioned at the start
+    # of the content. The content is skipped if the caller didn't read it.
+    # ----------
+    while True:
+        nodeId = readFileVarInt(f)
+        if nodeId is None:
+            return
+        size = readFileVarInt(f)
+        if size is None:
+            return
+        start = f.tell()
+        yield nodeId, size
+        f.seek(start + size)
+
+
+def iterOvBuffers(f):
+    # ----------
+    # Iterate over all the chunks of an .ov file
+    # Yields (stream types, stream index, start time, end time, content)
+    # ----------
+    streamTypes = []
+    for nodeId, size in iterFileNodes(f):
+        data = f.read(size)
+        if nodeId == OVP_NodeId_OpenViBEStream_Header:
+            compression, streamTypes = parseStreamHeader(data, 0, len(data))
+            if compression:
+                raise ValueError("Compressed .ov streams are not supported")
+        elif nodeId == OVP_NodeId_OpenViBEStream_Buffer:
+            streamIndex, startTime, endTime, content = parseStreamBuffer(data, 0, len(data))
+            yield streamTypes, streamIndex, startTime, endTime, content
+
+
+def parseSignalBuffer(content, nbChannels):
+    # Content of a signal stream Buffer: raw matrix of doubles, channels x samples
+    buffer = findNode(content, OVTK_NodeId_Buffer)
+    if not buffer:
+        return None
+    matrix = findNode(content, OVTK_NodeId_Buffer_StreamedMatrix, buffer[0], buffer[1])
+    if not matrix:
+        return None
+    raw = findNode(content, OVTK_NodeId_Buffer_StreamedMatrix_RawBuffer, matrix[0], matrix[1])
+    if not raw:
+        return None
+    return np.frombuffer(content[raw[0]:raw[1]], dtype="<f8").reshape(nbChannels, -1)
+
+
+def parseStimulationBuffer(content):
+    # Content of a stimulation stream Buffer: list of (date, identifier, duration)
+    stims = []
+    buffer = findNode(content, OVTK_NodeId_Buffer)
+    if not buffer:
+        return stims
+    stimBuffer = findNode(content, OVTK_NodeId_Buffer_Stimulation, buffer[0], buffer[1])
+    if not stimBuffer:
+        return stims
+    for nodeId, start, stop in iterNodes(content, stimBuffer[0], stimBuffer[1]):
+        if nodeId != OVTK_NodeId_Buffer_Stimulation_Stimulation:
+            continue
+        date, code, duration = 0.0, 0, 0.0
+        for childId, childStart, childStop in iterNodes(content, start, stop):
+            if childId == OVTK_NodeId_Buffer_Stimulation_Stimulation_Identifier:
+                code = decodeUInt(content[childStart:childStop])
+            elif childId == OVTK_NodeId_Buffer_Stimulation_Stimulation_Date:
+                date = decodeTime(content[childStart:childStop])
+            elif childId == OVTK_NodeId_Buffer_Stimulation_Stimulation_Duration:
+                duration = decodeTime(content[childStart:childStop])
+        stims.append((date, code, duration))
+    return stims
+
+
+# Table of stimulations of a decoded signal
+stimulationDtype = np.dtype([("date", "<f8"), ("code", "<u8"), ("duration", "<f8")])
+
+
+def decodedFilenames(ovFile, outFolder):
+    basename = os.path.basename(ovFile).removesuffix(".ov")
+    signalNpy = os.path.join(outFolder, str(basename + "-SIGNAL.npy"))
+    stimsNpy = os.path.join(outFolder, str(basename + "-STIMS.npy"))
+    infoJson = os.path.join(outFolder, str(basename + "-SIGNAL.json"))
+    return signalNpy, stimsNpy, infoJson
+
+
+def decodeOvFile(ovFile, outFolder):
+    # ----------
+    # Decode the signal and stimulation streams of an .ov file, chunk per chunk:
+    #   <name>-SIGNAL.npy : float32 array (channels x samples), to be memory-mapped
+    #   <name>-STIMS.npy : stimulations (date, code, duration), dates relative to the first sample
+    #   <name>-SIGNAL.json : sampling frequency, channel names, start time
+    # First pass only counts the samples, to allocate the .npy file,
+    # second pass decodes the chunks directly into it.
+    # Returns the paths of the 3 files, or None if no signal stream was found
+    # ----------
+    os.makedirs(outFolder, exist_ok=True)
+    signalNpy, stimsNpy, infoJson = decodedFilenames(ovFile, outFolder)
+
+    # FIRST PASS : signal header and number of samples
+    header = None
+    nbSamples = 0
+    startTime = None
+    with open(ovFile, "rb") as f:
+        for streamTypes, streamIndex, chunkStart, chunkEnd, content in iterOvBuffers(f):
+            if content is None or streamIndex >= len(streamTypes) or streamTypes[streamIndex] != OV_TypeId_Signal:
+                continue
+            if header is None:
+                header = parseSignalHeader(content)
+            else:
+                matrix = parseSignalBuffer(content, len(header[1]))
+                if matrix is not None:
+                    if startTime is None:
+                        startTime = chunkStart
+                    nbSamples += matrix.shape[1]
+
+    if header is None:
+        return None
+    sampFreq, electrodeList, samplesPerChunk = header
+    if startTime is None:
+        startTime = 0.0
+
+    # SECOND PASS : write samples and collect stimulations
+    signal = np.lib.format.open_memmap(signalNpy, mode="w+", dtype=np.float32,
+                                       shape=(len(electrodeList), nbSamples))
+    stims = []
+    idxSample = 0
+    with open(ovFile, "rb") as f:
+        for streamTypes, streamIndex, chunkStart, chunkEnd, content in iterOvBuffers(f):
+            if content is None or streamIndex >= len(streamTypes):
+                continue
+            if streamTypes[streamIndex] == OV_TypeId_Signal:
+                matrix = parseSignalBuffer(content, len(electrodeList))
+                if matrix is not None and idxSample < nbSamples:
+                    signal[:, idxSample:idxSample + matrix.shape[1]] = matrix
+                    idxSample += matrix.shape[1]
+            elif streamTypes[streamIndex] == OV_TypeId_Stimulations:
+                stims += parseStimulationBuffer(content)
+    signal.flush()
+    del signal
+
+    stimTable = np.array([(date - startTime, code, duration) for date, code, duration in stims],
+                         dtype=stimulationDtype)
+    np.save(stimsNpy, stimTable)
+
+    with open(infoJson, "w") as outfile:
+        json.dump({"sampFreq": int(sampFreq), "electrodeList": electrodeList, "startTime": startTime}, outfile, indent=4)
+
+    return signalNpy, stimsNpy, infoJson
+
+
+def loadDecodedSignal(ovFile, outFolder):
+    # ----------
+    # Load a signal decoded with decodeOvFile. The signal is memory-mapped (read only),
+    # so slicing it (see signalWindow / stimulationWindows) doesn't copy anything.
+    # Returns (signal, stimulations, sampFreq, electrodeList), or None if not decoded
+    # ----------
+    signalNpy, stimsNpy, infoJson = decodedFilenames(ovFile, outFolder)
+    if not (os.path.exists(signalNpy) and os.path.exists(stimsNpy) and os.path.exists(infoJson)):
+        return None
+    with open(infoJson) as jsonfile:
+        info = json.load(jsonfile)
+    signal = np.load(signalNpy, mmap_mode="r")
+    stims = np.load(stimsNpy)
+    return signal, stims, info["sampFreq"], info["electrodeList"]
+
+
+def signalWindow(signal, sampFreq, tmin, tmax):
+    # View on the samples between tmin and tmax (in seconds)
+    return signal[:, int(round(tmin * sampFreq)):int(round(tmax * sampFreq))]
+
+
+def stimulationWindows(signal, sampFreq, stims, code, tmin, tmax):
+    # Views on the samples between tmin and tmax (in seconds) around every stimulation "code"
+    windows = []
+    for date in stims["date"][stims["code"] == int(code)]:
+        start = int(round((date + tmin) * sampFreq))
+        stop = start + int(round((tmax - tmin) * sampFreq))
+        if start >= 0 and stop <= signal.shape[1]:
+            windows.append(signal[:, start:stop])
+    return windows
@@ -0,0 +1,1105 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from shutil import copyfile
+from itertools import chain, combinations
+
+from featureExtractUtils import *
+from modifyOpenvibeScen import *
+from mergeRunsCsv import mergeRunsCsv
+from extractMetaData import getMetadataBatch
+from extractionPool import extractionOutputs, extractionParameters, prepareExtractionScenario, runExtractionJob, runJobPool
+from nativeExtraction import runNativeExtractionJob, loadTrialsCsv, arCacheFilename, windowsMvarModels
+from mergeRunsCsv import stimulationCodes
+from Spectral_Analysis import Power_filter_bank, Power_calculation_multitaper
+from Connectivity_Analysis import Connectivity_calculation, Mvar_connectivity_models, Node_strength
+from designerSupervisor import runDesigner
+from extractionCache import loadManifest, saveManifest, signalHash, isUpToDate, invalidateOutputs, recordExtraction, outputPath
+from jobQueue import openJobQueue, fileSignature, batchId, enqueueJobs, setJobStatus, doneJobs
+from jobQueue import unfinishedBatches, removeBatch
+from jobQueue import statusRunning, statusDone, statusFailed
+from recordingWatcher import completedRecordings, recordingStates, recordAttempts
+from resourceMonitor import estimateExtractionFootprint, estimateTrainingFootprint, waitForCapacity
+
+import bcipipeline_settings as settings
+
+# ------------------------------------------------------
+# Steps of the pipeline, without any GUI: used by the Qt
+# interfaces (in their threads) and by the command line runner.
+# progress() / progressText(text) are optional callbacks, to
+# follow the progress of a step (eg. progress bar)
+# ------------------------------------------------------
+
+
+def myPowerset(iterable):
+    s = list(iterable)
+    return chain.from_iterable(combinations(s, r) for r in range(1, len(s)+1))
+
+
+def noProgress(*args):
+    return
+
+
+def removeWorkFiles(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return
+
+
+def generateScenarios(templateFolder, generatedFolder, pipelineKey, ovScript, acqParamDict=None):
+    # ----------
+    # Create the parameter dictionary (acquisition params, with default values
+    # for those not provided, + default extraction params), write it
+    # in params.json, and generate the scenarios from the templates
+    # Returns the parameter dictionary
+    # ----------
+    parameterDict = {"pipelineType": pipelineKey}
+    for param, value in settings.pipelineAcqSettings[pipelineKey].items():
+        parameterDict[param] = str(value)
+        if acqParamDict and param in acqParamDict:
+            parameterDict[param] = str(acqParamDict[param])
+    parameterDict["ovDesignerPath"] = ovScript
+
+    # Write default parameters for selected pipeline
+    extractParamDict = settings.pipelineExtractSettings[pipelineKey].copy()
+    for idx, (key, val) in enumerate(extractParamDict.items()):
+        parameterDict[key] = str(val)
+
+    print(parameterDict)
+
+    # WRITE JSON PARAMETERS FILE
+    os.makedirs(os.path.join(generatedFolder, "signals", "analysis"), exist_ok=True)
+    os.makedirs(os.path.join(generatedFolder, "signals", "training"), exist_ok=True)
+    jsonfullpath = os.path.join(generatedFolder, "params.json")
+    with open(jsonfullpath, "w") as outfile:
+        json.dump(parameterDict, outfile, indent=4)
+
+    # GENERATE (list of files in settings.templateScenFilenames)
+    #   SC1 (ACQ/MONITOR)
+    #   SC2 (FEATURE EXT)
+    #   SC2 (TRAIN)
+    #   SC3 (ONLINE)
+    for filename in settings.templateScenFilenames:
+        srcFile = os.path.join(templateFolder, filename)
+        destFile = os.path.join(generatedFolder, filename)
+        print("---Copying file " + srcFile + " to " + destFile)
+        copyfile(srcFile, destFile)
+        if "xml" in destFile:
+            modifyScenarioGeneralSettings(destFile, parameterDict)
+
+    # SPECIAL CASES :
+    #   SC1 & SC3 : "GRAZ" BOX SETTINGS
+    modifyAcqScenario(os.path.join(generatedFolder, settings.templateScenFilenames[0]), parameterDict, False)
+    modifyAcqScenario(os.path.join(generatedFolder, settings.templateScenFilenames[3]), parameterDict, True)
+
+    return parameterDict
+
+
+def extractSessions(ovScript, scenFile, signalFiles, signalFolder, parameterDict,
+                    nbJobs=None, engine="openvibe", progress=None, sessionOver=None):
+    # ----------
+    # Extract features (spectra, baselines, trials) from a list of signal files
+    # of signalFolder, with sc2-extract.xml (scenFile) or in Python (engine "native").
+    # progress() is called once per signal file, and sessionOver(signalFile, success)
+    # once its outputs are extracted (or up to date), or its extraction failed.
+    # Returns (success, error message)
+    # ----------
+    progress = progress or noProgress
+    sessionOver = sessionOver or noProgress
+    manifest = loadManifest(signalFolder)
+
+    # Record the batch of sessions to extract in the job queue. If the same
+    # batch was interrupted (crash...), only the remaining sessions are extracted
+    queue = openJobQueue(os.path.dirname(signalFolder))
+    queueJobs = [(signalFile, fileSignature(os.path.join(signalFolder, signalFile)))
+                 for signalFile in signalFiles]
+    batch = batchId("extraction", queueJobs, [parameterDict, engine])
+    enqueueJobs(queue, batch, "extraction", queueJobs, parameterDict,
+                {"signalFiles": signalFiles, "parameterDict": parameterDict, "engine": engine})
+    done = doneJobs(queue, batch)
+
+    remainingFiles = []
+    for signalFile in signalFiles:
+        outputs = extractionOutputs(signalFile, parameterDict)
+        if signalFile in done and all(os.path.exists(os.path.join(signalFolder, outputPath(outputId, name)))
+                                      for outputId, name in outputs.items()):
+            print("---Already extracted in this batch: " + signalFile)
+            sessionOver(signalFile, True)
+            progress()
+            continue
+        remainingFiles.append(signalFile)
+
+    jobs = []
+    jobInfo = {}
+    footprints = {}
+    # Get sampling frequency and electrode list for all selected files,
+    # from the header of the .ov files, or from their metadata files
+    # (missing ones are generated in a single designer run)
+    metadata = getMetadataBatch([os.path.join(signalFolder, signalFile) for signalFile in remainingFiles], ovScript)
+    for signalFile in remainingFiles:
+        sampFreq, electrodeList = metadata[os.path.join(signalFolder, signalFile)]
+        # Check everything went ok...
+        if not sampFreq:
+            queue.close()
+            errMsg = str("Error while loading metadata CSV file for session " + signalFile)
+            return False, errMsg
+
+        # Skip the session if its outputs were already extracted from
+        # the same signal, with the same parameters and engine
+        jobParamDict = extractionParameters(parameterDict, sampFreq, electrodeList)
+        outputs = extractionOutputs(signalFile, jobParamDict)
+        digest = signalHash(signalFolder, signalFile, manifest)
+        if isUpToDate(manifest, signalFolder, digest, jobParamDict, outputs, engine):
+            print("---Outputs up to date for " + signalFile + ", skipping extraction")
+            setJobStatus(queue, batch, signalFile, statusDone)
+            sessionOver(signalFile, True)
+            progress()
+            continue
+        invalidateOutputs(manifest, signalFolder, outputs)
+
+        if engine == "native":
+            # Decode and extract in Python, in worker processes
+            jobs.append((signalFile, runNativeExtractionJob, (signalFolder, signalFile, parameterDict)))
+        else:
+            # Each session gets its own copy of the extraction scenario,
+            # with entered parameters and its own input/output files
+            jobScenFile, jobParamDict = prepareExtractionScenario(scenFile, signalFile, parameterDict,
+                                                                  sampFreq, electrodeList)
+            jobs.append((signalFile, runExtractionJob, (ovScript, jobScenFile)))
+        jobInfo[signalFile] = (digest, jobParamDict, outputs)
+        footprints[signalFile] = estimateExtractionFootprint(os.path.join(signalFolder, signalFile), sampFreq,
+                                                             len(electrodeList), jobParamDict, engine)
+        setJobStatus(queue, batch, signalFile, statusRunning)
+
+    saveManifest(signalFolder, manifest)
+
+    failedFiles = []
+
+    def jobDone(signalFile, result):
+        digest, jobParamDict, outputs = jobInfo[signalFile]
+        # Designer jobs return the status of their run ("finished", "timeout",
+        # "stalled", "stopped"...), native jobs their outputs (None if failed)
+        if engine == "native":
+            status = "finished" if result is not None else "failed"
+        else:
+            status = result
+        if status == "finished":
+            recordExtraction(manifest, signalFolder, digest, jobParamDict, outputs, engine)
+        else:
+            # Outputs of an interrupted run may be partial
+            invalidateOutputs(manifest, signalFolder, outputs)
+        saveManifest(signalFolder, manifest)
+        # Failed jobs stay in the queue, to be retried next time
+        if status == "finished" and isUpToDate(manifest, signalFolder, digest, jobParamDict, outputs, engine):
+            setJobStatus(queue, batch, signalFile, statusDone)
+            sessionOver(signalFile, True)
+        else:
+            print("---Extraction failed for " + signalFile + " (" + str(status) + ")")
+            setJobStatus(queue, batch, signalFile, statusFailed)
+            failedFiles.append(signalFile)
+            sessionOver(signalFile, False)
+        progress()
+
+    # Run the extraction jobs, multiple sessions at once
+    # when the machine has enough memory and CPU for them
+    try:
+        runJobPool(jobs, nbJobs, jobDone, useProcesses=(engine == "native"), footprints=footprints)
+    except Exception as e:
+        # A worker process died (eg. killed when out of memory): the jobs
+        # still running have no result, and stay in the queue as failed
+        doneFiles = doneJobs(queue, batch)
+        for signalFile in jobInfo:
+            if signalFile not in doneFiles and signalFile not in failedFiles:
+                invalidateOutputs(manifest, signalFolder, jobInfo[signalFile][2])
+                setJobStatus(queue, batch, signalFile, statusFailed)
+        saveManifest(signalFolder, manifest)
+        queue.close()
+        return False, str("Extraction interrupted: " + type(e).__name__ + ": " + str(e))
+    queue.close()
+
+    if failedFiles:
+        return False, str("Extraction failed for session(s): " + ", ".join(failedFiles))
+    return True, ""
+
+
+def watchSessions(ovScript, scenFile, signalFolder, parameterDict, nbJobs=None, engine="openvibe",
+                  stableTime=5, pollInterval=2, stopRequested=None, maxAttempts=3):
+    # ----------
+    # Watch mode: extract new signal files of signalFolder as soon as their
+    # recording is over (see completedRecordings), until stopRequested() is True.
+    # The files already there are not extracted, and a file recorded again
+    # later on is extracted again. Failed extractions are tried again
+    # (up to maxAttempts times).
+    # ----------
+    states = {}
+    handled = recordingStates(signalFolder)
+    failures = {}
+    while not (stopRequested and stopRequested()):
+        newFiles = completedRecordings(signalFolder, states, stableTime, handled)
+        if newFiles:
+            print("---New recordings: " + ", ".join(newFiles))
+            pending = {signalFile: states[signalFile][:2] for signalFile in newFiles}
+            succeeded = []
+            success, errMsg = extractSessions(ovScript, scenFile, newFiles, signalFolder, parameterDict,
+                                              nbJobs, engine,
+                                              sessionOver=lambda f, ok: ok and succeeded.append(f))
+            if not success:
+                print(errMsg)
+            for signalFile in recordAttempts(pending, succeeded, handled, failures, maxAttempts):
+                print("---Giving up on " + signalFile + " until it changes")
+        time.sleep(pollInterval)
+    return
+
+
+def computeSpectralStats(signalFolder, spectrumFiles, parameterDict, progress=None, progressText=None):
+    # ----------
+    # Load the extracted spectra (both classes, and baselines) of a list of sessions,
+    # and compute the statistics used for visualization and feature selection
+    # (signed R² map, Wilcoxon map).
+    # For multiple runs, the trials from all files are concatenated.
+    # Returns a dictionary of results (electrodes in their original order), and
+    # an error message (results are None in case of error)
+    # ----------
+    progress = progress or noProgress
+    progressText = progressText or noProgress
+
+    dataNp1 = []
+    dataNp2 = []
+    dataNp1baseline = []
+    dataNp2baseline = []
+    listSampFreq = []
+    listElectrodeList = []
+    listFreqBins = []
+    idxFile = 0
+
+    for selectedSpectra in spectrumFiles:
+        idxFile += 1
+        class1label = parameterDict["Class1"]
+        class2label = parameterDict["Class2"]
+        selectedBasename = selectedSpectra.removesuffix(str("-SPECTRUM"))
+
+        path1 = os.path.join(signalFolder, "analysis",
+                             str(selectedBasename + "-" + class1label + ".csv"))
+        path2 = os.path.join(signalFolder, "analysis",
+                             str(selectedBasename + "-" + class2label + ".csv"))
+        path1baseline = os.path.join(signalFolder, "analysis",
+                                     str(selectedBasename + "-" + class1label + "-BASELINE.csv"))
+        path2baseline = os.path.join(signalFolder, "analysis",
+                                     str(selectedBasename + "-" + class2label + "-BASELINE.csv"))
+
+        progressText(str("Loading Spectra for file " + str(idxFile)))
+        data1 = load_csv_cond(path1)
+        data2 = load_csv_cond(path2)
+        progressText(str("Loading Baselines for file " + str(idxFile)))
+        data1baseline = load_csv_cond(path1baseline)
+        data2baseline = load_csv_cond(path2baseline)
+
+        # Sampling frequency
+        # Infos in the columns header of the CSVs in format "Time:32x251:500"
+        # (Column zero contains starting time of the row)
+        # 32 is channels, 251 is freq bins, 500 is sampling frequency)
+        sampFreq1 = int(data1.columns.values[0].split(":")[-1])
+        sampFreq2 = int(data2.columns.values[0].split(":")[-1])
+        freqBins1 = int(data1.columns.values[0].split(":")[1].split("x")[1])
+        freqBins2 = int(data2.columns.values[0].split(":")[1].split("x")[1])
+        if sampFreq1 != sampFreq2 or freqBins1 != freqBins2:
+            errMsg = str("Error when loading " + path1 + "\n" + " and " + path2)
+            errMsg = str(errMsg + "\nSampling frequency or frequency bins mismatch")
+            errMsg = str(errMsg + "\n(" + str(sampFreq1) + " vs " + str(sampFreq2) + " or ")
+            errMsg = str(errMsg + str(freqBins1) + " vs " + str(freqBins2) + ")")
+            return None, errMsg
+
+        listSampFreq.append(sampFreq1)
+        listFreqBins.append(freqBins1)
+
+        elecTemp1 = data1.columns.values[2:-3]
+        elecTemp2 = data2.columns.values[2:-3]
+        electrodeList1 = []
+        electrodeList2 = []
+        for i in range(0, len(elecTemp1), freqBins1):
+            electrodeList1.append(elecTemp1[i].split(":")[0])
+            electrodeList2.append(elecTemp2[i].split(":")[0])
+
+        if electrodeList1 != electrodeList2:
+            errMsg = str("Error when loading " + path1 + "\n" + " and " + path2)
+            errMsg = str(errMsg + "\nElectrode List mismatch")
+            return None, errMsg
+
+        listElectrodeList.append(electrodeList1)
+
+        dataNp1.append(data1.to_numpy())
+        dataNp2.append(data2.to_numpy())
+        dataNp1baseline.append(data1baseline.to_numpy())
+        dataNp2baseline.append(data2baseline.to_numpy())
+
+        progress()
+
+    # Check if all files have the same sampling freq and electrode list. If not, for now, we don't process further
+    if not all(freqsamp == listSampFreq[0] for freqsamp in listSampFreq):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Sampling frequency mismatch (" + str(listSampFreq) + ")")
+        return None, errMsg
+    else:
+        print("Sampling Frequency for selected files : " + str(listSampFreq[0]))
+
+    if not all(electrodeList == listElectrodeList[0] for electrodeList in listElectrodeList):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Electrode List mismatch")
+        return None, errMsg
+    else:
+        print("Sensor list for selected files : " + ";".join(listElectrodeList[0]))
+
+    if not all(freqBins == listFreqBins[0] for freqBins in listFreqBins):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Not same number of frequency bins (" + str(listSampFreq) + ")")
+        return None, errMsg
+    else:
+        print("Frequency bins: " + str(listFreqBins[0]))
+
+    # ----------
+    # Compute the features used for visualization
+    # ----------
+    trialLength = float(parameterDict["StimulationEpoch"])
+    electrodeList = listElectrodeList[0]
+    nbElectrodes = len(electrodeList)
+    n_bins = listFreqBins[0]
+    winLen = float(parameterDict["TimeWindowLength"])
+    winShift = float(parameterDict["TimeWindowShift"])
+
+    # electrodes_orig = channel_generator(nbElectrodes, 'TP9', 'TP10')
+    electrodes_orig = elecGroundRef(electrodeList, 'TP9', 'TP10')
+    if not electrodes_orig:
+        errMsg = str("Problem with the list of electrodes...")
+        return None, errMsg
+
+    # For multiple runs (ie. multiple selected CSV files), we just concatenate
+    # the trials from all files. Then the displayed spectral features (R²map, PSD, topography)
+    # will be computed as averages over all the trials.
+    power_cond1_final = None
+    power_cond2_final = None
+    power_cond1_baseline_final = None
+    power_cond2_baseline_final = None
+    timefreq_cond1_final = None
+    timefreq_cond2_final = None
+    timefreq_cond1_baseline_final = None
+    timefreq_cond2_baseline_final = None
+    idxFile = 0
+    for run in range(len(dataNp1)):
+        idxFile += 1
+        progressText(str("Processing data for file " + str(idxFile)))
+        power_cond1, timefreq_cond1 = \
+            Extract_CSV_Data(dataNp1[run], trialLength, nbElectrodes, n_bins, winLen, winShift)
+        power_cond2, timefreq_cond2 = \
+            Extract_CSV_Data(dataNp2[run], trialLength, nbElectrodes, n_bins, winLen, winShift)
+        power_cond1_baseline, timefreq_cond1_baseline = \
+            Extract_CSV_Data(dataNp1baseline[run], trialLength, nbElectrodes, n_bins, winLen, winShift)
+        power_cond2_baseline, timefreq_cond2_baseline = \
+            Extract_CSV_Data(dataNp2baseline[run], trialLength, nbElectrodes, n_bins, winLen, winShift)
+
+        if power_cond1_final is None:
+            power_cond1_final = power_cond1
+            power_cond2_final = power_cond2
+            power_cond1_baseline_final = power_cond1_baseline
+            power_cond2_baseline_final = power_cond2_baseline
+            timefreq_cond1_final = timefreq_cond1
+            timefreq_cond2_final = timefreq_cond2
+            timefreq_cond1_baseline_final = timefreq_cond1_baseline
+            timefreq_cond2_baseline_final = timefreq_cond2_baseline
+        else:
+            power_cond1_final = np.concatenate((power_cond1_final, power_cond1))
+            power_cond2_final = np.concatenate((power_cond2_final, power_cond2))
+            power_cond1_baseline_final = np.concatenate((power_cond1_baseline_final, power_cond1_baseline))
+            power_cond2_baseline_final = np.concatenate((power_cond2_baseline_final, power_cond2_baseline))
+            timefreq_cond1_final = np.concatenate((timefreq_cond1_final, timefreq_cond1))
+            timefreq_cond2_final = np.concatenate((timefreq_cond2_final, timefreq_cond2))
+            timefreq_cond1_baseline_final = np.concatenate((timefreq_cond1_baseline_final, timefreq_cond1_baseline),
+                                                           axis=2)
+            timefreq_cond2_baseline_final = np.concatenate((timefreq_cond2_baseline_final, timefreq_cond2_baseline),
+                                                           axis=2)
+
+    progressText("Computing statistics")
+
+    windowLength = float(parameterDict["TimeWindowLength"])
+    windowShift = float(parameterDict["TimeWindowShift"])
+    segmentsPerTrial = round((trialLength - windowLength) / windowShift)
+    fres = float(parameterDict["FreqRes"])
+
+    timeVectAtomic = [0]
+    for i in range(segmentsPerTrial - 1):
+        timeVectAtomic.append((i + 1) * windowShift)
+    timeVectAtomic = np.array(timeVectAtomic)
+
+    # Statistical Analysis
+    freqs_array = np.arange(0, n_bins, fres)
+
+    Rsigned = Compute_Rsquare_Map_Welch(power_cond2_final[:, :, :(n_bins - 1)],
+                                        power_cond1_final[:, :, :(n_bins - 1)])
+    Wsquare, Wpvalues = Compute_Wilcoxon_Map(power_cond2_final[:, :, :(n_bins - 1)],
+                                             power_cond1_final[:, :, :(n_bins - 1)])
+
+    results = {"samplingFreq": listSampFreq[0],
+               "electrodes_orig": electrodes_orig,
+               "power_cond1": power_cond1_final,
+               "power_cond2": power_cond2_final,
+               "timefreq_cond1": timefreq_cond1_final,
+               "timefreq_cond2": timefreq_cond2_final,
+               "time_array": timeVectAtomic,
+               "freqs_array": freqs_array,
+               "fres": fres,
+               "Rsigned": Rsigned,
+               "Wsquare": Wsquare,
+               "Wpvalues": Wpvalues,
+               "average_baseline_cond1": np.mean(power_cond1_baseline_final, axis=0),
+               "std_baseline_cond1": np.std(power_cond1_baseline_final, axis=0),
+               "average_baseline_cond2": np.mean(power_cond2_baseline_final, axis=0),
+               "std_baseline_cond2": np.std(power_cond2_baseline_final, axis=0)}
+
+    return results, ""
+
+
+def computeConnectivityStats(signalFolder, trialsFiles, parameterDict, progress=None, progressText=None):
+    # ----------
+    # Connectivity pipeline: compute the connectivity (ConnectivityMetric, MSC, IMCOH,
+    # or PDC / DTF from MVAR models of order AutoRegressiveOrderTime) between all pairs
+    # of channels for all trials of a list of sessions (-TRIALS.csv files),
+    # and the statistics between both classes (signed R² map, Wilcoxon map) on the
+    # node strength of each channel (mean connectivity with all other channels;
+    # for PDC / DTF, the mean flow from all other channels).
+    # MVAR models are kept in signals/decoded, like the AR models of the native extraction.
+    # For multiple runs, the trials from all files are concatenated.
+    # Returns a dictionary of results, and an error message (results are None in case of error)
+    # ----------
+    progress = progress or noProgress
+    progressText = progressText or noProgress
+
+    metric = parameterDict["ConnectivityMetric"]
+    conn_cond1 = []
+    conn_cond2 = []
+    listSampFreq = []
+    listElectrodeList = []
+    idxFile = 0
+    for trialsFile in trialsFiles:
+        idxFile += 1
+        progressText(str("Computing connectivity for file " + str(idxFile)))
+        path = os.path.join(signalFolder, "training", trialsFile)
+        epochs, classes, sampFreq, electrodeList = loadTrialsCsv(path)
+        listSampFreq.append(sampFreq)
+        listElectrodeList.append(electrodeList)
+
+        nPerSeg = timeToSamples(float(parameterDict["ConnectivityLength"]), sampFreq)
+        nOverlap = int(nPerSeg * float(parameterDict["ConnectivityOverlap"]) / 100)
+        nfft = max(int(parameterDict["FftSize"]), nPerSeg)
+        if nPerSeg > epochs.shape[2]:
+            errMsg = str("Connectivity length (" + str(parameterDict["ConnectivityLength"]) + "s) ")
+            errMsg = str(errMsg + "is longer than the trials of " + trialsFile)
+            return None, errMsg
+        if metric in ["PDC", "DTF"]:
+            mvarOrder = timeToSamples(float(parameterDict["AutoRegressiveOrderTime"]), sampFreq)
+            cacheFolder = os.path.join(signalFolder, "decoded")
+            os.makedirs(cacheFolder, exist_ok=True)
+            cacheFile = arCacheFilename(cacheFolder, trialsFile.removesuffix("-TRIALS.csv"),
+                                        ["MVAR", fileSignature(path), nPerSeg, nPerSeg - nOverlap,
+                                         mvarOrder, settings.mvarMethod])
+            A, Sigma = windowsMvarModels(epochs, nPerSeg, nPerSeg - nOverlap, mvarOrder, cacheFile,
+                                         settings.mvarMethod)
+            conn, freqs = Mvar_connectivity_models(A, sampFreq, nfft, metric)
+        else:
+            conn, freqs = Connectivity_calculation(epochs, sampFreq, nPerSeg, nOverlap, nfft, metric)
+
+        classes = np.array(classes)
+        conn_cond1.append(conn[classes == stimulationCodes["OVTK_GDF_Left"]])
+        conn_cond2.append(conn[classes == stimulationCodes["OVTK_GDF_Right"]])
+        progress()
+
+    if not all(freqsamp == listSampFreq[0] for freqsamp in listSampFreq):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Sampling frequency mismatch (" + str(listSampFreq) + ")")
+        return None, errMsg
+    if not all(electrodeList == listElectrodeList[0] for electrodeList in listElectrodeList):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Electrode List mismatch")
+        return None, errMsg
+
+    conn_cond1 = np.concatenate(conn_cond1)
+    conn_cond2 = np.concatenate(conn_cond2)
+
+    progressText("Computing statistics")
+    # (IMCOH is signed, and antisymmetric: strengths use its absolute value.
+    # PDC / DTF [i,j] is the flow from j to i: strengths are inflows)
+    strength_cond1 = Node_strength(np.abs(conn_cond1))
+    strength_cond2 = Node_strength(np.abs(conn_cond2))
+    Rsigned = Compute_Rsquare_Map_Welch(strength_cond2, strength_cond1)
+    Wsquare, Wpvalues = Compute_Wilcoxon_Map(strength_cond2, strength_cond1)
+
+    results = {"samplingFreq": listSampFreq[0],
+               "electrodes": listElectrodeList[0],
+               "metric": metric,
+               "freqs_array": freqs,
+               "conn_cond1": np.mean(conn_cond1, axis=0),
+               "conn_cond2": np.mean(conn_cond2, axis=0),
+               "strength_cond1": strength_cond1,
+               "strength_cond2": strength_cond2,
+               "Rsigned": Rsigned,
+               "Wsquare": Wsquare,
+               "Wpvalues": Wpvalues}
+
+    return results, ""
+
+
+def computeBandPowerStats(signalFolder, trialsFiles, parameterDict, bands, progress=None, progressText=None):
+    # ----------
+    # Log band power of each trial, channel and frequency band (filter bank, see
+    # Power_filter_bank) from the -TRIALS.csv files of a list of sessions, over the
+    # whole trial and over the time windows of the extraction (TimeWindowLength /
+    # TimeWindowShift), and the statistics between both classes (signed R² map,
+    # Wilcoxon map) on the band powers.
+    # For multiple runs, the trials from all files are concatenated.
+    # Returns a dictionary of results, and an error message (results are None in case of error)
+    # ----------
+    progress = progress or noProgress
+    progressText = progressText or noProgress
+
+    power_cond1 = []
+    power_cond2 = []
+    timeband_cond1 = []
+    timeband_cond2 = []
+    listSampFreq = []
+    listElectrodeList = []
+    idxFile = 0
+    for trialsFile in trialsFiles:
+        idxFile += 1
+        progressText(str("Computing band powers for file " + str(idxFile)))
+        path = os.path.join(signalFolder, "training", trialsFile)
+        epochs, classes, sampFreq, electrodeList = loadTrialsCsv(path)
+        listSampFreq.append(sampFreq)
+        listElectrodeList.append(electrodeList)
+
+        for low, high in bands:
+            if not 0 < low < high < sampFreq / 2:
+                errMsg = str("Invalid frequency band " + str(low) + ":" + str(high))
+                errMsg = str(errMsg + " (sampling frequency " + str(sampFreq) + ")")
+                return None, errMsg
+        winLength = timeToSamples(float(parameterDict.get("TimeWindowLength", 0.25)), sampFreq)
+        winShift = timeToSamples(float(parameterDict.get("TimeWindowShift", 0.161)), sampFreq)
+        power, timeband, timeArray = Power_filter_bank(epochs, sampFreq, bands, winLength, winLength - winShift,
+                                                       settings.filterBankOrder)
+
+        classes = np.array(classes)
+        power_cond1.append(power[classes == stimulationCodes["OVTK_GDF_Left"]])
+        power_cond2.append(power[classes == stimulationCodes["OVTK_GDF_Right"]])
+        timeband_cond1.append(timeband[classes == stimulationCodes["OVTK_GDF_Left"]])
+        timeband_cond2.append(timeband[classes == stimulationCodes["OVTK_GDF_Right"]])
+        progress()
+
+    if not all(freqsamp == listSampFreq[0] for freqsamp in listSampFreq):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Sampling frequency mismatch (" + str(listSampFreq) + ")")
+        return None, errMsg
+    if not all(electrodeList == listElectrodeList[0] for electrodeList in listElectrodeList):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Electrode List mismatch")
+        return None, errMsg
+
+    power_cond1 = np.concatenate(power_cond1)
+    power_cond2 = np.concatenate(power_cond2)
+
+    progressText("Computing statistics")
+    Rsigned = Compute_Rsquare_Map_Welch(power_cond2, power_cond1)
+    Wsquare, Wpvalues = Compute_Wilcoxon_Map(power_cond2, power_cond1)
+
+    results = {"samplingFreq": listSampFreq[0],
+               "electrodes": listElectrodeList[0],
+               "bands": np.array(bands, dtype=float),
+               "power_cond1": power_cond1,
+               "power_cond2": power_cond2,
+               "timeband_cond1": np.concatenate(timeband_cond1),
+               "timeband_cond2": np.concatenate(timeband_cond2),
+               "time_array": timeArray,
+               "Rsigned": Rsigned,
+               "Wsquare": Wsquare,
+               "Wpvalues": Wpvalues}
+
+    return results, ""
+
+
+def computeMultitaperStats(signalFolder, trialsFiles, parameterDict, NW, progress=None, progressText=None):
+    # ----------
+    # Multitaper PSD of each trial and channel (see Power_calculation_multitaper,
+    # time-bandwidth product NW) from the -TRIALS.csv files of a list of sessions,
+    # in 1 Hz bins from 0 to sampFreq/2 (excluded) like the Welch spectra, and the
+    # statistics between both classes (signed R² map, Wilcoxon map) on the spectra.
+    # For multiple runs, the trials from all files are concatenated.
+    # Returns a dictionary of results, and an error message (results are None in case of error)
+    # ----------
+    progress = progress or noProgress
+    progressText = progressText or noProgress
+
+    power_cond1 = []
+    power_cond2 = []
+    listSampFreq = []
+    listElectrodeList = []
+    idxFile = 0
+    for trialsFile in trialsFiles:
+        idxFile += 1
+        progressText(str("Computing multitaper spectra for file " + str(idxFile)))
+        path = os.path.join(signalFolder, "training", trialsFile)
+        epochs, classes, sampFreq, electrodeList = loadTrialsCsv(path)
+        listSampFreq.append(sampFreq)
+        listElectrodeList.append(electrodeList)
+
+        # Whole trials, zero-padded to a multiple of 1 s, then smoothed to 1 Hz bins
+        nfft = int(sampFreq * np.ceil(epochs.shape[-1] / sampFreq))
+        power = Power_calculation_multitaper(epochs, sampFreq, nfft, NW, None, True)[0]
+
+        classes = np.array(classes)
+        power_cond1.append(power[classes == stimulationCodes["OVTK_GDF_Left"]])
+        power_cond2.append(power[classes == stimulationCodes["OVTK_GDF_Right"]])
+        progress()
+
+    if not all(freqsamp == listSampFreq[0] for freqsamp in listSampFreq):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Sampling frequency mismatch (" + str(listSampFreq) + ")")
+        return None, errMsg
+    if not all(electrodeList == listElectrodeList[0] for electrodeList in listElectrodeList):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Electrode List mismatch")
+        return None, errMsg
+    power_cond1 = np.concatenate(power_cond1)
+    power_cond2 = np.concatenate(power_cond2)
+
+    progressText("Computing statistics")
+    Rsigned = Compute_Rsquare_Map_Welch(power_cond2, power_cond1)
+    Wsquare, Wpvalues = Compute_Wilcoxon_Map(power_cond2, power_cond1)
+
+    results = {"samplingFreq": listSampFreq[0],
+               "electrodes": listElectrodeList[0],
+               "freqs_array": np.arange(power_cond1.shape[-1]),
+               "power_cond1": power_cond1,
+               "power_cond2": power_cond2,
+               "Rsigned": Rsigned,
+               "Wsquare": Wsquare,
+               "Wpvalues": Wpvalues}
+
+    return results, ""
+
+
+def checkSelectedFeats(featTexts, sampFreq, electrodeList):
+    # ----------
+    # Check the selected features, as texts "channel;freq" or "channel;freq1:freq2..."
+    # - No empty field
+    # - frequencies in acceptable ranges
+    # - channels in list
+    # Returns the list of [channel, freqs] pairs (None in case of error), and an error message
+    # ----------
+    selectedFeats = []
+    errMsg = ""
+    n_bins = int((sampFreq / 2) + 1)
+    for idx, featText in enumerate(featTexts):
+        if featText == "":
+            errMsg = str("Pair " + str(idx + 1) + " is empty...")
+            return None, errMsg
+        [chan, freqstr] = featText.split(";")
+        if chan not in electrodeList:
+            errMsg = str("Channel in pair " + str(idx + 1) + " (" + str(chan) + ") is not in the list...")
+            return None, errMsg
+        freqs = freqstr.split(":")
+        for freq in freqs:
+            if not freq.isdigit():
+                errMsg = str("Frequency in pair " + str(idx + 1) + " (" + str(freq) + ") has an invalid format, must be an integer...")
+                return None, errMsg
+            if int(freq) >= n_bins:
+                errMsg = str("Frequency in pair " + str(idx + 1) + " (" + str(freq) + ") is not in the acceptable range...")
+                return None, errMsg
+        selectedFeats.append(featText.split(";"))
+        print(featText)
+
+    return selectedFeats, errMsg
+
+
+def runClassifierScenario(ovScript, scenFile, stopRequested=None):
+    # ----------
+    # Run the classifier training scen (sc2-train.xml), using the provided parameters
+    # and features
+    # Returns a text with the classification scores, and the accuracy (None, None on failure)
+    # ----------
+
+    # TODO WARNING : MAYBE CHANGE THAT IN THE FUTURE...
+    # enableConfChange = False
+    # if enableConfChange:
+    #     # CHECK IF openvibe.conf has randomization of k-fold enabled
+    #     # if not, change it
+    #     confFile = os.path.join(os.path.dirname(ovScript), "share", "openvibe", "kernel", "openvibe.conf")
+    #     if platform.system() == 'Windows':
+    #         confFile = confFile.replace("/", "\\")
+    #     modifyConf = False
+    #     with open(confFile, 'r') as conf:
+    #         confdata = conf.read()
+    #         if "Plugin_Classification_RandomizeKFoldTestData = false" in confdata:
+    #             modifyConf = True
+    #             confdata = confdata.replace("Plugin_Classification_RandomizeKFoldTestData = false", "Plugin_Classification_RandomizeKFoldTestData = true")
+    #     if modifyConf:
+    #         with open(confFile, 'w') as conf:
+    #             conf.write(confdata)
+
+    # Run actual command (openvibe-designer.cmd --no-gui --play-fast <scen.xml>)
+    # Read console output to prompt user with classification score.
+    # (first element only marks the start of the cross-validation results)
+    scoreLines = []
+
+    def collectScore(output):
+        if "Cross-validation test" in output:
+            scoreLines.append("")
+        if scoreLines and "trainer>" in output:
+            scoreLines.append(output.split("trainer> ")[1])
+
+    status, outputLines = runDesigner(ovScript, scenFile, onOutput=collectScore, stopRequested=stopRequested)
+    if status != "finished" or len(scoreLines) < 5:
+        return None, None
+
+    classifierScoreStr = str("\n".join(scoreLines[1:]) + "\n\n")
+
+    lines = classifierScoreStr.splitlines()
+
+    target_1_True_Negative = float(lines[2].split()[2])
+    target_1_False_Positive = float(lines[2].split()[3])
+    target_2_False_Negative = float(lines[3].split()[2])
+    target_2_True_Positive = float(lines[3].split()[3])
+
+    precision_Class_1 = round(target_1_True_Negative/(target_1_True_Negative+target_2_False_Negative), 2)
+    sensitivity_Class_1 = round(target_1_True_Negative/(target_1_True_Negative+target_1_False_Positive), 2)
+    precision_Class_2 = round(target_2_True_Positive/(target_2_True_Positive+target_1_False_Positive), 2)
+    sensitivity_Class_2 = round(target_2_True_Positive/(target_2_True_Positive+target_2_False_Negative), 2)
+
+    accuracy = round(100.0*(target_1_True_Negative+target_2_True_Positive)/(target_1_True_Negative+target_1_False_Positive+target_2_False_Negative+target_2_True_Positive), 2)
+
+    F_1_Score_Class_1 = round(2*precision_Class_1*sensitivity_Class_1/(precision_Class_1+sensitivity_Class_1), 2)
+    F_1_Score_Class_2 = round(2*precision_Class_2*sensitivity_Class_2/(precision_Class_2+sensitivity_Class_2), 2)
+
+    messageClassif = "Overall accuracy : " + str(accuracy) + "%\n"
+    messageClassif += "Class 1 | Precision  : " + str(precision_Class_1) + " | " + "Sensitivity : " + str(sensitivity_Class_1)
+    messageClassif += " | F_1 Score : " + str(F_1_Score_Class_1) + "\n"
+    messageClassif += "Class 2 | Precision  : " + str(precision_Class_2) + " | " + "Sensitivity : " + str(sensitivity_Class_2)
+    messageClassif += " | F_1 Score : " + str(F_1_Score_Class_2)
+
+    return messageClassif, accuracy
+
+
+def runTrainingJob(ovScript, combScenFile, stopRequested=None):
+    # Train with the scenario of one combination of runs, then remove it
+    result = None, None
+    if not (stopRequested and stopRequested()):
+        result = runClassifierScenario(ovScript, combScenFile, stopRequested)
+    os.remove(combScenFile)
+    return result
+
+
+def trainClassifier(isCombinationComputing, trainingFiles, signalFolder, templateFolder, workFolder, ovScript,
+                    trainingSize, featTexts, parameterDict, progress=None, progressText=None, stopRequested=None):
+    # ----------
+    # Train the classifier (sc2-train-composite.xml) with the selected features
+    # (texts "channel;freq"), on the trials of all training files, or on all
+    # combinations of training files (isCombinationComputing) keeping the best one.
+    # The weights are copied in workFolder/generated/classifier-weights.xml
+    # Returns (success, text to display: scores, or error message)
+    # ----------
+    progress = progress or noProgress
+    progressText = progressText or noProgress
+
+    # Get electrodes lists and sampling freqs, and check that they match
+    # + that the selected channels are in the list of electrodes
+    compositeSigList = []
+    listSampFreq = []
+    listElectrodeList = []
+    for trainingFile in trainingFiles:
+        path = os.path.join(signalFolder, "training", trainingFile)
+        header = pd.read_csv(path, nrows=0).columns.tolist()
+        listSampFreq.append(int(header[0].split(':')[1].removesuffix('Hz')))
+        listElectrodeList.append(header[2:-3])
+        compositeSigList.append(path)
+
+    if not all(freqsamp == listSampFreq[0] for freqsamp in listSampFreq):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Sampling frequency mismatch (" + str(listSampFreq) + ")")
+        return False, errMsg
+    else:
+        print("Sampling Frequency for selected files : " + str(listSampFreq[0]))
+
+    if not all(electrodeList == listElectrodeList[0] for electrodeList in listElectrodeList):
+        errMsg = str("Error when loading CSV files\n")
+        errMsg = str(errMsg + "Electrode List mismatch")
+        return False, errMsg
+    else:
+        print("Sensor list for selected files : " + ";".join(listElectrodeList[0]))
+
+    selectedFeats, errMsg = checkSelectedFeats(featTexts, listSampFreq[0], listElectrodeList[0])
+    if not selectedFeats:
+        return False, errMsg
+
+    # RE-COPY sc2 & sc3 FROM TEMPLATE, SO THE USER CAN DO THIS MULTIPLE TIMES...
+    for i in [2, 3]:
+        scenName = settings.templateScenFilenames[i]
+        srcFile = os.path.join(templateFolder, scenName)
+        destFile = os.path.join(workFolder, "generated", scenName)
+        print("---Copying file " + srcFile + " to " + destFile)
+        copyfile(srcFile, destFile)
+        modifyScenarioGeneralSettings(destFile, parameterDict)
+        if i == 2:
+            modifyTrainScenario(selectedFeats, destFile)
+        elif i == 3:
+            modifyAcqScenario(destFile, parameterDict, True)
+            modifyOnlineScenario(selectedFeats, destFile)
+
+    scenFile = os.path.join(workFolder, "generated", settings.templateScenFilenames[2])
+    modifyTrainPartitions(trainingSize, scenFile)
+
+    # Record the training job(s) in the job queue. An interrupted search over
+    # all combinations of runs is resumed: combinations already trained
+    # (with their weights file still there) are not trained again.
+    queue = openJobQueue(os.path.join(workFolder, "generated"))
+    queueInputs = [fileSignature(path) for path in compositeSigList]
+    batch = batchId("training", queueInputs,
+                    [parameterDict, selectedFeats, trainingSize, isCombinationComputing])
+    resumeArguments = {"isCombinationComputing": isCombinationComputing, "trainingFiles": trainingFiles,
+                       "trainingSize": trainingSize, "featTexts": featTexts, "parameterDict": parameterDict}
+
+    # Create composite file from selected items
+    class1Stim = "OVTK_GDF_Left"
+    class2Stim = "OVTK_GDF_Right"
+    tmin = 0
+    tmax = float(parameterDict["StimulationEpoch"])
+
+    if not isCombinationComputing:
+        compositeCsv = mergeRunsCsv(compositeSigList, parameterDict["Class1"], parameterDict["Class2"],
+                                    class1Stim, class2Stim, tmin, tmax)
+        if not compositeCsv:
+            queue.close()
+            return False, "Error merging runs!! Most probably different list of electrodes"
+
+        progress()
+
+        print("Composite file for training: " + compositeCsv)
+        compositeCsvBasename = os.path.basename(compositeCsv)
+        newWeightsName = "classifier-weights.xml"
+        modifyTrainIO(compositeCsvBasename, newWeightsName, scenFile)
+
+        progressText("Running Training Scenario")
+
+        # RUN THE CLASSIFIER TRAINING SCENARIO
+        enqueueJobs(queue, batch, "training", [("all", queueInputs)], parameterDict, resumeArguments)
+        setJobStatus(queue, batch, "all", statusRunning)
+        # (standalone training: none of our jobs is running next to it)
+        waitForCapacity(estimateTrainingFootprint(compositeCsv), stopRequested, nbRunning=0)
+        classifierScoreStr, accuracy = runClassifierScenario(ovScript, scenFile, stopRequested)
+        if not classifierScoreStr:
+            setJobStatus(queue, batch, "all", statusFailed)
+            queue.close()
+            return False, "Error while running the training scenario"
+
+        # Copy weights file to generated/classifier-weights.xml
+        newWeights = os.path.join(signalFolder, "training", "classifier-weights.xml")
+        setJobStatus(queue, batch, "all", statusDone,
+                     {"scoreStr": classifierScoreStr, "score": accuracy, "weights": fileSignature(newWeights)})
+        origFilename = os.path.join(workFolder, "generated", "classifier-weights.xml")
+        copyfile(newWeights, origFilename)
+
+        # PREPARE GOODBYE MESSAGE...
+        textFeats = str("Using spectral features:\n")
+        for i in range(len(selectedFeats)):
+            textFeats += str("  Channel " + str(selectedFeats[i][0]) + " at " + str(selectedFeats[i][1]) + " Hz")
+
+        textGoodbye = str("Results written in file:\t generated/classifier-weights.xml\n")
+        textGoodbye += str("If those results are satisfying, you can now open generated/sc3-online.xml in the Designer")
+
+        textDisplay = textFeats
+        textDisplay += str("\n\n" + classifierScoreStr)
+        textDisplay += str("\n\n" + textGoodbye)
+
+    else:
+        # Create list of files from selected items
+        combinationsList = list(myPowerset(compositeSigList))
+        sigIdxList = range(len(compositeSigList))
+        combIdx = list(myPowerset(sigIdxList))
+        scores = [0 for x in range(len(combIdx))]
+        classifierScoreStrList = ["" for x in range(len(combIdx))]
+
+        enqueueJobs(queue, batch, "training",
+                    [(str(idxcomb), list(combIdx[idxcomb])) for idxcomb in range(len(combIdx))],
+                    parameterDict, resumeArguments)
+        done = doneJobs(queue, batch)
+
+        jobs = []
+        footprints = {}
+        workFiles = []
+        for idxcomb, comb in enumerate(combinationsList):
+            newWeightsName = str("classifier-weights-" + str(idxcomb) + ".xml")
+            newWeights = os.path.join(signalFolder, "training", newWeightsName)
+            result = done.get(str(idxcomb))
+            if result and os.path.exists(newWeights) and fileSignature(newWeights) == result["weights"]:
+                print("---Combination " + str(combIdx[idxcomb]) + " already trained in this batch")
+                classifierScoreStrList[idxcomb], scores[idxcomb] = result["scoreStr"], result["score"]
+                progress()
+                continue
+
+            sigList = []
+            for file in comb:
+                sigList.append(file)
+            compositeCsv = mergeRunsCsv(sigList, parameterDict["Class1"], parameterDict["Class2"],
+                                        class1Stim, class2Stim, tmin, tmax)
+            if not compositeCsv:
+                removeWorkFiles(workFiles)
+                queue.close()
+                return False, "Error merging runs!! Most probably different list of electrodes"
+
+            # Each combination gets its own composite file and copy of the
+            # training scenario, so that multiple combinations can be trained at once
+            combCsv = compositeCsv.replace(".csv", str("-" + str(idxcomb) + ".csv"))
+            os.replace(compositeCsv, combCsv)
+            print("Composite file for training: " + combCsv)
+            combScenFile = scenFile.replace(".xml", str("-" + str(idxcomb) + ".xml"))
+            copyfile(scenFile, combScenFile)
+            workFiles += [combCsv, combScenFile]
+            modifyTrainIO(os.path.basename(combCsv), newWeightsName, combScenFile)
+
+            jobs.append((idxcomb, runTrainingJob, (ovScript, combScenFile, stopRequested)))
+            footprints[idxcomb] = estimateTrainingFootprint(combCsv)
+            setJobStatus(queue, batch, str(idxcomb), statusRunning)
+
+        failedCombs = []
+
+        def jobDone(idxcomb, result):
+            classifierScoreStrList[idxcomb], scores[idxcomb] = result
+            if not classifierScoreStrList[idxcomb]:
+                setJobStatus(queue, batch, str(idxcomb), statusFailed)
+                failedCombs.append(idxcomb)
+                return
+            newWeights = os.path.join(signalFolder, "training", str("classifier-weights-" + str(idxcomb) + ".xml"))
+            setJobStatus(queue, batch, str(idxcomb), statusDone,
+                         {"scoreStr": classifierScoreStrList[idxcomb], "score": scores[idxcomb],
+                          "weights": fileSignature(newWeights)})
+            progressText(str("Combination " + str(combIdx[idxcomb]) + ": " + str(scores[idxcomb]) + "%"))
+            progress()
+
+        # RUN THE CLASSIFIER TRAINING SCENARIOS, multiple combinations at once
+        # when the machine has enough memory and CPU for them
+        # (per-combination composite files and scenarios are removed afterwards)
+        try:
+            runJobPool(jobs, settings.trainingNbJobs, jobDone, footprints=footprints)
+        finally:
+            removeWorkFiles(workFiles)
+
+        # Find max score, among the combinations that could be trained
+        trainedCombs = [idxcomb for idxcomb in range(len(combIdx)) if idxcomb not in failedCombs]
+        if not trainedCombs:
+            queue.close()
+            return False, "Error while running the training scenario (all combinations)"
+        maxIdx = max(trainedCombs, key=lambda idxcomb: scores[idxcomb])
+        # Copy weights file to generated/classifier-weights.xml
+        maxFilename = os.path.join(signalFolder, "training", "classifier-weights-")
+        maxFilename += str(str(maxIdx) + ".xml")
+        origFilename = os.path.join(workFolder, "generated", "classifier-weights.xml")
+        copyfile(maxFilename, origFilename)
+
+        # ==========================
+        # PREPARE GOODBYE MESSAGE...
+        textFeats = str("Using spectral features:\n")
+        for i in range(len(selectedFeats)):
+            textFeats += str("\tChannel " + str(selectedFeats[i][0]) + " at " + str(selectedFeats[i][1]) + " Hz\n")
+        textFeats += str("\n... and experiment runs:")
+        for i in range(len(compositeSigList)):
+            textFeats += str("\n\t[" + str(i) + "]: " + os.path.basename(compositeSigList[i]))
+
+        textScore = str("Training Cross-Validation Test Accuracies per combination:\n")
+        for i in range(len(combIdx)):
+            combIdxStr = []
+            for j in combIdx[i]:
+                combIdxStr.append(str(j))
+            if i in failedCombs:
+                textScore += str("\t[" + ",".join(combIdxStr) + "]: training failed\n")
+            else:
+                textScore += str("\t[" + ",".join(combIdxStr) + "]: " + str(scores[i]) + "%\n")
+        maxIdxStr = []
+        for j in combIdx[maxIdx]:
+            maxIdxStr.append(str(j))
+        textScore += str("\nMax is combination [" + ','.join(maxIdxStr) + "] with " + str(scores[maxIdx]) + "%\n")
+        if failedCombs:
+            textScore += str("(" + str(len(failedCombs)) + " combination(s) could not be trained, "
+                             + "see the resume step)\n")
+        textScore += classifierScoreStrList[maxIdx]
+
+        textGoodbye = str("The weights for this combination have been written to:\n")
+        textGoodbye += str("\tgenerated/classifier-weights.xml\n")
+        textGoodbye += str("If those results are satisfying, you can now open this scenario in the Designer:\n")
+        textGoodbye += str("\tgenerated/sc3-online.xml")
+
+        textDisplay = textFeats
+        textDisplay = str(textDisplay + "\n\n" + textScore)
+        textDisplay = str(textDisplay + "\n\n" + textGoodbye)
+
+    queue.close()
+    return True, textDisplay
+
+
+def interruptedBatches(workFolder):
+    # Extraction and training batches of a work folder left unfinished
+    # (GUI or machine crash, failed jobs), see resumeBatches
+    queue = openJobQueue(os.path.join(workFolder, "generated"))
+    batches = [("extraction", batch, arguments) for batch, arguments in unfinishedBatches(queue, "extraction")]
+    batches += [("training", batch, arguments) for batch, arguments in unfinishedBatches(queue, "training")]
+    queue.close()
+    return batches
+
+
+def resumeBatches(ovScript, workFolder, scriptFolder, nbJobs=None, progress=None, progressText=None,
+                  stopRequested=None):
+    # ----------
+    # Run again the unfinished extraction and training batches of a work folder,
+    # with the same sessions and parameters: their jobs already done are not
+    # run again. A batch whose inputs changed since is run as a new batch,
+    # and the interrupted one is forgotten once that one is over.
+    # Returns (success, text to display)
+    # ----------
+    progressText = progressText or noProgress
+    signalFolder = os.path.join(workFolder, "generated", "signals")
+    texts = []
+    allSuccess = True
+    for kind, batch, arguments in interruptedBatches(workFolder):
+        parameterDict = arguments["parameterDict"]
+        if kind == "extraction":
+            progressText(str("Resuming extraction of " + ", ".join(arguments["signalFiles"])))
+            missing = [signalFile for signalFile in arguments["signalFiles"]
+                       if not os.path.exists(os.path.join(signalFolder, signalFile))]
+            if missing:
+                success, text = False, str("Signal file(s) not found: " + ", ".join(missing))
+            else:
+                scenFile = os.path.join(workFolder, "generated", settings.templateScenFilenames[1])
+                success, text = extractSessions(ovScript, scenFile, arguments["signalFiles"], signalFolder,
+                                                parameterDict, nbJobs, arguments["engine"], progress)
+                text = text or str(str(len(arguments["signalFiles"])) + " session(s) extracted")
+        else:
+            progressText(str("Resuming training on " + ", ".join(arguments["trainingFiles"])))
+            missing = [trainingFile for trainingFile in arguments["trainingFiles"]
+                       if not os.path.exists(os.path.join(signalFolder, "training", trainingFile))]
+            if missing:
+                success, text = False, str("Training file(s) not found: " + ", ".join(missing))
+            else:
+                templateFolder = os.path.join(scriptFolder, settings.optionsTemplatesDir[parameterDict["pipelineType"]])
+                success, text = trainClassifier(arguments["isCombinationComputing"], arguments["trainingFiles"],
+                                                signalFolder, templateFolder, workFolder, ovScript,
+                                                arguments["trainingSize"], arguments["featTexts"], parameterDict,
+                                                progress, progressText, stopRequested)
+
+        # Inputs missing, or changed (the batch was run again as a new one): forget the interrupted batch
+        if missing or (success and batch in [b for k, b, a in interruptedBatches(workFolder)]):
+            queue = openJobQueue(os.path.join(workFolder, "generated"))
+            removeBatch(queue, batch)
+            queue.close()
+        texts.append(text)
+        allSuccess = allSuccess and success
+
+    if not texts:
+        return True, "No interrupted extraction or training"
+    return allSuccess, "\n\n".join(texts)
+
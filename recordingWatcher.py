@@ -0,0 +1,131 @@
+import os
+import time
+import platform
+
+
+def openFiles():
+    # ----------
+    # Set of the (real) paths of the files open in processes, from their
+    # open file descriptors (only those of the current user can be checked).
+    # None if that can't be known (Windows, no /proc)
+    # ----------
+    if platform.system() == 'Windows' or not os.path.isdir("/proc"):
+        return None
+    openPaths = set()
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        fdFolder = os.path.join("/proc", pid, "fd")
+        try:
+            for fd in os.listdir(fdFolder):
+                openPaths.add(os.readlink(os.path.join(fdFolder, fd)))
+        except OSError:
+            continue
+    return openPaths
+
+
+def isFileClosed(path, openPaths=None):
+    # ----------
+    # Check that no process (eg. the acquisition scenario) still has
+    # a signal file open.
+    # Windows: a file open in another process can't be renamed.
+    # Linux: look for the file in the open files (openPaths, see openFiles:
+    # pass it when checking several files at once)
+    # ----------
+    if platform.system() == 'Windows':
+        try:
+            os.rename(path, path)
+        except OSError:
+            return False
+        return True
+
+    if openPaths is None:
+        openPaths = openFiles()
+        if openPaths is None:
+            return True
+    return os.path.realpath(path) not in openPaths
+
+
+def recordingStates(signalFolder):
+    # ----------
+    # {filename: [size, mtime]} of the signal files of signalFolder, eg. to
+    # consider the files already there as handled when starting to watch
+    # ----------
+    states = {}
+    for filename in os.listdir(signalFolder):
+        if not filename.endswith(".ov"):
+            continue
+        try:
+            stat = os.stat(os.path.join(signalFolder, filename))
+        except OSError:
+            continue
+        states[filename] = [stat.st_size, stat.st_mtime]
+    return states
+
+
+def completedRecordings(signalFolder, states, stableTime, handled=None):
+    # ----------
+    # Signal files of signalFolder whose recording is over: file closed,
+    # same size and modification time for at least stableTime seconds.
+    # states {filename: [size, mtime, time since which they're unchanged]}
+    # is updated at each call: call this function periodically.
+    # Files already handled ({filename: [size, mtime]}) in the same
+    # state are skipped
+    # ----------
+    handled = handled or {}
+    now = time.time()
+    completed = []
+    openPaths = None
+    for filename in sorted(os.listdir(signalFolder)):
+        if not filename.endswith(".ov"):
+            continue
+        path = os.path.join(signalFolder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        state = states.get(filename)
+        if not state or state[0] != stat.st_size or state[1] != stat.st_mtime:
+            states[filename] = [stat.st_size, stat.st_mtime, now]
+            continue
+        if now - state[2] < stableTime or stat.st_size == 0:
+            continue
+        if handled.get(filename) == state[:2]:
+            continue
+        # Open files are only listed once per call, when needed
+        if openPaths is None and platform.system() != 'Windows':
+            openPaths = openFiles() or set()
+        if not isFileClosed(path, openPaths):
+            continue
+        completed.append(filename)
+
+    # Forget deleted files
+    for filename in list(states.keys()):
+        if not os.path.exists(os.path.join(signalFolder, filename)):
+            states.pop(filename)
+
+    return completed
+
+
+def recordAttempts(pending, succeeded, handled, failures, maxAttempts):
+    # ----------
+    # Update the handled files after extracting the pending files
+    # ({filename: [size, mtime]} when the extraction started).
+    # Files whose extraction failed stay to be handled, and are tried again
+    # up to maxAttempts times in the same state (failures {filename: [state, nb]}).
+    # Returns the files given up on
+    # ----------
+    givenUp = []
+    for filename, state in pending.items():
+        if filename in succeeded:
+            handled[filename] = state
+            failures.pop(filename, None)
+            continue
+        failure = failures.get(filename)
+        nbFailed = failure[1] + 1 if failure and failure[0] == state else 1
+        failures[filename] = [state, nbFailed]
+        if nbFailed >= maxAttempts:
+            handled[filename] = state
+            givenUp.append(filename)
+    return givenUp
@@ -0,0 +1,112 @@
+import os
+import time
+
+import bcipipeline_settings as settings
+
+# Memory used by a designer instance playing a scenario, whatever the signal (bytes)
+designerBaseMemory = 300 * 1024 * 1024
+
+# Memory used by a Python worker process (numpy, scipy...) (bytes)
+workerBaseMemory = 150 * 1024 * 1024
+
+# Period of the capacity checks, while waiting for headroom (s)
+capacityCheckPeriod = 1.0
+
+
+def availableMemory():
+    # ----------
+    # Memory available for new processes (bytes), from /proc/meminfo
+    # ("MemAvailable"). None if unknown (eg. Windows): no memory limit then.
+    # ----------
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def systemLoad():
+    # 1-minute load average, from /proc/loadavg (None if unknown)
+    try:
+        with open("/proc/loadavg") as loadavg:
+            return float(loadavg.read().split()[0])
+    except OSError:
+        pass
+    if hasattr(os, "getloadavg"):
+        return os.getloadavg()[0]
+    return None
+
+
+def estimateExtractionFootprint(ovFile, sampFreq, nbChannels, parameterDict, engine="openvibe"):
+    # ----------
+    # Rough estimation of the memory needed to extract one signal file (bytes)
+    # - designer: base memory, plus buffers proportional to the signal size
+    # - native: the decoded signal (float64, memory-mapped then re-referenced),
+    #   its epochs, and the spectra of all time windows of all epochs
+    # ----------
+    signalBytes = os.path.getsize(ovFile)
+    if engine != "native":
+        return designerBaseMemory + signalBytes
+
+    nbSamples = signalBytes / (8.0 * max(nbChannels, 1))
+    epochLength = float(parameterDict["StimulationEpoch"])
+    winShift = float(parameterDict["TimeWindowShift"])
+    nbBins = float(parameterDict["PsdSize"]) / 2 + 1 if "PsdSize" in parameterDict else sampFreq / 2 + 1
+    nbEpochs = int(parameterDict["TrialNb"]) if "TrialNb" in parameterDict else nbSamples / sampFreq / epochLength
+    spectraBytes = 8.0 * nbEpochs * nbChannels * (epochLength / winShift) * nbBins
+    return int(workerBaseMemory + 3 * signalBytes + spectraBytes)
+
+
+def estimateTrainingFootprint(compositeCsv):
+    # Designer reading the composite CSV file, and training on all of its trials
+    return designerBaseMemory + 3 * os.path.getsize(compositeCsv)
+
+
+def hasCapacity(footprint, nbRunning, recentFootprints=0):
+    # ----------
+    # True if a new job needing "footprint" bytes can start now:
+    # - enough available memory, minus a safety margin, and minus what was
+    #   promised to recently started jobs that may not have allocated it yet
+    # - the CPU isn't already busy with other work (eg. acquisition)
+    # A job can always start if none of ours is running, so that a job too
+    # big for the estimation, or a machine already loaded by other work,
+    # never blocks it forever (it runs alone).
+    # ----------
+    if nbRunning == 0:
+        return True
+
+    memory = availableMemory()
+    if memory is not None:
+        if memory - recentFootprints - settings.schedulerMemoryMargin < footprint:
+            return False
+
+    load = systemLoad()
+    if load is not None:
+        # Load not caused by our own running jobs
+        otherLoad = max(0.0, load - nbRunning)
+        if nbRunning + otherLoad >= max(1, os.cpu_count() or 1):
+            return False
+
+    return True
+
+
+def waitForCapacity(footprint, stopRequested=None, nbRunning=0):
+    # ----------
+    # Block until a job of the given footprint can run next to the
+    # rest of the system (used for jobs run one at a time, eg. training),
+    # with nbRunning of our own jobs already running (see hasCapacity:
+    # no wait when none is running)
+    # ----------
+    first = True
+    while not hasCapacity(footprint, nbRunning):
+        if stopRequested and stopRequested():
+            return
+        if first:
+            print("---Waiting for available memory / CPU ("
+                  + str(round(footprint / (1024 * 1024))) + " MB needed)")
+            first = False
+        time.sleep(capacityCheckPeriod)
+    return
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from nativeExtraction import writeSignalCsv
+from arOptimizer import optimizeArParameters
+
+sampFreq = 100
+electrodeList = ["C3", "C4"]
+
+
+def writeTrials(path, classes):
+    # Class 770 trials have a 10 Hz rhythm on C3
+    rng = np.random.default_rng(0)
+    t = np.arange(2 * sampFreq) / sampFreq
+    epochs = rng.standard_normal([len(classes), len(electrodeList), len(t)])
+    for i, code in enumerate(classes):
+        if code == 770:
+            epochs[i, 0] += 3 * np.sin(2 * np.pi * 10 * t + rng.random() * 2 * np.pi)
+    startSamples = np.arange(len(classes)) * 3 * sampFreq
+    epochStims = [(start / sampFreq, code) for start, code in zip(startSamples, classes)]
+    writeSignalCsv(str(path), epochs, startSamples, sampFreq, electrodeList, epochStims, epochStims)
+    return str(path)
+
+
+def test_single_class_is_an_error(tmp_path):
+    trialsCsv = writeTrials(tmp_path / "s-TRIALS.csv", [769] * 6)
+    with pytest.raises(ValueError):
+        optimizeArParameters([trialsCsv], str(tmp_path), nbParticles=2, nbIterations=1, nbJobs=1)
+
+
+def test_search_scores_both_classes(tmp_path):
+    trialsCsv = writeTrials(tmp_path / "s-TRIALS.csv", [769, 770] * 5)
+    bounds = {"AutoRegressiveOrderTime": (0.1, 0.1), "TimeWindowLength": (0.5, 0.5), "TimeWindowShift": (0.25, 0.25)}
+    bestParams, score, nbEvaluated, nbMemo = optimizeArParameters(
+        [trialsCsv], str(tmp_path), bounds=bounds, nbParticles=2, nbIterations=1, fmin=5, fmax=15, nbJobs=1)
+    assert bestParams == {"AutoRegressiveOrderTime": 0.1, "TimeWindowLength": 0.5, "TimeWindowShift": 0.25}
+    assert score > 0.5
+    assert (nbEvaluated, nbMemo) == (1, 1)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy import signal
+from spectrum import arma2psd
+from statsmodels.regression.linear_model import burg
+
+from Spectral_Analysis import Burg_AR_batch, AR_psd_batch, Power_burg_calculation, Power_burg_calculation_optimization
+
+
+def randomEpochs(nbTrials=3, nbChannels=4, nbSamples=500):
+    return np.random.default_rng(0).standard_normal([nbTrials, nbChannels, nbSamples])
+
+
+def test_burg_batch_same_as_scalar_burg():
+    data = randomEpochs()
+    AR, sigma2 = Burg_AR_batch(data, 10)
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            ARref, sigma2ref = burg(data[i, j], 10, demean=True)
+            np.testing.assert_allclose(AR[i, j], ARref, atol=1e-10)
+            np.testing.assert_allclose(sigma2[i, j], sigma2ref, rtol=1e-10)
+
+
+@pytest.mark.parametrize("nfft", [256, 500])
+def test_ar_psd_batch_same_as_arma2psd(nfft):
+    AR = np.random.default_rng(0).standard_normal([3, 4, 6]) * 0.1
+    rho = np.random.default_rng(1).random([3, 4]) + 0.5
+    psd = AR_psd_batch(AR, nfft, rho=rho)
+    for i in range(AR.shape[0]):
+        for j in range(AR.shape[1]):
+            ref = arma2psd(-AR[i, j], rho=rho[i, j], NFFT=nfft)
+            np.testing.assert_allclose(psd[i, j], ref[:nfft // 2 + 1], rtol=1e-10)
+
+
+def test_power_burg_same_as_window_loop():
+    # Loop of Power_burg_calculation before batching: one Burg fit and
+    # one 'centerdc' PSD per window, averaged over the windows
+    data = randomEpochs()
+    fs, nfft, nPerSeg, noverlap, order = 500, 500, 125, 45, 19
+    trialspectrum, timeFreq, time = Power_burg_calculation(data, noverlap, nfft, fs, nPerSeg, False, None, order)
+
+    nbWindows = round((data.shape[2] - noverlap) / (nPerSeg - noverlap)) - 1
+    fres = fs / nfft
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            blocks = []
+            for w in range(nbWindows):
+                start = w * (nPerSeg - noverlap)
+                window = signal.detrend(data[i, j, start:start + nPerSeg], type='constant')
+                AR, sigma2 = burg(window, order)
+                blocks.append(arma2psd(-AR, NFFT=nfft, sides='centerdc'))
+            ref = np.mean(blocks, axis=0)[round(fs / (2 * fres)):round(fs / fres)]
+            np.testing.assert_allclose(trialspectrum[i, j], ref, rtol=1e-8)
+
+
+def test_power_burg_positional_arguments():
+    # (..., smoothing, freqs_left, filter_order): freqs_left is ignored
+    data = randomEpochs()
+    ref = Power_burg_calculation(data, 45, 500, 500, 125, False, np.arange(250), 19)
+    same = Power_burg_calculation(data, 45, 500, 500, 125, False, None, filter_order=19)
+    oneChannel = Power_burg_calculation_optimization(data[:, 0], 45, 500, 500, 125, False, None, 19)
+    for i in range(2):
+        np.testing.assert_allclose(same[i], ref[i], rtol=1e-12)
+        np.testing.assert_allclose(oneChannel[i], ref[i][:, 0], rtol=1e-12)
@@ -0,0 +1,40 @@
+import os
+
+from bcipipeline_cli import parseArguments, scriptFolder
+
+
+def test_subjects_not_taken_by_set():
+    args = parseArguments(["generate", "--pipeline", "PowSpectrumGraz", "--designer", "/opt/ov.sh",
+                           "--set", "TrialNb=20", "Class1=LEFT", "--subjects", "subj01", "subj02"])
+    assert args.set == ["TrialNb=20", "Class1=LEFT"]
+    assert args.subjects == ["subj01", "subj02"]
+
+
+def test_subjects_not_taken_by_sessions():
+    args = parseArguments(["extract", "--subjects", "subj01", "--sessions", "run0.ov", "run1.ov",
+                           "--engine", "native"])
+    assert args.sessions == ["run0.ov", "run1.ov"]
+    assert args.subjects == ["subj01"]
+    assert args.engine == "native"
+
+
+def test_default_subject():
+    args = parseArguments(["stats"])
+    assert args.subjects == [scriptFolder]
+    assert os.path.isdir(args.subjects[0])
+
+
+def test_subjects_not_taken_by_features():
+    args = parseArguments(["features", "--features", "C3;12", "C4;12:13", "--subjects", "subj01"])
+    assert args.features == ["C3;12", "C4;12:13"]
+    assert args.subjects == ["subj01"]
+
+
+def test_subjects_not_taken_by_bands():
+    args = parseArguments(["stats", "--bands", "8:12", "13:30", "--subjects", "subj01"])
+    assert args.bands == ["8:12", "13:30"]
+    assert args.subjects == ["subj01"]
+    # No value: default bands
+    args = parseArguments(["stats", "--bands", "--subjects", "subj01"])
+    assert args.bands == []
+    assert parseArguments(["stats"]).bands is None
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from Connectivity_Analysis import Connectivity_calculation, Node_strength, Connectivity_pairs
+
+
+def coupledEpochs(nbTrials=3, nbChannels=4, nbSamples=750):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal([nbTrials, nbChannels, nbSamples])
+    # Channel 1 follows channel 0 with a delay: non-zero imaginary coherency
+    data[:, 1, 3:] += data[:, 0, :-3]
+    return data
+
+
+@pytest.mark.parametrize("metric", ["MSC", "IMCOH"])
+def test_connectivity_same_as_pair_loop(metric):
+    data = coupledEpochs()
+    fs, nPerSeg, noverlap, nfft = 500, 250, 125, 256
+    conn, freqs = Connectivity_calculation(data, fs, nPerSeg, noverlap, nfft, metric)
+    assert conn.shape == (3, 4, 4, nfft // 2 + 1)
+    for t in range(data.shape[0]):
+        for i in range(data.shape[1]):
+            for j in range(data.shape[1]):
+                args = dict(fs=fs, window="hann", nperseg=nPerSeg, noverlap=noverlap, nfft=nfft)
+                f, Sij = signal.csd(data[t, i], data[t, j], **args)
+                f, Sii = signal.welch(data[t, i], **args)
+                f, Sjj = signal.welch(data[t, j], **args)
+                # scipy's csd is conj(X_i) X_j: coherency S_ij of the module is its conjugate
+                if metric == "MSC":
+                    ref = np.abs(Sij) ** 2 / (Sii * Sjj)
+                else:
+                    ref = np.imag(np.conj(Sij)) / np.sqrt(Sii * Sjj)
+                # (edge bins of the one-sided spectra are scaled differently, but cancel out)
+                np.testing.assert_allclose(conn[t, i, j], ref, atol=1e-10)
+    np.testing.assert_allclose(freqs, f)
+
+
+def test_msc_same_as_scipy_coherence():
+    data = coupledEpochs()
+    conn, freqs = Connectivity_calculation(data, 500, 250, 125, 256, "MSC")
+    f, coherence = signal.coherence(data[2, 0], data[2, 1], fs=500, nperseg=250, noverlap=125, nfft=256)
+    np.testing.assert_allclose(conn[2, 0, 1], coherence, atol=1e-10)
+
+
+def test_stats_shapes():
+    conn, freqs = Connectivity_calculation(coupledEpochs(), 500, 250, 125, 256, "MSC")
+    strength = Node_strength(conn)
+    assert strength.shape == (3, 4, 129)
+    np.testing.assert_allclose(strength[:, 0], (conn[:, 0].sum(axis=1) - conn[:, 0, 0]) / 3)
+    pairs, names = Connectivity_pairs(conn, ["C3", "Cz", "C4", "Pz"])
+    assert pairs.shape == (3, 6, 129)
+    assert names[0] == "C3-Cz"
+    np.testing.assert_array_equal(pairs[:, 0], conn[:, 0, 1])
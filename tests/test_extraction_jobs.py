@@ -0,0 +1,90 @@
+import os
+
+import pipelineSteps
+from pipelineSteps import extractSessions, interruptedBatches, resumeBatches
+from extractionPool import extractionOutputs
+from extractionCache import loadManifest, outputPath
+from jobQueue import openJobQueue
+from nativeExtraction import runNativeExtractionJob
+import bcipipeline_settings as settings
+
+
+def sessionFolder(tmp_path, signalFiles):
+    signalFolder = tmp_path / "generated" / "signals"
+    for subfolder in ["analysis", "training"]:
+        os.makedirs(signalFolder / subfolder)
+    for signalFile in signalFiles:
+        (signalFolder / signalFile).write_bytes(os.urandom(64))
+    parameterDict = dict(settings.pipelineExtractSettings["PowSpectrumGraz"])
+    parameterDict.update({"pipelineType": "PowSpectrumGraz", "Class1": "LEFT", "Class2": "RIGHT"})
+    return str(signalFolder), parameterDict
+
+
+def fakeDesigner(monkeypatch, signalFolder, parameterDict, statuses, runs):
+    # Designer runs writing all their outputs, and ending with statuses[signalFile]
+    monkeypatch.setattr(pipelineSteps, "getMetadataBatch",
+                        lambda ovFiles, ovScript: {ovFile: (500, ["C3", "C4"]) for ovFile in ovFiles})
+    monkeypatch.setattr(pipelineSteps, "prepareExtractionScenario",
+                        lambda scenFile, signalFile, params, sampFreq, electrodeList: (signalFile, params))
+
+    def runJob(ovScript, signalFile):
+        runs.append(signalFile)
+        for outputId, name in extractionOutputs(signalFile, parameterDict).items():
+            with open(os.path.join(signalFolder, outputPath(outputId, name)), "w") as outfile:
+                outfile.write("partial")
+        return statuses[signalFile]
+    monkeypatch.setattr(pipelineSteps, "runExtractionJob", runJob)
+
+
+def test_interrupted_designer_run_not_recorded(tmp_path, monkeypatch):
+    signalFolder, parameterDict = sessionFolder(tmp_path, ["s1.ov", "s2.ov"])
+    runs = []
+    statuses = {"s1.ov": "finished", "s2.ov": "timeout"}
+    fakeDesigner(monkeypatch, signalFolder, parameterDict, statuses, runs)
+
+    success, errMsg = extractSessions("designer", "sc2-extract.xml", ["s1.ov", "s2.ov"], signalFolder,
+                                      parameterDict, nbJobs=1)
+    assert not success and "s2.ov" in errMsg
+    manifest = loadManifest(signalFolder)
+    for signalFile in statuses:
+        for outputId, name in extractionOutputs(signalFile, parameterDict).items():
+            path = outputPath(outputId, name)
+            assert (path in manifest["outputs"]) == (signalFile == "s1.ov")
+            assert os.path.exists(os.path.join(signalFolder, path)) == (signalFile == "s1.ov")
+
+    # Extracting again only runs the failed session
+    statuses["s2.ov"] = "finished"
+    success, errMsg = extractSessions("designer", "sc2-extract.xml", ["s1.ov", "s2.ov"], signalFolder,
+                                      parameterDict, nbJobs=1)
+    assert success
+    assert sorted(runs) == ["s1.ov", "s2.ov", "s2.ov"]
+    queue = openJobQueue(os.path.dirname(signalFolder))
+    assert len(queue.execute("SELECT key FROM jobs WHERE status = 'done'").fetchall()) == 2
+    queue.close()
+
+
+def test_interrupted_batch_resumed(tmp_path, monkeypatch):
+    signalFolder, parameterDict = sessionFolder(tmp_path, ["s1.ov", "s2.ov", "s3.ov"])
+    runs = []
+    statuses = {"s1.ov": "finished", "s2.ov": "stopped", "s3.ov": "stopped"}
+    fakeDesigner(monkeypatch, signalFolder, parameterDict, statuses, runs)
+    extractSessions("designer", "sc2-extract.xml", ["s1.ov", "s2.ov"], signalFolder, parameterDict, nbJobs=1)
+    extractSessions("designer", "sc2-extract.xml", ["s3.ov"], signalFolder, parameterDict, nbJobs=1)
+    assert [arguments["signalFiles"] for kind, batch, arguments in interruptedBatches(str(tmp_path))] == \
+        [["s1.ov", "s2.ov"], ["s3.ov"]]
+
+    # s3.ov recorded again since: extracted in a new batch, the old one is forgotten
+    (tmp_path / "generated" / "signals" / "s3.ov").write_bytes(os.urandom(128))
+    statuses.update({"s2.ov": "finished", "s3.ov": "finished"})
+    runs.clear()
+    success, text = resumeBatches("designer", str(tmp_path), str(tmp_path), nbJobs=1)
+    assert success
+    assert runs == ["s2.ov", "s3.ov"]
+    assert interruptedBatches(str(tmp_path)) == []
+    assert resumeBatches("designer", str(tmp_path), str(tmp_path)) == (True, "No interrupted extraction or training")
+
+
+def test_native_job_error_is_a_failure(tmp_path):
+    # Errors fail their job, without raising in the worker (and in the pool)
+    signalFolder, parameterDict = sessionFolder(tmp_path, [])
+    assert runNativeExtractionJob(signalFolder, "missing.ov", parameterDict) is None
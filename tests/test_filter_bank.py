@@ -0,0 +1,37 @@
+import numpy as np
+from scipy import signal
+
+from Spectral_Analysis import Power_filter_bank, Filter_bank_sos
+
+fs = 200
+bands = [(8, 12), (20, 30)]
+
+
+def test_band_power_of_sinusoid():
+    # Sinusoid of amplitude 2 at 10 Hz: power 2 in the mu band, ~0 in the beta band
+    t = np.arange(4 * fs) / fs
+    data = np.tile(2 * np.sin(2 * np.pi * 10 * t), [3, 2, 1])
+    power, timeBand, time = Power_filter_bank(data, fs, bands, 100, 50)
+    # (whole epoch: slightly less, filter transients at the edges)
+    np.testing.assert_allclose(power[..., 0], np.log(2), atol=0.05)
+    assert np.all(power[..., 1] < np.log(2) - 6)
+    # Windows of 0.5 s every 0.25 s, away from the edges
+    np.testing.assert_allclose(time, np.arange(15) * 0.25)
+    np.testing.assert_allclose(timeBand[:, :, 2:-2, 0], np.log(2), atol=0.05)
+
+
+def test_filter_bank_same_as_loop():
+    data = np.random.default_rng(0).standard_normal([2, 3, 600])
+    power, timeBand, time = Power_filter_bank(data, fs, bands, 100, 50, filter_order=4)
+    for b, (low, high) in enumerate(bands):
+        sos = signal.butter(4, [low, high], btype='bandpass', fs=fs, output='sos')
+        for i in range(data.shape[0]):
+            for j in range(data.shape[1]):
+                filtered = signal.sosfiltfilt(sos, data[i, j]) ** 2
+                np.testing.assert_allclose(power[i, j, b], np.log(filtered.mean()), rtol=1e-10)
+                windows = [filtered[w * 50:w * 50 + 100].mean() for w in range(11)]
+                np.testing.assert_allclose(timeBand[i, j, :, b], np.log(windows), rtol=1e-10)
+
+
+def test_filters_designed_once():
+    assert Filter_bank_sos(250.0, ((8.0, 12.0),), 4) is Filter_bank_sos(250.0, ((8.0, 12.0),), 4)
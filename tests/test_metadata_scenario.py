@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import extractMetaData
+from extractMetaData import generateMetadataBatch
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_temporary_scenarios_unique_and_removed(tmp_path, monkeypatch):
+    monkeypatch.chdir(repoFolder)
+    toolboxFiles = sorted(os.listdir("toolbox-scenarios"))
+    runs = []
+
+    def runDesigner(openvibeDesigner, scenFile):
+        runs.append(scenFile)
+        assert os.path.exists(scenFile)
+        if len(runs) == 2:
+            raise RuntimeError("designer crashed")
+        return "finished"
+    monkeypatch.setattr(extractMetaData, "runDesigner", runDesigner)
+
+    ovFiles = [str(tmp_path / "s1.ov"), str(tmp_path / "s2.ov")]
+    generateMetadataBatch(ovFiles, "designer")
+    with pytest.raises(RuntimeError):
+        generateMetadataBatch(ovFiles, "designer")
+    assert runs[0] != runs[1]
+    assert sorted(os.listdir("toolbox-scenarios")) == toolboxFiles
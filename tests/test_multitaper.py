@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from Spectral_Analysis import Power_calculation_multitaper, Dpss_tapers
+from pipelineSteps import computeMultitaperStats
+from nativeExtraction import writeSignalCsv
+
+fs = 250
+
+
+def sinusoidEpochs(freq=10, nbTrials=3, nbChannels=2, nbSamples=500):
+    t = np.arange(nbSamples) / fs
+    noise = np.random.default_rng(0).standard_normal([nbTrials, nbChannels, nbSamples])
+    return noise + 5 * np.sin(2 * np.pi * freq * t)
+
+
+@pytest.mark.parametrize("nfft", [500, 512])
+def test_multitaper_same_as_periodograms(nfft):
+    # Weighted mean of the periodograms of the data windowed by each DPSS taper
+    data = sinusoidEpochs()
+    NW, K = 3, 5
+    psd, freqs = Power_calculation_multitaper(data, fs, nfft, NW, K, False)
+    tapers, ratios = signal.windows.dpss(data.shape[-1], NW, Kmax=K, return_ratios=True)
+    ref = 0
+    for taper, ratio in zip(tapers, ratios):
+        refFreqs, periodogram = signal.periodogram(data, fs, window=taper, nfft=nfft, axis=-1)
+        ref = ref + ratio * periodogram
+    ref /= ratios.sum()
+    np.testing.assert_allclose(freqs, refFreqs)
+    np.testing.assert_allclose(psd, ref, rtol=1e-8)
+    # (peak as wide as the taper bandwidth: +/- NW / 2 s)
+    assert np.all(np.abs(freqs[np.argmax(psd, axis=-1)] - 10) <= NW / 2)
+
+
+def test_dpss_tapers_cached():
+    tapers, ratios = Dpss_tapers(500, 3.0, 5)
+    assert Dpss_tapers(500, 3.0, 5)[0] is tapers
+    assert not tapers.flags.writeable
+
+
+def test_multitaper_stats(tmp_path):
+    # 12 Hz rhythm on the first channel for the class 770 trials only
+    classes = [769, 770] * 4
+    epochs = sinusoidEpochs(freq=12, nbTrials=len(classes), nbSamples=750)
+    epochs[::2] = np.random.default_rng(1).standard_normal(epochs[::2].shape)
+    epochs[:, 1] = np.random.default_rng(2).standard_normal(epochs[:, 1].shape)
+    startSamples = np.arange(len(classes)) * 4 * fs
+    epochStims = [(start / fs, code) for start, code in zip(startSamples, classes)]
+    (tmp_path / "training").mkdir()
+    writeSignalCsv(str(tmp_path / "training" / "s-TRIALS.csv"), epochs, startSamples, fs, ["C3", "C4"],
+                   epochStims, epochStims)
+
+    results, errMsg = computeMultitaperStats(str(tmp_path), ["s-TRIALS.csv"], {}, 4)
+    assert results["power_cond1"].shape == (4, 2, fs // 2)
+    assert list(results["freqs_array"][:3]) == [0, 1, 2]
+    channel, freq = np.unravel_index(np.argmax(results["Rsigned"]), results["Rsigned"].shape)
+    # (bandwidth: +/- 4 / 3 s, then 1 Hz bins averaging 5 bins)
+    assert channel == 0 and abs(freq - 12) <= 2
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.api import VAR
+from statsmodels.regression.linear_model import yule_walker
+
+import Connectivity_Analysis
+from Connectivity_Analysis import Mvar_fit_batch, Mvar_windows_models, Mvar_metric
+
+
+def varSignal(nbSamples=2000, seed=0):
+    # VAR(2), 3 channels: channel 0 drives channel 1
+    rng = np.random.default_rng(seed)
+    x = np.zeros([3, nbSamples])
+    e = rng.standard_normal([3, nbSamples])
+    for t in range(2, nbSamples):
+        x[0, t] = 0.5 * x[0, t - 1] - 0.3 * x[0, t - 2] + e[0, t]
+        x[1, t] = 0.4 * x[1, t - 1] + 0.6 * x[0, t - 1] + e[1, t]
+        x[2, t] = 0.3 * x[2, t - 2] + e[2, t]
+    return x
+
+
+def test_least_squares_same_as_statsmodels_var():
+    x = varSignal()
+    A, Sigma = Mvar_fit_batch(x, 2, "least-squares")
+    result = VAR((x - x.mean(axis=1, keepdims=True)).T).fit(2, trend="n")
+    np.testing.assert_allclose(A, result.coefs, atol=1e-10)
+    np.testing.assert_allclose(Sigma, result.sigma_u_mle, atol=1e-10)
+
+
+def test_yule_walker_single_channel_same_as_statsmodels():
+    x = varSignal()[:1]
+    A, Sigma = Mvar_fit_batch(x, 4)
+    rho, sigma = yule_walker(x[0], order=4, method="mle", result_object=False)
+    np.testing.assert_allclose(A[:, 0, 0], rho, atol=1e-10)
+    np.testing.assert_allclose(Sigma[0, 0], sigma ** 2, rtol=1e-10)
+
+
+def test_yule_walker_same_as_block_toeplitz_loop():
+    x = varSignal(600)
+    A, Sigma = Mvar_fit_batch(x, 3)
+    xc = x - x.mean(axis=1, keepdims=True)
+    n = xc.shape[1]
+    R = [xc[:, k:] @ xc[:, :n - k].T / n for k in range(4)]
+    lag = lambda d: R[d] if d >= 0 else R[-d].T
+    G = np.block([[lag(k - m) for k in range(3)] for m in range(3)])
+    Y = np.vstack([R[m + 1].T for m in range(3)])
+    X = np.linalg.solve(G, Y)
+    for k in range(3):
+        np.testing.assert_allclose(A[k], X[3 * k:3 * (k + 1)].T, atol=1e-10)
+
+
+def test_windows_same_as_single_fits_and_chunks(monkeypatch):
+    epochs = np.stack([varSignal(500, seed) for seed in range(3)])
+    A, Sigma = Mvar_windows_models(epochs, 200, 100, 2)
+    assert A.shape == (3, 4, 2, 3, 3)
+    Aref, Sigmaref = Mvar_fit_batch(epochs[1, :, 100:300], 2)
+    np.testing.assert_allclose(A[1, 1], Aref, atol=1e-12)
+    # Same models when solved in small chunks
+    monkeypatch.setattr(Connectivity_Analysis, "Mvar_max_batch_bytes", 1)
+    Achunks, Sigmachunks = Mvar_windows_models(epochs, 200, 100, 2)
+    np.testing.assert_allclose(Achunks, A, atol=1e-12)
+    np.testing.assert_allclose(Sigmachunks, Sigma, atol=1e-12)
+
+
+@pytest.mark.parametrize("metric", ["PDC", "DTF"])
+def test_pdc_dtf_same_as_frequency_loop(metric):
+    A, Sigma = Mvar_fit_batch(varSignal(), 2)
+    nfft = 64
+    conn = Mvar_metric(A, nfft, metric)
+    assert conn.shape == (3, 3, nfft // 2 + 1)
+    for b in range(nfft // 2 + 1):
+        Af = np.eye(3, dtype=complex)
+        for k in range(A.shape[0]):
+            Af -= A[k] * np.exp(-2j * np.pi * b * (k + 1) / nfft)
+        if metric == "PDC":
+            ref = np.abs(Af) / np.sqrt((np.abs(Af) ** 2).sum(axis=0))[None, :]
+        else:
+            H = np.linalg.inv(Af)
+            ref = np.abs(H) / np.sqrt((np.abs(H) ** 2).sum(axis=1))[:, None]
+        np.testing.assert_allclose(conn[..., b], ref, atol=1e-10)
+    # Flow from channel 0 to channel 1, not back
+    assert conn[1, 0].mean() > 0.3
+    assert conn[0, 1].mean() < 0.1
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from nativeExtraction import stimulationEpochs, writeSignalCsv, loadTrialsCsv
+
+sampFreq = 100
+electrodeList = ["C3", "Cz", "C4"]
+# Graz-like sequence: experiment start, then for each trial fixation cross,
+# beep, class cue and end of trial (781: continuous feedback, within a trial)
+grazStims = [(0.5, 32769), (1.0, 768), (2.0, 786), (3.0, 769), (4.0, 781), (7.5, 800),
+             (9.0, 768), (10.0, 786), (11.0, 770), (15.5, 800)]
+
+
+def writeTrials(tmpPath, epochDelay):
+    signal = np.random.default_rng(0).standard_normal([len(electrodeList), 20 * sampFreq])
+    epochs, startSamples, epochStims = stimulationEpochs(signal, sampFreq, grazStims, ["769", "770"], 4, epochDelay)
+    trialsCsv = str(tmpPath / "s-TRIALS.csv")
+    writeSignalCsv(trialsCsv, epochs, startSamples, sampFreq, electrodeList, grazStims, epochStims)
+    return trialsCsv
+
+
+def epochEvents(trialsCsv):
+    # {epoch: [(sample in the epoch, event ids)]}
+    data = pd.read_csv(trialsCsv, dtype={"Event Id": str}, keep_default_na=False)
+    events = {}
+    for epoch, rows in data.groupby("Epoch"):
+        ids = rows["Event Id"].to_numpy()
+        events[epoch] = [(n, ids[n]) for n in np.flatnonzero(ids != "")]
+    return events
+
+
+def test_only_stimulations_within_epochs(tmp_path):
+    # Stimulations between trials are not moved onto the next epoch
+    events = epochEvents(writeTrials(tmp_path, 0))
+    assert events == {0: [(0, "769"), (100, "781")], 1: [(0, "770")]}
+
+
+def test_class_stimulation_before_epoch_kept(tmp_path):
+    # Positive StimulationDelay: the class cue is before its epoch, and is
+    # written on its first sample; the end of trial (7.5 s) is just after
+    events = epochEvents(writeTrials(tmp_path, 0.5))
+    assert events == {0: [(0, "769"), (50, "781")], 1: [(0, "770")]}
+
+
+def test_trials_round_trip(tmp_path):
+    # Epoch offset of -1 s: the fixation cross (786) is on the first sample,
+    # before the class cue, and the continuous feedback (781) comes after it
+    signal = np.random.default_rng(1).standard_normal([len(electrodeList), 20 * sampFreq])
+    epochs, startSamples, epochStims = stimulationEpochs(signal, sampFreq, grazStims, ["769", "770"], 4, -1)
+    trialsCsv = str(tmp_path / "s-TRIALS.csv")
+    writeSignalCsv(trialsCsv, epochs, startSamples, sampFreq, electrodeList, grazStims, epochStims)
+    assert epochEvents(trialsCsv)[0] == [(0, "786"), (100, "769"), (200, "781")]
+
+    loaded, classes, fs, channels = loadTrialsCsv(trialsCsv)
+    assert classes == ["769", "770"]
+    assert fs == sampFreq and channels == electrodeList
+    np.testing.assert_allclose(loaded, epochs, rtol=1e-9)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from Spectral_Analysis import Burg_order_selection, Burg_AR_batch, Sliding_windows
+
+
+def ar4Epochs(nbTrials=4, nbChannels=3, nbSamples=2000):
+    # AR(4) process: two resonances (poles at 0.95 and 0.9 of the unit circle)
+    poles = [0.95 * np.exp(1j * 0.3), 0.9 * np.exp(1j * 1.2)]
+    a = np.real(np.poly(poles + [np.conj(p) for p in poles]))
+    noise = np.random.default_rng(0).standard_normal([nbTrials, nbChannels, nbSamples])
+    return signal.lfilter([1], a, noise, axis=-1)
+
+
+@pytest.mark.parametrize("criterion", ["AIC", "BIC", "FPE"])
+def test_order_of_ar4_process(criterion):
+    channelOrders, globalOrder, curves = Burg_order_selection(ar4Epochs(), 100, 500, 12, criterion)
+    assert globalOrder == 4
+    assert list(channelOrders) == [4, 4, 4]
+    assert curves[criterion].shape == (3, 13)
+
+
+def test_order_curves_from_windows_of_power_burg():
+    # Errors of the windows of Power_burg_calculation: k-1 windows
+    data = ar4Epochs(nbTrials=2, nbChannels=1, nbSamples=1000)
+    N, noverlap, order = 200, 50, 6
+    nbWindows = round((1000 - noverlap) / (N - noverlap)) - 1
+    AR, errors = Burg_AR_batch(Sliding_windows(data, N, N - noverlap, nbWindows), order, all_orders=True)
+    channelOrders, globalOrder, curves = Burg_order_selection(data, noverlap, N, order)
+    aic = N * np.log(errors[:, 0]) + 2 * np.arange(order + 1)
+    np.testing.assert_allclose(curves["AIC"][0], np.mean(aic, axis=(0, 1)))
@@ -0,0 +1,177 @@
+import numpy as np
+
+import ovStreamReader as ov
+from ovStreamReader import readVarInt, iterNodes, readOvMetadata
+from ovStreamReader import decodeOvFile, loadDecodedSignal, stimulationWindows
+
+# ----------
+# Minimal EBML writer, producing .ov files like the "Generic stream writer" box
+# ----------
+
+
+def varInt(value):
+    # Shortest EBML coding of value: leading zero bytes (8 bits of length each),
+    # then a marker bit, then the value (see readVarInt)
+    length = 1
+    while True:
+        nbZeros = (length - 1) // 8
+        markerBit = 7 - (length - 1) % 8
+        if value < 1 << (markerBit + 8 * (length - nbZeros - 1)):
+            break
+        length += 1
+    coded = bytearray(value.to_bytes(length - nbZeros, "big"))
+    coded[0] |= 1 << markerBit
+    return bytes(nbZeros) + bytes(coded)
+
+
+def node(nodeId, content):
+    return varInt(nodeId) + varInt(len(content)) + content
+
+
+def uint(value, size=8):
+    return value.to_bytes(size, "big")
+
+
+def time(seconds):
+    # 32:32 fixed point
+    return uint(int(round(seconds * (1 << 32))))
+
+
+def streamHeader(streamTypes, compression=False):
+    content = node(ov.OVP_NodeId_OpenViBEStream_Header_Compression, uint(int(compression), 1))
+    for streamType in streamTypes:
+        content += node(ov.OVP_NodeId_OpenViBEStream_Header_StreamType, uint(streamType))
+    return node(ov.OVP_NodeId_OpenViBEStream_Header, content)
+
+
+def streamBuffer(streamIndex, startTime, endTime, content):
+    return node(ov.OVP_NodeId_OpenViBEStream_Buffer,
+                node(ov.OVP_NodeId_OpenViBEStream_Buffer_StreamIndex, uint(streamIndex, 4))
+                + node(ov.OVP_NodeId_OpenViBEStream_Buffer_StartTime, time(startTime))
+                + node(ov.OVP_NodeId_OpenViBEStream_Buffer_EndTime, time(endTime))
+                + node(ov.OVP_NodeId_OpenViBEStream_Buffer_Content, content))
+
+
+def signalHeader(sampFreq, electrodeList, samplesPerChunk):
+    channels = node(ov.OVTK_NodeId_Header_StreamedMatrix_Dimension_Size, uint(len(electrodeList), 4))
+    for electrode in electrodeList:
+        channels += node(ov.OVTK_NodeId_Header_StreamedMatrix_Dimension_Label, electrode.encode() + b"\x00")
+    samples = node(ov.OVTK_NodeId_Header_StreamedMatrix_Dimension_Size, uint(samplesPerChunk, 4))
+    matrix = (node(ov.OVTK_NodeId_Header_StreamedMatrix_DimensionCount, uint(2, 4))
+              + node(ov.OVTK_NodeId_Header_StreamedMatrix_Dimension, channels)
+              + node(ov.OVTK_NodeId_Header_StreamedMatrix_Dimension, samples))
+    sampling = node(ov.OVTK_NodeId_Header_Signal_Sampling, uint(sampFreq))
+    return node(ov.OVTK_NodeId_Header, node(ov.OVTK_NodeId_Header_StreamedMatrix, matrix)
+                + node(ov.OVTK_NodeId_Header_Signal, sampling))
+
+
+def signalBuffer(matrix):
+    raw = node(ov.OVTK_NodeId_Buffer_StreamedMatrix_RawBuffer, matrix.astype("<f8").tobytes())
+    return node(ov.OVTK_NodeId_Buffer, node(ov.OVTK_NodeId_Buffer_StreamedMatrix, raw))
+
+
+def stimulationBuffer(stims):
+    content = node(ov.OVTK_NodeId_Buffer_Stimulation_NumberOfStimulations, uint(len(stims)))
+    for date, code, duration in stims:
+        content += node(ov.OVTK_NodeId_Buffer_Stimulation_Stimulation,
+                        node(ov.OVTK_NodeId_Buffer_Stimulation_Stimulation_Identifier, uint(code))
+                        + node(ov.OVTK_NodeId_Buffer_Stimulation_Stimulation_Date, time(date))
+                        + node(ov.OVTK_NodeId_Buffer_Stimulation_Stimulation_Duration, time(duration)))
+    return node(ov.OVTK_NodeId_Buffer, node(ov.OVTK_NodeId_Buffer_Stimulation, content))
+
+
+sampFreq = 128
+electrodeList = ["C3", "Cz", "C4"]
+samplesPerChunk = 32
+startTime = 1.0
+stims = [(1.5, 32769, 0.0), (2.0, 769, 0.0), (2.25, 800, 0.0)]
+
+
+def writeOvFile(path, nbChunks=8, compression=False):
+    # Signal (stream 0) starting at startTime, stimulations (stream 1)
+    signal = np.random.default_rng(0).standard_normal([len(electrodeList), nbChunks * samplesPerChunk])
+    chunkLength = samplesPerChunk / sampFreq
+    data = streamHeader([ov.OV_TypeId_Signal, ov.OV_TypeId_Stimulations], compression)
+    data += streamBuffer(0, 0, 0, signalHeader(sampFreq, electrodeList, samplesPerChunk))
+    data += streamBuffer(1, 0, 0, node(ov.OVTK_NodeId_Header, b""))
+    for idx in range(nbChunks):
+        chunkStart = startTime + idx * chunkLength
+        matrix = signal[:, idx * samplesPerChunk:(idx + 1) * samplesPerChunk]
+        data += streamBuffer(0, chunkStart, chunkStart + chunkLength, signalBuffer(matrix))
+        chunkStims = [stim for stim in stims if chunkStart <= stim[0] < chunkStart + chunkLength]
+        data += streamBuffer(1, chunkStart, chunkStart + chunkLength, stimulationBuffer(chunkStims))
+    data += streamBuffer(0, 0, 0, node(ov.OVTK_NodeId_End, b""))
+    with open(path, "wb") as f:
+        f.write(data)
+    return signal, data
+
+
+def test_var_int():
+    # EBML examples: 1-byte and 2-byte codings of 1, EBML header identifier
+    assert readVarInt(b"\x81", 0) == (1, 1)
+    assert readVarInt(b"\x40\x01", 0) == (1, 2)
+    assert readVarInt(b"\x1a\x45\xdf\xa3", 0) == (0x0a45dfa3, 4)
+    # Too short
+    assert readVarInt(b"\x40", 0) == (None, 0)
+    for value in [0, 126, 127, 1 << 20, ov.OVTK_NodeId_Buffer_Stimulation_Stimulation_Duration,
+                  ov.OVP_NodeId_OpenViBEStream_Header, (1 << 64) - 1]:
+        coded = b"\xff" + varInt(value)
+        assert readVarInt(coded, 1) == (value, len(coded))
+
+
+def test_nodes():
+    data = node(5, b"abc") + node(ov.OVP_NodeId_OpenViBEStream_Buffer, b"") + node(7, b"defg")
+    nodes = [(nodeId, data[start:stop]) for nodeId, start, stop in iterNodes(data)]
+    assert nodes == [(5, b"abc"), (ov.OVP_NodeId_OpenViBEStream_Buffer, b""), (7, b"defg")]
+    # Incomplete last node (file being written): ignored
+    assert [nodeId for nodeId, start, stop in iterNodes(data[:-1])] == [5, ov.OVP_NodeId_OpenViBEStream_Buffer]
+
+
+def test_metadata_from_header(tmp_path):
+    writeOvFile(tmp_path / "s.ov")
+    assert readOvMetadata(str(tmp_path / "s.ov")) == (sampFreq, electrodeList)
+    # Header found after reading more of the file
+    assert readOvMetadata(str(tmp_path / "s.ov"), chunkSize=16) == (sampFreq, electrodeList)
+
+
+def test_metadata_unknown_streams(tmp_path):
+    writeOvFile(tmp_path / "compressed.ov", compression=True)
+    assert readOvMetadata(str(tmp_path / "compressed.ov")) == (None, None)
+    with open(tmp_path / "stims.ov", "wb") as f:
+        f.write(streamHeader([ov.OV_TypeId_Stimulations]))
+    assert readOvMetadata(str(tmp_path / "stims.ov")) == (None, None)
+
+
+def test_decode_round_trip(tmp_path):
+    signal, data = writeOvFile(tmp_path / "s.ov")
+    assert decodeOvFile(str(tmp_path / "s.ov"), str(tmp_path / "decoded")) is not None
+    decoded, decodedStims, fs, channels = loadDecodedSignal(str(tmp_path / "s.ov"), str(tmp_path / "decoded"))
+    assert (fs, channels) == (sampFreq, electrodeList)
+    np.testing.assert_array_equal(decoded, signal.astype(np.float32))
+    # Dates relative to the first sample
+    np.testing.assert_allclose(decodedStims["date"], [date - startTime for date, code, duration in stims])
+    assert list(decodedStims["code"]) == [code for date, code, duration in stims]
+
+    # 0.5 s after the class cue (1 s after the first sample)
+    windows = stimulationWindows(decoded, fs, decodedStims, 769, 0, 0.5)
+    assert len(windows) == 1
+    np.testing.assert_array_equal(windows[0], decoded[:, sampFreq:sampFreq + sampFreq // 2])
+
+
+def test_decode_truncated_file(tmp_path):
+    # Recording in progress: only the complete chunks are decoded
+    signal, data = writeOvFile(tmp_path / "s.ov")
+    with open(tmp_path / "partial.ov", "wb") as f:
+        f.write(data[:len(data) // 2])
+    decodeOvFile(str(tmp_path / "partial.ov"), str(tmp_path / "decoded"))
+    decoded, decodedStims, fs, channels = loadDecodedSignal(str(tmp_path / "partial.ov"), str(tmp_path / "decoded"))
+    assert 0 < decoded.shape[1] < signal.shape[1]
+    assert decoded.shape[1] % samplesPerChunk == 0
+    np.testing.assert_array_equal(decoded, signal[:, :decoded.shape[1]].astype(np.float32))
+
+
+def test_decode_without_signal(tmp_path):
+    with open(tmp_path / "stims.ov", "wb") as f:
+        f.write(streamHeader([ov.OV_TypeId_Stimulations]) + streamBuffer(0, 0, 0, stimulationBuffer(stims)))
+    assert decodeOvFile(str(tmp_path / "stims.ov"), str(tmp_path / "decoded")) is None
+    assert loadDecodedSignal(str(tmp_path / "stims.ov"), str(tmp_path / "decoded")) is None
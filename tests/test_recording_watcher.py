@@ -0,0 +1,34 @@
+import os
+
+from recordingWatcher import completedRecordings, recordingStates, recordAttempts
+
+
+def test_open_and_handled_files_skipped(tmp_path):
+    for name in ["old.ov", "new.ov", "recording.ov"]:
+        (tmp_path / name).write_bytes(b"signal")
+    handled = recordingStates(str(tmp_path))
+    handled.pop("new.ov")
+    handled.pop("recording.ov")
+
+    states = {}
+    with open(tmp_path / "recording.ov", "ab"):
+        assert completedRecordings(str(tmp_path), states, 0, handled) == []
+        assert completedRecordings(str(tmp_path), states, 0, handled) == ["new.ov"]
+    assert completedRecordings(str(tmp_path), states, 0, handled) == ["new.ov", "recording.ov"]
+
+    # Recorded again: not handled anymore
+    with open(tmp_path / "old.ov", "ab") as f:
+        f.write(b"more")
+    os.utime(tmp_path / "old.ov", (0, 0))
+    completedRecordings(str(tmp_path), states, 0, handled)
+    assert "old.ov" in completedRecordings(str(tmp_path), states, 0, handled)
+
+
+def test_failed_files_tried_again():
+    handled = {}
+    failures = {}
+    pending = {"a.ov": [6, 1.0], "b.ov": [6, 1.0]}
+    assert recordAttempts(pending, ["a.ov"], handled, failures, 2) == []
+    assert handled == {"a.ov": [6, 1.0]}
+    assert recordAttempts({"b.ov": [6, 1.0]}, [], handled, failures, 2) == ["b.ov"]
+    assert handled["b.ov"] == [6, 1.0]
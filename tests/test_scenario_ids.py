@@ -0,0 +1,9 @@
+import re
+
+from modifyOpenvibeScen import generateRandomIdentifier
+
+
+def test_identifiers_have_full_length():
+    # Hex digit "b" used to be removed with the "b''" of the bytes repr
+    for _ in range(1000):
+        assert re.fullmatch(r"\(0x[0-9a-f]{8}, 0x[0-9a-f]{8}\)", generateRandomIdentifier())
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from Spectral_Analysis import Smooth_spectrum
+
+
+def smoothLoop(psd, fres, f_max, nbFreqs):
+    # Smoothing loop of the PSD functions before Smooth_spectrum
+    b = psd.shape
+    PSD_final = np.zeros([b[0], b[1], round(f_max / 2)])
+    for k in range(b[0]):
+        for l in range(b[1]):
+            PSD_final[k, l, 0] = (psd[k, l, 0] + psd[k, l, 1] + psd[k, l, 2]) / 3
+            PSD_final[k, l, round(f_max / 2) - 1] = (psd[k, l, nbFreqs - 3] + psd[k, l, nbFreqs - 2]
+                                                     + psd[k, l, nbFreqs - 1]) / 3
+            for i in range(5, nbFreqs - 2, round(1 / fres)):
+                PSD_final[k, l, round(i / 5)] = (psd[k, l, i - 2] + psd[k, l, i - 1] + psd[k, l, i]
+                                                 + psd[k, l, i + 1] + psd[k, l, i + 2]) / 5
+    return PSD_final
+
+
+@pytest.mark.parametrize("nbFreqs", [1250, 1251])
+def test_same_as_loop_with_step_5(nbFreqs):
+    psd = np.random.default_rng(0).random([3, 4, nbFreqs]) + 1
+    np.testing.assert_allclose(Smooth_spectrum(psd, 5, 250), smoothLoop(psd, 0.2, 500, nbFreqs))
+
+
+@pytest.mark.parametrize("step, nbFreqs", [(1, 250), (1, 251), (2, 500), (4, 1000)])
+def test_no_empty_bins(step, nbFreqs):
+    psd = np.random.default_rng(0).random([3, 4, nbFreqs]) + 1
+    smoothed = Smooth_spectrum(psd, step, 250)
+    assert np.all(smoothed > 0)
+    # Bin 1 with step 1: bins 0 to 3 around it
+    if step == 1:
+        np.testing.assert_allclose(smoothed[..., 1], psd[..., 0:4].mean(axis=-1))
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+import pipelineSteps
+from pipelineSteps import trainClassifier
+from nativeExtraction import writeSignalCsv
+import bcipipeline_settings as settings
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sampFreq = 100
+electrodeList = ["C3", "C4"]
+
+
+def trainingFolder(tmp_path, sessions):
+    signalFolder = tmp_path / "generated" / "signals"
+    os.makedirs(signalFolder / "training")
+    rng = np.random.default_rng(0)
+    classes = [769, 770] * 3
+    startSamples = np.arange(len(classes)) * 4 * sampFreq
+    epochStims = [(start / sampFreq, code) for start, code in zip(startSamples, classes)]
+    for session in sessions:
+        epochs = rng.standard_normal([len(classes), len(electrodeList), 3 * sampFreq])
+        writeSignalCsv(str(signalFolder / "training" / str(session + "-TRIALS.csv")), epochs, startSamples,
+                       sampFreq, electrodeList, epochStims, epochStims)
+    parameterDict = dict(settings.pipelineAcqSettings["PowSpectrumGraz"])
+    parameterDict.update(settings.pipelineExtractSettings["PowSpectrumGraz"])
+    parameterDict.update({"pipelineType": "PowSpectrumGraz", "ovDesignerPath": "designer",
+                          "sensorMontage": "", "customMontagePath": "", "ChannelNames": "C3;C4"})
+    # (as in params.json)
+    return str(signalFolder), {key: str(value) for key, value in parameterDict.items()}
+
+
+def test_best_of_trained_combinations(tmp_path, monkeypatch):
+    signalFolder, parameterDict = trainingFolder(tmp_path, ["s1", "s2"])
+    # Combinations: [0], [1], [0,1]. The best one ([1]) fails
+    scores = {"0": 70.0, "1": 90.0, "2": 80.0}
+
+    def runJob(ovScript, combScenFile, stopRequested=None):
+        idxcomb = combScenFile.removesuffix(".xml").split("-")[-1]
+        if idxcomb == "1":
+            return None, None
+        with open(os.path.join(signalFolder, "training", str("classifier-weights-" + idxcomb + ".xml")), "w") as f:
+            f.write(idxcomb)
+        return str("Overall accuracy : " + str(scores[idxcomb]) + "%"), scores[idxcomb]
+    monkeypatch.setattr(pipelineSteps, "runTrainingJob", runJob)
+
+    success, text = trainClassifier(True, ["s1-TRIALS.csv", "s2-TRIALS.csv"], signalFolder,
+                                    os.path.join(repoFolder, "templates-spectralpower"), str(tmp_path), "designer",
+                                    5, ["C3;12"], parameterDict)
+    assert success
+    assert "[1]: training failed" in text
+    assert "Max is combination [0,1] with 80.0%" in text
+    with open(tmp_path / "generated" / "classifier-weights.xml") as f:
+        assert f.read() == "2"
+    # Only the weights of the combinations are left
+    trainingFiles = sorted(os.listdir(os.path.join(signalFolder, "training")))
+    assert trainingFiles == ["classifier-weights-0.xml", "classifier-weights-2.xml", "s1-TRIALS.csv", "s2-TRIALS.csv"]
+    assert sorted(name for name in os.listdir(tmp_path / "generated") if name.endswith(".xml")) == \
+        ["classifier-weights.xml", "sc2-train-composite.xml", "sc3-online.xml"]
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from Spectral_Analysis import Sliding_windows, Welch_psd
+
+
+def randomEpochs(nbTrials=3, nbChannels=4, nbSamples=750):
+    return np.random.default_rng(0).standard_normal([nbTrials, nbChannels, nbSamples])
+
+
+@pytest.mark.parametrize("nPerSeg, shift", [(125, 80), (250, 250), (100, 1)])
+def test_sliding_windows_same_as_slices(nPerSeg, shift):
+    data = randomEpochs()
+    windows = Sliding_windows(data, nPerSeg, shift)
+    nbWindows = (data.shape[-1] - nPerSeg) // shift + 1
+    assert windows.shape == data.shape[:-1] + (nbWindows, nPerSeg)
+    for w in range(nbWindows):
+        np.testing.assert_array_equal(windows[..., w, :], data[..., w * shift:w * shift + nPerSeg])
+    assert Sliding_windows(data, nPerSeg, shift, 2).shape[-2] == 2
+
+
+@pytest.mark.parametrize("window, nPerSeg, noverlap, nfft", [("hann", 250, 125, 256), ("hamming", 200, 50, 201),
+                                                              ("boxcar", 500, None, None)])
+def test_welch_psd_same_as_scipy(window, nPerSeg, noverlap, nfft):
+    data = randomEpochs()
+    freqs, psd = Welch_psd(data, 500, window, nPerSeg, noverlap, nfft, 'mean')
+    freqsRef, psdRef = signal.welch(data, fs=500, window=window, nperseg=nPerSeg, noverlap=noverlap, nfft=nfft,
+                                    detrend='constant', scaling='density', axis=-1, average='mean')
+    np.testing.assert_allclose(freqs, freqsRef)
+    # (atol: the DC bin is ~0 after the detrend)
+    np.testing.assert_allclose(psd, psdRef, rtol=1e-10, atol=1e-12 * psdRef.max())
@@ -0,0 +1,40 @@
+import numpy as np
+from statsmodels.regression.linear_model import yule_walker
+
+from Spectral_Analysis import Levinson_batch, Yule_walker_windows_models
+from extractionCache import effectiveParameters
+import bcipipeline_settings as settings
+
+
+def test_windows_models_same_as_statsmodels():
+    data = np.random.default_rng(0).standard_normal([2, 3, 500])
+    nPerSeg, shift, order = 125, 80, 10
+    AR, sigma2 = Yule_walker_windows_models(data, nPerSeg, shift, order)
+    nbWindows = (data.shape[-1] - nPerSeg) // shift + 1
+    assert AR.shape == (2, 3, nbWindows, order)
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            for w in range(nbWindows):
+                window = data[i, j, w * shift:w * shift + nPerSeg]
+                rho, sigma = yule_walker(window, order=order, method="mle", demean=True, result_object=False)
+                np.testing.assert_allclose(AR[i, j, w], rho, atol=1e-10)
+                np.testing.assert_allclose(sigma2[i, j, w], sigma ** 2, rtol=1e-8)
+
+
+def test_levinson_same_as_solve():
+    # Levinson-Durbin against the Toeplitz system solved directly
+    x = np.random.default_rng(1).standard_normal(300)
+    r = np.array([np.dot(x[:300 - k], x[k:]) / 300 for k in range(7)])
+    AR, err = Levinson_batch(r[None], 6)
+    toeplitz = r[np.abs(np.arange(6)[:, None] - np.arange(6)[None, :])]
+    np.testing.assert_allclose(AR[0], np.linalg.solve(toeplitz, r[1:]), atol=1e-12)
+    np.testing.assert_allclose(err[0], r[0] - np.dot(AR[0], r[1:]), rtol=1e-10)
+
+
+def test_ar_method_in_native_manifest_parameters(monkeypatch):
+    parameterDict = {"pipelineType": settings.optionKeys[1], "FreqRes": "1"}
+    monkeypatch.setattr(settings, "nativeArMethod", "burg")
+    burgParams = effectiveParameters(parameterDict, "native")
+    monkeypatch.setattr(settings, "nativeArMethod", "yule-walker")
+    assert effectiveParameters(parameterDict, "native") != burgParams
+    assert effectiveParameters(parameterDict, "openvibe") != effectiveParameters(parameterDict, "native")